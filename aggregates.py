@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""
+Artımlı olarak güncellenen skor özetleri.
+
+score_aggregate tablosu her boyut (genel, vaka, unvan, deneyim aralığı) ve
+anahtar için puanlanmış yanıt sayısını, her skorun toplamını ve kareler
+toplamını, ayrıca yanıt süresi istatistiklerini tutar. Ortalama ve varyans bu
+değerlerden O(1) hesaplanır; yönetici panelindeki özetler user_response
+tablosunu taramaz.
+
+Bir yanıt puanlandığında (veya yeniden puanlandığında) eski katkısı çıkarılır,
+yenisi eklenir; güncelleme yanıtın kaydedildiği işlem (transaction) içinde ve
+'col = col + :artış' biçiminde yapıldığı için eşzamanlı worker'lar güvenlidir.
+rebuild_aggregates tabloyu user_response'tan sıfırdan yeniden hesaplar.
+"""
+
+import datetime
+import math
+from collections import defaultdict
+
+from sqlalchemy import case, delete, func, select, update
+from sqlalchemy.exc import IntegrityError
+
+from app import db, User, UserResponse, ScoreAggregate
+
+# Skor sütunu -> özet tablosundaki sütun öneki
+SCORE_METRICS = {
+    'diagnosis_score': 'diagnosis',
+    'investigation_score': 'investigation',
+    'treatment_score': 'treatment',
+    'dosage_score': 'dosage',
+    'final_score': 'final',
+}
+
+DIMENSIONS = ('all', 'case', 'profession', 'experience')
+
+# Deneyim aralıkları (yıl): (alt sınır, üst sınır dahil, etiket)
+EXPERIENCE_BANDS = (
+    (0, 2, '0-2'),
+    (3, 5, '3-5'),
+    (6, 10, '6-10'),
+    (11, 20, '11-20'),
+    (21, None, '21+'),
+)
+
+
+def experience_band(years):
+    """Deneyim yılını rapor aralığına çevirir."""
+    if years is None:
+        return 'bilinmiyor'
+    for low, high, label in EXPERIENCE_BANDS:
+        if years >= low and (high is None or years <= high):
+            return label
+    return 'bilinmiyor'
+
+
+def aggregate_keys(case_id, profession, experience):
+    """Bir yanıtın katkıda bulunduğu (boyut, anahtar) çiftleri."""
+    return [
+        ('all', 'all'),
+        ('case', str(case_id)),
+        ('profession', profession or 'bilinmiyor'),
+        ('experience', experience_band(experience)),
+    ]
+
+
+def contribution(scores, duration, sign=1):
+    """Bir yanıtın özet sütunlarına katkısı (sign=-1 ile çıkarılır)."""
+    delta = {'n': sign}
+    for column, prefix in SCORE_METRICS.items():
+        value = scores.get(column) or 0.0
+        delta[f'{prefix}_sum'] = sign * value
+        delta[f'{prefix}_sumsq'] = sign * value * value
+    if duration is not None:
+        delta['duration_n'] = sign
+        delta['duration_sum'] = sign * duration
+        delta['duration_sumsq'] = sign * duration * duration
+    return delta
+
+
+def add_response_delta(deltas, case_id, profession, experience, old_scores, new_scores, duration):
+    """
+    Bir yanıtın eski katkısını çıkarıp yenisini 'deltas' biriktiricisine ekler.
+    old_scores None ise yanıt daha önce özetlere dahil edilmemiştir.
+    """
+    changes = [contribution(new_scores, duration)]
+    if old_scores is not None:
+        changes.append(contribution(old_scores, duration, sign=-1))
+    for key in aggregate_keys(case_id, profession, experience):
+        for change in changes:
+            for column, value in change.items():
+                deltas[key][column] += value
+
+
+def new_deltas():
+    return defaultdict(lambda: defaultdict(float))
+
+
+def apply_deltas(session, deltas):
+    """
+    Biriktirilen artışları özet tablosuna uygular. Satır yoksa oluşturulur;
+    eşzamanlı oluşturma çakışmasında güncellemeye geri dönülür. Commit çağıran tarafa aittir.
+    """
+    now = datetime.datetime.now(datetime.timezone.utc)
+    for (dimension, key), delta in deltas.items():
+        values = {column: getattr(ScoreAggregate, column) + inc for column, inc in delta.items() if inc}
+        if not values:
+            continue
+        values['updated_at'] = now
+        stmt = update(ScoreAggregate).where(
+            ScoreAggregate.dimension == dimension, ScoreAggregate.key == key
+        ).values(**values)
+        if session.execute(stmt).rowcount:
+            continue
+        try:
+            with session.begin_nested():
+                session.add(ScoreAggregate(dimension=dimension, key=key, updated_at=now,
+                                           **{column: inc for column, inc in delta.items()}))
+        except IntegrityError:
+            session.execute(stmt)
+
+
+def record_response_scores(session, response, old_scores):
+    """Tek bir yanıtın yeni skorlarını özetlere işler (score_and_store_response tarafından)."""
+    deltas = new_deltas()
+    new_scores = {column: getattr(response, column) for column in SCORE_METRICS}
+    add_response_delta(deltas, response.case_id, response.author.profession, response.author.experience,
+                       old_scores, new_scores, response.duration_seconds)
+    apply_deltas(session, deltas)
+
+
+def summarize(row):
+    """Özet satırından ortalama, standart sapma ve süre istatistiklerini hesaplar."""
+    n = row.n or 0
+    result = {'dimension': row.dimension, 'key': row.key, 'n': n}
+    for prefix in list(SCORE_METRICS.values()) + ['duration']:
+        count = n if prefix != 'duration' else (row.duration_n or 0)
+        total = getattr(row, f'{prefix}_sum') or 0.0
+        total_sq = getattr(row, f'{prefix}_sumsq') or 0.0
+        mean = total / count if count else None
+        variance = None
+        if count > 1:
+            variance = max(0.0, (total_sq - count * mean * mean) / (count - 1))
+        result[prefix] = {
+            'mean': mean,
+            'variance': variance,
+            'std': math.sqrt(variance) if variance is not None else None,
+        }
+    return result
+
+
+def get_aggregates(dimension):
+    """Bir boyuttaki tüm özetleri döndürür (user_response taranmaz)."""
+    rows = ScoreAggregate.query.filter_by(dimension=dimension).order_by(ScoreAggregate.key).all()
+    return [summarize(row) for row in rows]
+
+
+def rebuild_aggregates():
+    """Özet tablosunu puanlanmış tüm yanıtlardan (judge_version dolu olanlar) sıfırdan hesaplar."""
+    band_expr = case(
+        *[((User.experience >= low) & (User.experience <= high), label) if high is not None
+          else (User.experience >= low, label) for low, high, label in EXPERIENCE_BANDS],
+        else_='bilinmiyor'
+    )
+    key_exprs = {
+        'all': None,
+        'case': UserResponse.case_id,
+        'profession': func.coalesce(User.profession, 'bilinmiyor'),
+        'experience': band_expr,
+    }
+    metric_exprs = [func.count(UserResponse.id).label('n')]
+    for column, prefix in SCORE_METRICS.items():
+        value = func.coalesce(getattr(UserResponse, column), 0.0)
+        metric_exprs.append(func.sum(value).label(f'{prefix}_sum'))
+        metric_exprs.append(func.sum(value * value).label(f'{prefix}_sumsq'))
+    duration = UserResponse.duration_seconds
+    metric_exprs += [
+        func.count(duration).label('duration_n'),
+        func.sum(duration).label('duration_sum'),
+        func.sum(duration * duration).label('duration_sumsq'),
+    ]
+
+    now = datetime.datetime.now(datetime.timezone.utc)
+    db.session.execute(delete(ScoreAggregate))
+    for dimension, key_expr in key_exprs.items():
+        columns = ([key_expr.label('key')] if key_expr is not None else []) + metric_exprs
+        query = (
+            select(*columns)
+            .join(User, User.id == UserResponse.user_id)
+            .where(UserResponse.judge_version.isnot(None))
+        )
+        if key_expr is not None:
+            query = query.group_by(key_expr)
+        for row in db.session.execute(query).mappings():
+            if not row['n']:
+                continue
+            values = {k: v or 0 for k, v in row.items() if k != 'key'}
+            key = str(row['key']) if key_expr is not None else 'all'
+            db.session.add(ScoreAggregate(dimension=dimension, key=key, updated_at=now, **values))
+    db.session.commit()
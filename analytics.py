@@ -0,0 +1,397 @@
+# -*- coding: utf-8 -*-
+"""
+Katılımcılar ile LLM referans yanıtlarının karşılaştırmalı analizi.
+
+Üç aşamadan oluşur:
+
+1. LLM yanıtlarının puanlanması (score_llm_references): her vakanın LLM
+   referans yanıtları (ReferenceAnswer; altın standart hariç) katılımcı
+   yanıtlarıyla AYNI puanlama hattından (ön puanlayıcı, hakem, koşullu
+   puanlama; bkz. tasks.score_answers) geçirilir. Sonuçlar vaka/kaynak/hakem
+   sürümü başına bir kez hesaplanıp llm_reference_score tablosunda saklanır;
+   altın standart veya referans yanıt değişmedikçe yeniden puanlanmaz.
+2. Skor matrisi (build_score_matrix): puanlanmış yanıtlar tek sorguda okunur
+   ve vaka x puanlayıcı (katılımcılar ve LLM kaynakları) x kategori boyutlu
+   bir NumPy dizisine yerleştirilir. Aynı vakayı birden fazla kez yanıtlayan
+   katılımcının skorlarının ortalaması alınır; eksik hücreler NaN'dır.
+3. İstatistikler (build_report), döngü yerine dizi işlemleriyle hesaplanır:
+   - LLM'lerin her vakada katılımcılar arasındaki yüzdelik sırası,
+   - tüm katılımcılar ve unvan/deneyim grupları ile her LLM arasındaki
+     eşleştirilmiş (aynı vakalar üzerinden) skor farkları ve vakalar üzerinden
+     bootstrap güven aralıkları,
+   - uyum istatistikleri: katılımcı ortalaması ile LLM'ler arasında Spearman
+     korelasyonu ve ortalama mutlak fark, LLM'ler ve katılımcı ortalaması
+     için ICC(2,1).
+
+Bootstrap'te örnekleme birimi vakadır: aynı vakadaki yanıtlar bağımsız
+değildir ve karşılaştırma vaka bazında eşleştirilmiştir.
+
+'numpy' ve 'pandas' paketleri gerekir.
+
+Kullanım (CLI):
+    python analytics.py --score-references [--force]   # LLM yanıtlarını puanla
+    python analytics.py                                # raporu özet olarak yazdır
+"""
+
+import argparse
+import hashlib
+import json
+import time
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import func, select
+
+from app import (app, db, get_queue, LlmReferenceScore, ReferenceAnswer, User, UserResponse,
+                 SCORING_CATEGORIES, JUDGE_VERSION)
+from aggregates import experience_band
+from rate_limiter import JudgeUnavailable
+from tasks import score_answers
+
+# Skor sütunu -> rapordaki kategori adı (matrisin üçüncü boyutu bu sıradadır)
+CATEGORIES = {
+    'diagnosis_score': 'Tanı',
+    'investigation_score': 'Tetkik',
+    'treatment_score': 'Tedavi',
+    'dosage_score': 'Doz',
+    'final_score': 'Final',
+}
+FINAL = list(CATEGORIES).index('final_score')
+
+GROUP_DIMENSIONS = {'profession': 'Unvana Göre', 'experience': 'Deneyime Göre (yıl)'}
+
+BOOTSTRAP_SAMPLES = 2000
+CONFIDENCE = 0.95
+BOOTSTRAP_SEED = 20240601
+LLM_SCORING_JOB_TIMEOUT = 3600
+
+ScoreMatrix = namedtuple('ScoreMatrix', ['cases', 'raters', 'categories', 'values', 'human_count'])
+
+
+# --- 1. LLM referans yanıtlarının puanlanması ---
+
+def reference_answers(reference):
+    """Referans yanıtı, katılımcı yanıtlarıyla aynı kategori anahtarlarına çevirir (bkz. tasks.build_user_answers)."""
+    return {key: reference.get(gold_key) for key, (_, gold_key) in SCORING_CATEGORIES.items()}
+
+
+def content_hash(gold, reference):
+    payload = json.dumps([gold, reference], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def score_llm_references(case_ids=None, force=False):
+    """
+    LLM referans yanıtlarını puanlar ve saklar. Güncel hakem sürümüyle ve aynı
+    içerikle daha önce puanlanmış olanlar atlanır ('force' ile hepsi yeniden
+    puanlanır). Hakem ulaşılamazsa o ana kadar puanlananlar kaydedilmiş olarak
+    kalır ve JudgeUnavailable yukarı iletilir. {'scored', 'cached', 'skipped'} sayılarını döndürür.
+    """
+    references = ReferenceAnswer.load_many(db.session, case_ids)
+    cached = {
+        (row.case_id, row.source): row
+        for row in db.session.scalars(select(LlmReferenceScore).where(LlmReferenceScore.judge_version == JUDGE_VERSION))
+    }
+    counts = {'scored': 0, 'cached': 0, 'skipped': 0}
+    for case_id, sources in sorted(references.items()):
+        gold = sources.get('gold')
+        for source, reference in sorted(sources.items()):
+            if source == 'gold':
+                continue
+            if not gold:
+                counts['skipped'] += 1
+                continue
+            digest = content_hash(gold, reference)
+            row = cached.get((case_id, source))
+            if row is not None and row.content_hash == digest and not force:
+                counts['cached'] += 1
+                continue
+            values = score_answers(reference_answers(reference), gold)
+            if row is None:
+                row = LlmReferenceScore(case_id=case_id, source=source, judge_version=JUDGE_VERSION)
+                db.session.add(row)
+            row.content_hash = digest
+            row.score_reasons = values['score_reasons']
+            for column in CATEGORIES:
+                setattr(row, column, values[column])
+            db.session.commit()
+            counts['scored'] += 1
+    return counts
+
+
+def run_llm_scoring(force=False):
+    """RQ işi: LLM referans yanıtlarını puanlar."""
+    with app.app_context():
+        try:
+            counts = score_llm_references(force=force)
+            app.logger.info("LLM referans yanıtları puanlandı: %s", counts)
+        except JudgeUnavailable as e:
+            db.session.rollback()
+            app.logger.error("Hakem LLM'e ulaşılamadı, LLM referans puanlaması yarıda kaldı: %s", e)
+
+
+def enqueue_llm_scoring(force=False):
+    """
+    Puanlamayı 'backfill' şeridine ekler; kuyruğa eklendiyse True. Redis yoksa
+    hiçbir şey yapılmaz ve False döner: puanlama web isteği içinde çalıştırılmaz,
+    komut satırından (python analytics.py --score-references) yapılmalıdır.
+    """
+    queue = get_queue('backfill')
+    if queue is None:
+        return False
+    queue.enqueue(run_llm_scoring, force=force, job_timeout=LLM_SCORING_JOB_TIMEOUT)
+    return True
+
+
+# --- 2. Skor matrisi ---
+
+def load_response_frame():
+    """
+    Güncel hakem sürümüyle puanlanmış yanıtlar: yanıt başına bir satır (kullanıcı,
+    vaka, unvan, deneyim aralığı, skorlar). LLM skorlarıyla aynı hakemin
+    kararları karşılaştırılsın diye eski sürümle puanlanmış yanıtlar alınmaz.
+    """
+    rows = db.session.execute(
+        select(UserResponse.user_id, UserResponse.case_id, User.profession, User.experience,
+               *[getattr(UserResponse, column) for column in CATEGORIES])
+        .join(User, User.id == UserResponse.user_id)
+        .where(UserResponse.judge_version == JUDGE_VERSION)
+    ).all()
+    frame = pd.DataFrame.from_records(
+        rows, columns=['user_id', 'case_id', 'profession', 'experience', *CATEGORIES]
+    )
+    frame['profession'] = frame['profession'].fillna('bilinmiyor')
+    # Deneyim yılı az sayıda farklı değer alır; aralık her değer için bir kez hesaplanır
+    frame['experience'] = frame['experience'].map(
+        {years: experience_band(years) for years in frame['experience'].dropna().unique()}
+    ).fillna('bilinmiyor')
+    frame[list(CATEGORIES)] = frame[list(CATEGORIES)].astype(float).fillna(0.0)
+    return frame
+
+
+def load_llm_frame():
+    """Güncel hakem sürümüyle puanlanmış LLM referans yanıtları: (vaka, kaynak) başına bir satır."""
+    rows = db.session.execute(
+        select(LlmReferenceScore.case_id, LlmReferenceScore.source,
+               *[getattr(LlmReferenceScore, column) for column in CATEGORIES])
+        .where(LlmReferenceScore.judge_version == JUDGE_VERSION)
+    ).all()
+    return pd.DataFrame.from_records(rows, columns=['case_id', 'source', *CATEGORIES])
+
+
+def build_score_matrix(responses, llm_scores):
+    """
+    Vaka x puanlayıcı x kategori skor dizisini kurar. İlk 'human_count'
+    puanlayıcı katılımcılardır (user_id), kalanlar LLM kaynaklarıdır.
+    """
+    human = responses.groupby(['case_id', 'user_id'], sort=False)[list(CATEGORIES)].mean().reset_index()
+    cases = np.union1d(human['case_id'].unique(), llm_scores['case_id'].unique()).astype(int)
+    users = np.sort(human['user_id'].unique())
+    sources = sorted(llm_scores['source'].unique())
+
+    values = np.full((len(cases), len(users) + len(sources), len(CATEGORIES)), np.nan)
+    values[np.searchsorted(cases, human['case_id']), np.searchsorted(users, human['user_id'])] = \
+        human[list(CATEGORIES)].to_numpy()
+    if len(llm_scores):
+        source_index = pd.Index(sources).get_indexer(llm_scores['source'])
+        values[np.searchsorted(cases, llm_scores['case_id']), len(users) + source_index] = \
+            llm_scores[list(CATEGORIES)].to_numpy(dtype=float)
+    return ScoreMatrix(cases, [int(u) for u in users] + sources, list(CATEGORIES), values, len(users))
+
+
+# --- 3. İstatistikler ---
+
+def percentile_ranks(matrix):
+    """
+    Her LLM'nin her vaka ve kategoride katılımcılar arasındaki yüzdelik sırası
+    (0-100; eşitlikler yarım sayılır). Dizi boyutu: vaka x LLM x kategori;
+    katılımcı yanıtı olmayan vakalarda NaN.
+    """
+    humans = matrix.values[:, :matrix.human_count, :]
+    llms = matrix.values[:, matrix.human_count:, :]
+    answered = ~np.isnan(humans)
+    n = answered.sum(axis=1)                                   # vaka x kategori
+    ranks = np.full(llms.shape, np.nan)
+    for source in range(llms.shape[1]):
+        llm = llms[:, source:source + 1, :]                   # vaka x 1 x kategori
+        below = np.sum(humans < llm, axis=1)                  # NaN karşılaştırmaları False
+        ties = np.sum(humans == llm, axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            ranks[:, source, :] = np.where(n > 0, 100.0 * (below + 0.5 * ties) / n, np.nan)
+    ranks[np.isnan(llms)] = np.nan
+    return ranks
+
+
+def bootstrap_mean_ci(values, rng, samples=BOOTSTRAP_SAMPLES, confidence=CONFIDENCE):
+    """Ortalama için yüzdelik bootstrap güven aralığı: (alt, üst); değer yoksa (None, None)."""
+    values = np.asarray(values, dtype=float)
+    values = values[~np.isnan(values)]
+    if len(values) < 2:
+        return None, None
+    means = values[rng.integers(0, len(values), size=(samples, len(values)))].mean(axis=1)
+    alpha = (1.0 - confidence) / 2
+    low, high = np.quantile(means, [alpha, 1.0 - alpha])
+    return float(low), float(high)
+
+
+def _nanmean(values, axis):
+    """NaN'ları atlayan ortalama; hiç değer yoksa uyarı vermeden NaN."""
+    count = np.sum(~np.isnan(values), axis=axis)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(count > 0, np.nansum(values, axis=axis) / count, np.nan)
+
+
+def _number(value, digits=1):
+    return None if value is None or np.isnan(value) else round(float(value), digits)
+
+
+def paired_comparison(case_means, llm_case_scores, rng):
+    """
+    Katılımcı grubu ile bir LLM arasında vaka bazında eşleştirilmiş karşılaştırma.
+    'case_means' ve 'llm_case_scores' aynı vaka sırasındaki dizilerdir (NaN: eksik).
+    """
+    both = ~np.isnan(case_means) & ~np.isnan(llm_case_scores)
+    diff = case_means[both] - llm_case_scores[both]
+    low, high = bootstrap_mean_ci(diff, rng)
+    return {
+        'cases': int(both.sum()),
+        'human': _number(case_means[both].mean()) if both.any() else None,
+        'llm': _number(llm_case_scores[both].mean()) if both.any() else None,
+        'diff': _number(diff.mean()) if both.any() else None,
+        'ci_low': _number(low), 'ci_high': _number(high),
+    }
+
+
+def group_comparisons(responses, matrix, dimension, rng):
+    """
+    Unvan veya deneyim grubuna göre: her grubun vaka bazında final skor
+    ortalaması ile her LLM'nin aynı vakalardaki skoru arasındaki fark ve güven aralığı.
+    """
+    case_means = (
+        responses.groupby([dimension, 'case_id'])['final_score'].mean()
+        .unstack('case_id').reindex(columns=matrix.cases)
+    )
+    counts = responses.groupby(dimension).size()
+    llm_final = matrix.values[:, matrix.human_count:, FINAL]
+    rows = []
+    for group, means in case_means.iterrows():
+        means = means.to_numpy(dtype=float)
+        rows.append({
+            'group': group,
+            'responses': int(counts[group]),
+            'comparisons': {
+                source: paired_comparison(means, llm_final[:, i], rng)
+                for i, source in enumerate(matrix.raters[matrix.human_count:])
+            },
+        })
+    return rows
+
+
+def icc_2_1(ratings):
+    """
+    ICC(2,1): iki yönlü rastgele etkiler, mutlak uyum, tek puanlayıcı.
+    'ratings' hedef x puanlayıcı dizisidir; eksik değer içeren satırlar atılır.
+    """
+    ratings = ratings[~np.isnan(ratings).any(axis=1)]
+    n, k = ratings.shape
+    if n < 2 or k < 2:
+        return None
+    grand = ratings.mean()
+    ss_rows = k * np.sum((ratings.mean(axis=1) - grand) ** 2)
+    ss_cols = n * np.sum((ratings.mean(axis=0) - grand) ** 2)
+    ss_error = np.sum((ratings - grand) ** 2) - ss_rows - ss_cols
+    ms_rows = ss_rows / (n - 1)
+    ms_cols = ss_cols / (k - 1)
+    ms_error = ss_error / ((n - 1) * (k - 1))
+    denominator = ms_rows + (k - 1) * ms_error + k * (ms_cols - ms_error) / n
+    return _number((ms_rows - ms_error) / denominator, 3) if denominator else None
+
+
+def agreement(matrix):
+    """
+    Kategori başına: katılımcı ortalaması ile her LLM arasında Spearman
+    korelasyonu ve ortalama mutlak fark (vakalar üzerinden); LLM'ler ve
+    katılımcı ortalaması için ICC(2,1).
+    """
+    sources = matrix.raters[matrix.human_count:]
+    human_mean = _nanmean(matrix.values[:, :matrix.human_count, :], axis=1)   # vaka x kategori
+    results = []
+    for c, category in enumerate(matrix.categories):
+        table = pd.DataFrame(matrix.values[:, matrix.human_count:, c], columns=sources)
+        table.insert(0, 'Katılımcılar', human_mean[:, c])
+        # Sıralar her çift için ortak (ikisi de dolu) vakalar üzerinden hesaplanır
+        correlations = table.corr(method='spearman')['Katılımcılar']
+        results.append({
+            'category': CATEGORIES[category],
+            'sources': {
+                source: {
+                    'spearman': _number(correlations.get(source), 3),
+                    'mad': _number((table[source] - table['Katılımcılar']).abs().mean()),
+                }
+                for source in sources
+            },
+            'icc': icc_2_1(table.to_numpy(dtype=float)),
+        })
+    return results
+
+
+def overall_comparison(matrix, rng):
+    """Tüm katılımcılar ile her LLM: kategori başına eşleştirilmiş fark ve ortalama yüzdelik sıra."""
+    human_mean = _nanmean(matrix.values[:, :matrix.human_count, :], axis=1)
+    ranks = _nanmean(percentile_ranks(matrix), axis=0)                          # LLM x kategori
+    rows = []
+    for i, source in enumerate(matrix.raters[matrix.human_count:]):
+        llm = matrix.values[:, matrix.human_count + i, :]
+        rows.append({
+            'source': source,
+            'categories': {
+                CATEGORIES[category]: {
+                    **paired_comparison(human_mean[:, c], llm[:, c], rng),
+                    'percentile': _number(ranks[i, c]),
+                }
+                for c, category in enumerate(matrix.categories)
+            },
+        })
+    return rows
+
+
+def build_report(seed=BOOTSTRAP_SEED):
+    """Yönetici raporu için tüm analizleri hesaplar."""
+    started = time.perf_counter()
+    rng = np.random.default_rng(seed)
+    responses = load_response_frame()
+    llm_scores = load_llm_frame()
+    matrix = build_score_matrix(responses, llm_scores)
+    report = {
+        'responses': len(responses),
+        'participants': matrix.human_count,
+        'cases': len(matrix.cases),
+        'sources': matrix.raters[matrix.human_count:],
+        'llm_cases': int(llm_scores['case_id'].nunique()) if len(llm_scores) else 0,
+        'other_version_responses': db.session.scalar(
+            select(func.count(UserResponse.id))
+            .where(UserResponse.judge_version.isnot(None), UserResponse.judge_version != JUDGE_VERSION)
+        ),
+        'judge_version': JUDGE_VERSION,
+        'confidence': int(CONFIDENCE * 100),
+        'bootstrap_samples': BOOTSTRAP_SAMPLES,
+        'overall': overall_comparison(matrix, rng),
+        'groups': {dimension: group_comparisons(responses, matrix, dimension, rng) for dimension in GROUP_DIMENSIONS},
+        'agreement': agreement(matrix),
+    }
+    report['seconds'] = round(time.perf_counter() - started, 2)
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Katılımcılar ile LLM referans yanıtlarının karşılaştırmalı analizi.")
+    parser.add_argument('--score-references', action='store_true', help="LLM referans yanıtlarını puanla")
+    parser.add_argument('--force', action='store_true', help="Önbellekteki puanları yok sayıp yeniden puanla")
+    args = parser.parse_args()
+
+    with app.app_context():
+        if args.score_references:
+            print(score_llm_references(force=args.force))
+        else:
+            print(json.dumps(build_report(), ensure_ascii=False, indent=2))
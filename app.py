@@ -7,20 +7,28 @@ Railway (PostgreSQL) ile yerel (SQLite) geliştirmeyi destekler.
 
 # --- 1. GEREKLİ KÜTÜPHANELER ---
 import os
-import json
-import csv
 import io
-import random
+import json
+import time
+import threading
 from werkzeug.utils import secure_filename
-from flask import Flask, render_template, request, redirect, url_for, flash, Response
+from flask import Flask, render_template, request, redirect, url_for, flash, Response, stream_with_context, send_file, jsonify, g
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
 from functools import wraps
 from dotenv import load_dotenv
-import google.generativeai as genai
-from redis import Redis
-from rq import Queue
+from redis import ConnectionPool, Redis
+from sqlalchemy.pool import NullPool
 import datetime
+from verdict_cache import VerdictCache
+from single_flight import SingleFlight, request_fingerprint
+from case_cache import CaseCache, llm_references
+from scoring_archive import decode_payload, encode_payload
+from judge_backends import JUDGE_BACKENDS, JudgeRequest, ReplayMiss, create_backend
+from scoring_queues import LANE_QUEUES, PendingScoring, parse_lane_weights
+from live_scores import ScoreEvents, score_event, format_sse
+from rate_limiter import JudgeCallGuard, JudgeUnavailable
+from metrics import HTTP_REQUEST_SECONDS, record_judge_error, metrics_payload
 
 # --- 2. UYGULAMA KURULUMU VE YAPILANDIRMA ---
 
@@ -41,12 +49,114 @@ DATABASE_URL = os.getenv('DATABASE_URL')
 if DATABASE_URL and DATABASE_URL.startswith('postgres'):
     # Railway/PostgreSQL veritabanı
     app.config['SQLALCHEMY_DATABASE_URI'] = DATABASE_URL
+elif DATABASE_URL and DATABASE_URL.startswith('sqlite'):
+    # Ayrı bir SQLite dosyası (örn. benchmark.py geçici veritabanı)
+    app.config['SQLALCHEMY_DATABASE_URI'] = DATABASE_URL
 else:
     # Yerel SQLite veritabanı
     app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(basedir, 'database.db')
 
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+# Bağlantı havuzu (PostgreSQL). Her gunicorn/worker süreci kendi havuzunu tutar:
+# süreç başına en fazla DB_POOL_SIZE + DB_MAX_OVERFLOW bağlantı açılır.
+# DB_POOL_PRE_PING boşta kalıp sunucu tarafından kapatılmış bağlantıları
+# kullanmadan önce yakalar; DB_POOL_RECYCLE bağlantıları bu süreden sonra yeniler.
+# DB_EXTERNAL_POOLER=1 (PgBouncer vb. harici havuzlayıcı arkasında): uygulama
+# bağlantı tutmaz (NullPool), her oturum havuzlayıcıdan bağlantı alıp bırakır.
+app.config['DB_POOL_SIZE'] = int(os.getenv('DB_POOL_SIZE', 5))
+app.config['DB_MAX_OVERFLOW'] = int(os.getenv('DB_MAX_OVERFLOW', 10))
+app.config['DB_POOL_TIMEOUT'] = int(os.getenv('DB_POOL_TIMEOUT', 30))
+app.config['DB_POOL_RECYCLE'] = int(os.getenv('DB_POOL_RECYCLE', 1800))
+app.config['DB_POOL_PRE_PING'] = os.getenv('DB_POOL_PRE_PING', '1') == '1'
+app.config['DB_EXTERNAL_POOLER'] = os.getenv('DB_EXTERNAL_POOLER', '0') == '1'
+
+if app.config['SQLALCHEMY_DATABASE_URI'].startswith('postgres'):
+    if app.config['DB_EXTERNAL_POOLER']:
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'poolclass': NullPool}
+    else:
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+            'pool_size': app.config['DB_POOL_SIZE'],
+            'max_overflow': app.config['DB_MAX_OVERFLOW'],
+            'pool_timeout': app.config['DB_POOL_TIMEOUT'],
+            'pool_recycle': app.config['DB_POOL_RECYCLE'],
+            'pool_pre_ping': app.config['DB_POOL_PRE_PING'],
+        }
+
+# Redis bağlantı havuzu: uygulamanın tüm Redis kullanıcıları (RQ, önbellekler,
+# hız sınırlayıcı, canlı skorlar) aynı havuzu paylaşır. REDIS_MAX_CONNECTIONS
+# boşsa sınır yoktur; açık her SSE akışı bir bağlantı tutar.
+app.config['REDIS_MAX_CONNECTIONS'] = int(os.getenv('REDIS_MAX_CONNECTIONS', 0)) or None
+app.config['REDIS_HEALTH_CHECK_INTERVAL'] = int(os.getenv('REDIS_HEALTH_CHECK_INTERVAL', 30))
+
+# Puanlama Yapılandırması
+# Açıkken dört kategori tek bir hakem LLM isteğiyle puanlanır; yanıt
+# ayrıştırılamazsa kategori bazlı (tekli) puanlamaya geri dönülür.
+app.config['JUDGE_BATCH_SCORING'] = os.getenv('JUDGE_BATCH_SCORING', '1') == '1'
+
+# Yerel ön puanlayıcı (bkz. prescorer.py): altın standartla açıkça örtüşen
+# yanıtlar hakeme gönderilmeden puanlanır, belirsiz yanıtlar hakeme gider.
+app.config['PRESCORER_ENABLED'] = os.getenv('PRESCORER_ENABLED', '1') == '1'
+
+# Ana sayfada sayfa başına listelenen vaka sayısı (bkz. case_listing.py)
+app.config['CASES_PER_PAGE'] = int(os.getenv('CASES_PER_PAGE', 50))
+
+# Hakem karar önbelleği (bkz. verdict_cache.py)
+app.config['VERDICT_CACHE_ENABLED'] = os.getenv('VERDICT_CACHE_ENABLED', '1') == '1'
+app.config['VERDICT_CACHE_TTL'] = int(os.getenv('VERDICT_CACHE_TTL', 30 * 24 * 3600))
+app.config['VERDICT_CACHE_MAX_ENTRIES'] = int(os.getenv('VERDICT_CACHE_MAX_ENTRIES', 100000))
+
+# Uçuştaki aynı hakem isteklerinin birleştirilmesi (bkz. single_flight.py).
+# Kilit süresi dolan veya bu kadar bekleyen worker isteği kendisi gönderir.
+app.config['JUDGE_SINGLE_FLIGHT'] = os.getenv('JUDGE_SINGLE_FLIGHT', '1') == '1'
+app.config['JUDGE_SINGLE_FLIGHT_LOCK_TTL'] = float(os.getenv('JUDGE_SINGLE_FLIGHT_LOCK_TTL', 30))
+app.config['JUDGE_SINGLE_FLIGHT_RESULT_TTL'] = int(os.getenv('JUDGE_SINGLE_FLIGHT_RESULT_TTL', 30))
+
+# Worker eşzamanlılığı (bkz. worker.py)
+# WORKER_CONCURRENCY: bir worker sürecinde aynı anda puanlanan yanıt (RQ işi) sayısı.
+# JUDGE_MAX_IN_FLIGHT: bir süreçte aynı anda uçuşta olabilecek hakem LLM isteği sayısı.
+app.config['WORKER_CONCURRENCY'] = int(os.getenv('WORKER_CONCURRENCY', 4))
+app.config['JUDGE_MAX_IN_FLIGHT'] = int(os.getenv('JUDGE_MAX_IN_FLIGHT', 8))
+# Yeniden puanlama sahipliği (bkz. rescore.py): planlama veya bir parça üzerindeki
+# sahiplik her grupta yenilenir; RESCORE_LEASE_SECONDS boyunca yenilenmezse
+# çalıştırma takılmış sayılır ve resume ile başka bir işe devredilebilir.
+app.config['RESCORE_LEASE_SECONDS'] = int(os.getenv('RESCORE_LEASE_SECONDS', 600))
+# Puanlama şeritlerinin ağırlıkları (bkz. scoring_queues.py), ör. "interactive=6,rescore=3,backfill=1"
+app.config['SCORING_LANE_WEIGHTS'] = parse_lane_weights(os.getenv('SCORING_LANE_WEIGHTS'))
+
+# Puanlama giden kutusu (bkz. outbox.py). Dağıtıcı worker sürecinde çalışır:
+# kutuyu OUTBOX_POLL_INTERVAL saniyede bir, en fazla OUTBOX_BATCH_SIZE satırlık
+# gruplarla kuyruğa aktarır. Süpürücü OUTBOX_SWEEP_INTERVAL saniyede bir,
+# OUTBOX_SWEEP_AFTER saniyeden uzun süredir puanlanmamış yanıtları kutuya geri ekler.
+app.config['OUTBOX_DISPATCHER'] = os.getenv('OUTBOX_DISPATCHER', '1') == '1'
+app.config['OUTBOX_BATCH_SIZE'] = int(os.getenv('OUTBOX_BATCH_SIZE', 200))
+app.config['OUTBOX_POLL_INTERVAL'] = float(os.getenv('OUTBOX_POLL_INTERVAL', 0.5))
+app.config['OUTBOX_SWEEP_INTERVAL'] = int(os.getenv('OUTBOX_SWEEP_INTERVAL', 300))
+app.config['OUTBOX_SWEEP_AFTER'] = int(os.getenv('OUTBOX_SWEEP_AFTER', 1800))
+
+# Hakem LLM hız sınırı, yeniden deneme ve devre kesici (bkz. rate_limiter.py)
+app.config['JUDGE_RPM'] = int(os.getenv('JUDGE_RPM', 300))
+app.config['JUDGE_TPM'] = int(os.getenv('JUDGE_TPM', 1000000))
+app.config['JUDGE_MAX_RETRIES'] = int(os.getenv('JUDGE_MAX_RETRIES', 5))
+app.config['JUDGE_RETRY_BUDGET_SECONDS'] = float(os.getenv('JUDGE_RETRY_BUDGET_SECONDS', 120))
+app.config['JUDGE_BREAKER_THRESHOLD'] = int(os.getenv('JUDGE_BREAKER_THRESHOLD', 5))
+app.config['JUDGE_BREAKER_COOLDOWN'] = int(os.getenv('JUDGE_BREAKER_COOLDOWN', 60))
+# Hakem ulaşılamadığında bir iş en fazla bu kadar kez ertelenir
+app.config['JUDGE_MAX_DEFERRALS'] = int(os.getenv('JUDGE_MAX_DEFERRALS', 10))
+
+# Sonuç sayfasına canlı skor iletimi (bkz. live_scores.py). Bir SSE bağlantısı en
+# fazla SCORE_STREAM_TIMEOUT saniye açık kalır, ardından tarayıcı yeniden bağlanır.
+# Her akış bir gthread iş parçacığını tutar: süreç başına en fazla SCORE_STREAM_MAX
+# akış açılır (Procfile'daki --threads 8'in geri kalanı normal isteklere kalır);
+# sınır doluysa tarayıcı /results/<id>/status uç noktasını sorgular.
+app.config['SCORE_STREAM_TIMEOUT'] = int(os.getenv('SCORE_STREAM_TIMEOUT', 10))
+app.config['SCORE_STREAM_MAX'] = int(os.getenv('SCORE_STREAM_MAX', 2))
+
+# Prometheus metrikleri (bkz. metrics.py). METRICS_TOKEN tanımlıysa /metrics bu
+# token ile korunur; worker metrikleri METRICS_PORT portundan yayınlanır.
+app.config['METRICS_TOKEN'] = os.getenv('METRICS_TOKEN')
+app.config['METRICS_PORT'] = int(os.getenv('METRICS_PORT', 9200))
+
 # --- 3. EKLENTİLERİ BAŞLATMA (DB, LOGIN, REDIS) ---
 
 db = SQLAlchemy(app)
@@ -57,30 +167,114 @@ login_manager.login_message = "Bu araştırma platformunu kullanmak için lütfe
 login_manager.login_message_category = "info"
 
 # Redis ve RQ (Asenkron Görev Kuyruğu) Yapılandırması
+# Redis istemcisi bağlantıyı ilk komutta açar; RQ kuyrukları ise ilk kullanımda
+# oluşturulur (bkz. get_queue). Böylece uygulamanın içe aktarılması ağa çıkmaz.
 redis_url = os.getenv('REDIS_URL')
 if not redis_url:
     print("UYARI: REDIS_URL bulunamadı. Görevler yerel olarak çalışmayabilir.")
     conn = None
-    queue = None
 else:
-    conn = Redis.from_url(redis_url)
-    queue = Queue("default", connection=conn)
-
-# --- 4. GEMINI API YAPILANDIRMASI ---
-
-model = None
-try:
-    api_key = os.getenv("GEMINI_API_KEY")
-    if not api_key or api_key == "AIzaSy...":
-        raise ValueError("GEMINI_API_KEY bulunamadı veya ayarlanmamış. Lütfen .env dosyanızı kontrol edin.")
-    genai.configure(api_key=api_key)
-    model = genai.GenerativeModel(
-        model_name='gemini-2.5-flash',
-        generation_config={"response_mime_type": "application/json"}
+    redis_pool = ConnectionPool.from_url(
+        redis_url,
+        max_connections=app.config['REDIS_MAX_CONNECTIONS'],
+        health_check_interval=app.config['REDIS_HEALTH_CHECK_INTERVAL'],
+        socket_keepalive=True,
     )
-    print("Gemini API (gemini-2.5-flash) başarıyla yapılandırıldı.")
-except Exception as e:
-    print(f"HATA: Gemini API yapılandırılamadı: {e}")
+    conn = Redis(connection_pool=redis_pool)
+
+_queues = {}
+
+def get_queue(lane='interactive'):
+    """Puanlama şeridinin RQ kuyruğunu (ilk çağrıda oluşturarak) döndürür; Redis yoksa None."""
+    if conn is None:
+        return None
+    if lane not in _queues:
+        from rq import Queue
+        _queues[lane] = Queue(LANE_QUEUES[lane], connection=conn)
+    return _queues[lane]
+
+# Aynı kullanıcı/vaka için bekleyen puanlama işleri tekilleştirilir
+pending_scoring = PendingScoring(conn)
+
+score_events = ScoreEvents(conn, stream_timeout=app.config['SCORE_STREAM_TIMEOUT'],
+                           max_streams=app.config['SCORE_STREAM_MAX'])
+
+# --- 4. HAKEM LLM YAPILANDIRMASI ---
+
+# Hakem arka ucu (bkz. judge_backends.py): gemini (üretim), fake (yerel yük testi),
+# replay (puanlama arşivindeki scoring_run kayıtlarından geçmiş puanlamaları yeniden üretme)
+app.config['JUDGE_BACKEND'] = os.getenv('JUDGE_BACKEND', 'gemini')
+app.config['FAKE_JUDGE_LATENCY'] = float(os.getenv('FAKE_JUDGE_LATENCY', 0.5))
+app.config['FAKE_JUDGE_LATENCY_JITTER'] = float(os.getenv('FAKE_JUDGE_LATENCY_JITTER', 0.2))
+app.config['FAKE_JUDGE_ERROR_RATE'] = float(os.getenv('FAKE_JUDGE_ERROR_RATE', 0.0))
+app.config['FAKE_JUDGE_ERROR_CODE'] = int(os.getenv('FAKE_JUDGE_ERROR_CODE', 503))
+app.config['FAKE_JUDGE_SEED'] = os.getenv('FAKE_JUDGE_SEED')
+# Boş bırakılırsa tüm hakem sürümlerinin kayıtları kullanılır (örn: 'v1/gemini-2.5-flash')
+app.config['JUDGE_REPLAY_VERSION'] = os.getenv('JUDGE_REPLAY_VERSION')
+
+if app.config['JUDGE_BACKEND'] not in JUDGE_BACKENDS:
+    raise ValueError(f"Bilinmeyen JUDGE_BACKEND: {app.config['JUDGE_BACKEND']}")
+
+JUDGE_MODEL_NAME = JUDGE_BACKENDS[app.config['JUDGE_BACKEND']].model_name
+
+# Hakem istemleri (JUDGE_RULES, tekli/toplu istem metinleri) değiştirildiğinde
+# bu sürümü ARTIRIN. Sürüm, karar önbelleği anahtarının bir parçasıdır; böylece
+# farklı istem sürümlerinin kararları araştırma verisinde karışmaz.
+JUDGE_PROMPT_VERSION = 'v1'
+
+# Her puanlamanın judge_version alanına ve arşiv kaydına yazılır; analizde hakem sürümlerini ayırmak için
+JUDGE_VERSION = f"{JUDGE_PROMPT_VERSION}/{JUDGE_MODEL_NAME}"
+
+# Hakem arka ucu (ve Gemini SDK'sı) ilk puanlamada oluşturulur; web süreçleri SDK'yı hiç yüklemez
+judge_backend = None
+_judge_backend_lock = threading.Lock()
+_judge_backend_failed = False
+
+def get_judge_backend():
+    """Hakem arka ucunu ilk çağrıda oluşturur; yapılandırılamazsa None döndürür."""
+    global judge_backend, _judge_backend_failed
+    if judge_backend is not None or _judge_backend_failed:
+        return judge_backend
+    with _judge_backend_lock:
+        if judge_backend is None and not _judge_backend_failed:
+            try:
+                judge_backend = create_backend(app.config, api_key=os.getenv("GEMINI_API_KEY"))
+                print(f"Hakem arka ucu ({app.config['JUDGE_BACKEND']}, {JUDGE_MODEL_NAME}) başarıyla yapılandırıldı.")
+            except Exception as e:
+                _judge_backend_failed = True
+                print(f"HATA: Hakem arka ucu yapılandırılamadı: {e}")
+    return judge_backend
+
+# Tüm hakem çağrıları bu koruyucu üzerinden yapılır (hız sınırı, yeniden deneme, devre kesici)
+judge_guard = JudgeCallGuard(
+    conn,
+    requests_per_minute=app.config['JUDGE_RPM'],
+    tokens_per_minute=app.config['JUDGE_TPM'],
+    max_retries=app.config['JUDGE_MAX_RETRIES'],
+    retry_budget_seconds=app.config['JUDGE_RETRY_BUDGET_SECONDS'],
+    breaker_threshold=app.config['JUDGE_BREAKER_THRESHOLD'],
+    breaker_cooldown=app.config['JUDGE_BREAKER_COOLDOWN']
+)
+
+# Aynı anda gönderilen birebir aynı hakem istekleri tek bir çağrıda birleştirilir
+judge_single_flight = SingleFlight(
+    conn,
+    lock_ttl=app.config['JUDGE_SINGLE_FLIGHT_LOCK_TTL'],
+    result_ttl=app.config['JUDGE_SINGLE_FLIGHT_RESULT_TTL'],
+    enabled=app.config['JUDGE_SINGLE_FLIGHT']
+)
+
+def call_judge(backend, prompt, request, category):
+    """
+    İstemi hakeme gönderir ve ham yanıt metnini döndürür. Aynı istem (ve hakem
+    sürümü) başka bir iş tarafından zaten gönderilmişse onun sonucu beklenir.
+    """
+    key = request_fingerprint(JUDGE_VERSION, prompt)
+
+    def send():
+        return judge_guard.call(lambda p: backend.generate(p, request), prompt, category=category).text
+
+    return judge_single_flight.call(key, send)
 
 # --- 5. VERİTABANI MODELLERİ (TASKS.PY VE DB.SQLITE İLE UYUMLU) ---
 
@@ -101,23 +295,83 @@ class Case(db.Model):
     title = db.Column(db.String(200), nullable=False)
     anamnesis = db.Column(db.Text, nullable=False)       # JSON String
     physical_exam = db.Column(db.Text, nullable=False)   # JSON String
-    # gold_standard_response artık ReferenceAnswer tablosunda tutulacak.
-    chatgpt_response = db.Column(db.Text, nullable=False) # JSON String
-    gemini_response = db.Column(db.Text, nullable=False)  # JSON String
-    deepseek_response = db.Column(db.Text, nullable=False)# JSON String
+    # Altın standart ve LLM yanıtları ReferenceAnswer tablosunda tutulur.
     responses = db.relationship('UserResponse', backref='case', lazy=True)
     reference_answers = db.relationship('ReferenceAnswer', backref='case', lazy=True)
 
+# Referans yanıt alanı (vaka JSON'undaki anahtar) -> ReferenceAnswer sütunu
+REFERENCE_ANSWER_FIELDS = {'tanı': 'diagnosis', 'tetkik': 'tests', 'tedavi_plani': 'treatment_plan', 'dozaj': 'dosage'}
+
 class ReferenceAnswer(db.Model):
-    """Vakalar için 'Altın Standart' ve diğer LLM yanıtlarını tutan tablo."""
+    """
+    Vakalar için 'Altın Standart' ve LLM yanıtlarını tutan tek tablo: kaynak başına
+    bir satır, alan başına bir sütun. Yeni bir LLM kaynağı eklemek yalnızca yeni
+    satırlar eklemektir (ör. source='claude').
+    """
+    # Mevcut veritabanlarında migrations.py ile oluşturulur
+    __table_args__ = (
+        db.Index('ix_reference_answer_case_source', 'case_id', 'source'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     case_id = db.Column(db.Integer, db.ForeignKey('case.id'), nullable=False)
-    source = db.Column(db.String(100), nullable=False, index=True) # 'gold', 'chatgpt', 'gemini'
-    content = db.Column(db.JSON, nullable=False)
+    source = db.Column(db.String(100), nullable=False, index=True) # 'gold', 'chatgpt', 'gemini', 'deepseek', ...
+    diagnosis = db.Column(db.Text, nullable=True)       # tanı
+    tests = db.Column(db.Text, nullable=True)           # tetkik
+    treatment_plan = db.Column(db.Text, nullable=True)  # tedavi_plani
+    dosage = db.Column(db.Text, nullable=True)          # dozaj
+    extra = db.Column(db.JSON, nullable=True)           # diğer alanlar (ör. altın standartta es_anlamlilar)
     created_at = db.Column(db.DateTime, default=lambda: datetime.datetime.now(datetime.timezone.utc))
 
+    @property
+    def content(self):
+        return ReferenceAnswer.content_of(self)
+
+    @staticmethod
+    def content_of(row):
+        """Satırı (veya aynı sütunları içeren bir sorgu satırını) vaka JSON'undaki sözlük biçimine çevirir."""
+        content = dict(row.extra or {})
+        for field, column in REFERENCE_ANSWER_FIELDS.items():
+            value = getattr(row, column)
+            if value is not None:
+                content[field] = value
+        return content
+
+    @staticmethod
+    def values_for(case_id, source, content):
+        """Toplu INSERT için satır değerleri ('content', vaka JSON'undaki referans yanıt sözlüğü)."""
+        content = content or {}
+        values = {'case_id': case_id, 'source': source,
+                  'created_at': datetime.datetime.now(datetime.timezone.utc)}
+        for field, column in REFERENCE_ANSWER_FIELDS.items():
+            value = content.get(field)
+            values[column] = None if value is None else str(value)
+        values['extra'] = {k: v for k, v in content.items() if k not in REFERENCE_ANSWER_FIELDS} or None
+        return values
+
+    @classmethod
+    def load_many(cls, session, case_ids=None, sources=None):
+        """
+        Verilen vakaların (None: tüm vakalar) referans yanıtlarını TEK sorguda okur:
+        {case_id: {source: içerik sözlüğü}}. Aynı kaynaktan birden fazla kayıt varsa ilki geçerlidir.
+        """
+        query = db.select(cls.case_id, cls.source, cls.extra,
+                          *[getattr(cls, column) for column in REFERENCE_ANSWER_FIELDS.values()]).order_by(cls.id)
+        if case_ids is not None:
+            query = query.where(cls.case_id.in_(case_ids))
+        if sources is not None:
+            query = query.where(cls.source.in_(sources))
+        references = {case_id: {} for case_id in case_ids or ()}
+        for row in session.execute(query):
+            references.setdefault(row.case_id, {}).setdefault(row.source, cls.content_of(row))
+        return references
+
 class UserResponse(db.Model):
     """Kullanıcıların vakalara verdiği yanıtları ve ayrıntılı skorları saklayan tablo."""
+    # Mevcut veritabanlarında migrations.py ile oluşturulur
+    __table_args__ = (
+        db.Index('ix_user_response_user_created', 'user_id', db.text('created_at DESC')),
+        db.Index('ix_user_response_case_id', 'case_id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     case_id = db.Column(db.Integer, db.ForeignKey('case.id'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -141,14 +395,160 @@ class UserResponse(db.Model):
     
     # tasks.py'deki JSON gerekçelendirme modeline uyumlu
     score_reasons = db.Column(db.JSON, nullable=True) 
-    llm_raw = db.Column(db.JSON, nullable=True) 
+    # Son puanlamanın hakem sürümü; None ise yanıt henüz puanlanmadı. Hakemin ham
+    # yanıtları scoring_run tablosunda sıkıştırılmış olarak tutulur (yalnızca erişildiğinde okunur).
+    judge_version = db.Column(db.String(150), nullable=True)
+    scoring_runs = db.relationship('ScoringRun', backref='response', lazy='dynamic', order_by='ScoringRun.id')
     
     # Eski modelden (app.py) gelen sütunlar - uyumluluk için eklendi ama kullanılmayacak.
     # diagnosis_reasoning vb. yerine score_reasons kullanılacak.
 
+class ScoringRun(db.Model):
+    """Bir yanıtın bir puanlamasındaki hakem ham yükü; sıkıştırılmış, yalnızca eklenir (bkz. scoring_archive.py)."""
+    __table_args__ = (
+        db.Index('ix_scoring_run_response_version', 'response_id', 'judge_version'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    response_id = db.Column(db.Integer, db.ForeignKey('user_response.id'), nullable=False)
+    judge_version = db.Column(db.String(150), nullable=False)
+    codec = db.Column(db.String(10), nullable=False)
+    payload = db.Column(db.LargeBinary, nullable=False)
+    created_at = db.Column(db.DateTime, default=lambda: datetime.datetime.now(datetime.timezone.utc))
+
+    @property
+    def raw(self):
+        return decode_payload(self.codec, self.payload)
+
+    @staticmethod
+    def values_for(response_id, raw):
+        """Toplu INSERT için satır değerleri ('raw', tasks.score_answers'ın ürettiği llm_raw sözlüğü)."""
+        codec, payload = encode_payload(raw)
+        return {'response_id': response_id, 'judge_version': raw.get('judge_version') or 'bilinmiyor',
+                'codec': codec, 'payload': payload,
+                'created_at': datetime.datetime.now(datetime.timezone.utc)}
+
+class LlmReferenceScore(db.Model):
+    """
+    Bir LLM referans yanıtının (ReferenceAnswer) altın standarda göre puanı; vaka,
+    kaynak ve hakem sürümü başına bir kez hesaplanır (bkz. analytics.py).
+    """
+    __table_args__ = (
+        db.UniqueConstraint('case_id', 'source', 'judge_version', name='uq_llm_reference_score'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    case_id = db.Column(db.Integer, db.ForeignKey('case.id'), nullable=False)
+    source = db.Column(db.String(100), nullable=False)
+    judge_version = db.Column(db.String(150), nullable=False)
+    content_hash = db.Column(db.String(64), nullable=False) # altın standart + referans yanıt; değişirse yeniden puanlanır
+    diagnosis_score = db.Column(db.Float, nullable=False)
+    investigation_score = db.Column(db.Float, nullable=False)
+    treatment_score = db.Column(db.Float, nullable=False)
+    dosage_score = db.Column(db.Float, nullable=False)
+    final_score = db.Column(db.Float, nullable=False)
+    score_reasons = db.Column(db.JSON, nullable=True)
+    created_at = db.Column(db.DateTime, default=lambda: datetime.datetime.now(datetime.timezone.utc))
+
+class JudgeVerdict(db.Model):
+    """Hakem LLM kararlarının kalıcı önbelleği (Redis'in ikincil katmanı, bkz. verdict_cache.py)."""
+    key = db.Column(db.String(64), primary_key=True) # SHA-256 içerik anahtarı
+    prompt_version = db.Column(db.String(50), nullable=False, index=True)
+    model_name = db.Column(db.String(100), nullable=False)
+    category = db.Column(db.String(50), nullable=False)
+    score = db.Column(db.Integer, nullable=False)
+    reason = db.Column(db.Text, nullable=True)
+    raw = db.Column(db.Text, nullable=True)
+    hit_count = db.Column(db.Integer, default=0)
+    created_at = db.Column(db.DateTime, default=lambda: datetime.datetime.now(datetime.timezone.utc))
+    last_used_at = db.Column(db.DateTime, default=lambda: datetime.datetime.now(datetime.timezone.utc), index=True)
+
+class RescoreRun(db.Model):
+    """Toplu yeniden puanlama çalıştırması; ilerleme ve kaldığı yerden devam bilgisi (bkz. rescore.py)."""
+    id = db.Column(db.Integer, primary_key=True)
+    status = db.Column(db.String(20), nullable=False, default='planning') # planning, running, done
+    case_ids = db.Column(db.JSON, nullable=True)       # None: tüm vakalar
+    chunk_size = db.Column(db.Integer, nullable=False, default=100)
+    judge_version = db.Column(db.String(150), nullable=True)
+    gold_snapshot = db.Column(db.JSON, nullable=True)  # {case_id: altın standart}, çalıştırma başında bir kez alınır
+    plan_cursor = db.Column(db.Integer, nullable=False, default=0) # parçalara bölünmüş son UserResponse id'si
+    claim_token = db.Column(db.String(32), nullable=True)  # planlamayı yürüten iş (bkz. rescore._claim)
+    claimed_at = db.Column(db.DateTime, nullable=True)     # planlama sahipliğinin son yenilenmesi
+    total = db.Column(db.Integer, nullable=False, default=0)
+    scored = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=lambda: datetime.datetime.now(datetime.timezone.utc))
+    finished_at = db.Column(db.DateTime, nullable=True)
+    chunks = db.relationship('RescoreChunk', backref='run', lazy=True)
+
+class RescoreChunk(db.Model):
+    """Yeniden puanlama çalıştırmasının bir parçası: ardışık bir UserResponse id aralığı."""
+    id = db.Column(db.Integer, primary_key=True)
+    run_id = db.Column(db.Integer, db.ForeignKey('rescore_run.id'), nullable=False, index=True)
+    first_id = db.Column(db.Integer, nullable=False)
+    last_id = db.Column(db.Integer, nullable=False)
+    cursor_id = db.Column(db.Integer, nullable=False) # bu id'ye kadar (dahil) puanlandı
+    status = db.Column(db.String(20), nullable=False, default='pending') # pending, done
+    claim_token = db.Column(db.String(32), nullable=True)  # parçayı yürüten iş (bkz. rescore._claim)
+    claimed_at = db.Column(db.DateTime, nullable=True)     # sahipliğin son yenilenmesi (veya kuyruğa eklenme)
+
+class ScoreAggregate(db.Model):
+    """Skor özetleri: boyut/anahtar başına sayı, toplam ve kareler toplamı (bkz. aggregates.py)."""
+    dimension = db.Column(db.String(20), primary_key=True) # 'all', 'case', 'profession', 'experience'
+    key = db.Column(db.String(200), primary_key=True)
+    n = db.Column(db.Integer, nullable=False, default=0)
+    diagnosis_sum = db.Column(db.Float, nullable=False, default=0.0)
+    diagnosis_sumsq = db.Column(db.Float, nullable=False, default=0.0)
+    investigation_sum = db.Column(db.Float, nullable=False, default=0.0)
+    investigation_sumsq = db.Column(db.Float, nullable=False, default=0.0)
+    treatment_sum = db.Column(db.Float, nullable=False, default=0.0)
+    treatment_sumsq = db.Column(db.Float, nullable=False, default=0.0)
+    dosage_sum = db.Column(db.Float, nullable=False, default=0.0)
+    dosage_sumsq = db.Column(db.Float, nullable=False, default=0.0)
+    final_sum = db.Column(db.Float, nullable=False, default=0.0)
+    final_sumsq = db.Column(db.Float, nullable=False, default=0.0)
+    duration_n = db.Column(db.Integer, nullable=False, default=0)
+    duration_sum = db.Column(db.Float, nullable=False, default=0.0)
+    duration_sumsq = db.Column(db.Float, nullable=False, default=0.0)
+    updated_at = db.Column(db.DateTime, default=lambda: datetime.datetime.now(datetime.timezone.utc))
+
+class ScoringOutbox(db.Model):
+    """Puanlama kuyruğuna henüz aktarılmamış yanıtlar (işlemsel giden kutusu, bkz. outbox.py)."""
+    id = db.Column(db.Integer, primary_key=True)
+    response_id = db.Column(db.Integer, db.ForeignKey('user_response.id'), nullable=False, index=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    case_id = db.Column(db.Integer, nullable=False)
+    lane = db.Column(db.String(20), nullable=False, default='interactive')
+    created_at = db.Column(db.DateTime, default=lambda: datetime.datetime.now(datetime.timezone.utc))
+
+class SchemaMigration(db.Model):
+    """Uygulanmış şema geçişleri (bkz. migrations.py)."""
+    id = db.Column(db.String(100), primary_key=True)
+    applied_at = db.Column(db.DateTime, default=lambda: datetime.datetime.now(datetime.timezone.utc))
+
+verdict_cache = VerdictCache(
+    conn, db, JudgeVerdict, JUDGE_PROMPT_VERSION,
+    ttl_seconds=app.config['VERDICT_CACHE_TTL'],
+    max_entries=app.config['VERDICT_CACHE_MAX_ENTRIES'],
+    enabled=app.config['VERDICT_CACHE_ENABLED']
+)
+
+# Ayrıştırılmış vaka içerikleri ve referans yanıtlar için süreç içi önbellek (bkz. case_cache.py)
+case_cache = CaseCache(conn, db, Case, ReferenceAnswer)
+
 
 # --- 6. YARDIMCI FONKSİYONLAR VE DECORATOR'LAR ---
 
+@app.before_request
+def start_request_timer():
+    """Route bazında istek süresini ölçmek için başlangıç zamanını kaydeder (bkz. metrics.py)."""
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_time(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        HTTP_REQUEST_SECONDS.labels(request.endpoint or 'bilinmiyor', request.method,
+                                    response.status_code).observe(time.perf_counter() - started)
+    return response
+
 @login_manager.user_loader
 def load_user(user_id):
     """Flask-Login için kullanıcıyı ID'sine göre yükler."""
@@ -166,12 +566,37 @@ def utility_processor():
     """HTML şablonları içinde parse_json_fields fonksiyonunu kullanılabilir hale getirir."""
     return dict(parse_json=parse_json_fields)
 
+# Hakem LLM'e gönderilen değerlendirme kuralları (tekli ve toplu istemlerde ortak)
+JUDGE_RULES = """    Değerlendirme Kuralları:
+    1. YETERLİLİK: Kullanıcının yanıtı, klinik olarak en önemli unsurları içeriyorsa tam puan ver. "sol/sağ" gibi pratik olmayan detay eksikliğinden puan KIRMA.
+    2. TETKİK: 'Tetkik' kategorisinde, altın standart 'gerekmez' diyorsa, kullanıcının da 'yok' veya 'gerekmez' demesine tam puan ver. Gereksiz tetkik istemesinden puan kır.
+    3. DOZAJ: 'Dozaj' kategorisinde, ilacın adından ziyade dozun, sıklığın ve uygulama şeklinin doğruluğuna odaklan.
+"""
+
+# Puanlanan kategoriler: anahtar -> (istemdeki etiket, altın standart JSON alanı)
+SCORING_CATEGORIES = {
+    'diagnosis': ('Tanı', 'tanı'),
+    'tests': ('Tetkik', 'tetkik'),
+    'treatment': ('Tedavi Planı', 'tedavi_plani'),
+    'dosage': ('Dozaj', 'dozaj'),
+}
+# İstemdeki etiket -> kategori anahtarı
+CATEGORY_KEYS = {label: key for key, (label, _) in SCORING_CATEGORIES.items()}
+
 def get_semantic_score(user_answer, gold_standard_answer, category):
     """
-    Kullanıcı yanıtını Gemini API ile pragmatik ve anlamsal olarak puanlar.
+    Kullanıcı yanıtını hakem LLM ile (JUDGE_BACKEND) pragmatik ve anlamsal olarak puanlar.
     Bu fonksiyon artık tasks.py tarafından (arka planda) çağrılır.
+    Aynı girdiler için daha önce verilmiş bir karar varsa önbellekten döner.
+    Hakem geçici olarak ulaşılamazsa (429/5xx, devre açık) JudgeUnavailable,
+    replay arka ucunda saklanmış karar yoksa ReplayMiss fırlatılır.
     """
-    if not model:
+    cached = verdict_cache.get(user_answer, gold_standard_answer, category, JUDGE_MODEL_NAME)
+    if cached is not None:
+        return cached
+
+    backend = get_judge_backend()
+    if not backend:
         print("HATA: Hakem LLM modeli yüklenemedi.")
         return 0, {"reason": "Hakem LLM modeli yüklenemediği için skorlama yapılamadı.", "raw": "Model not loaded."}
 
@@ -180,11 +605,7 @@ def get_semantic_score(user_answer, gold_standard_answer, category):
     Temel görevin, "Kullanıcı Yanıtı"nın, hastanın doğru ve güvenli bir şekilde tedavi edilmesini sağlayacak kadar YETERLİ olup olmadığını değerlendirmektir.
     Kullanıcının yanıtını "Altın Standart Yanıt" ile anlamsal olarak karşılaştır ve 0-100 arasında bir puan ver.
 
-    Değerlendirme Kuralları:
-    1. YETERLİLİK: Kullanıcının yanıtı, klinik olarak en önemli unsurları içeriyorsa tam puan ver. "sol/sağ" gibi pratik olmayan detay eksikliğinden puan KIRMA.
-    2. TETKİK: 'Tetkik' kategorisinde, altın standart 'gerekmez' diyorsa, kullanıcının da 'yok' veya 'gerekmez' demesine tam puan ver. Gereksiz tetkik istemesinden puan kır.
-    3. DOZAJ: 'Dozaj' kategorisinde, ilacın adından ziyade dozun, sıklığın ve uygulama şeklinin doğruluğuna odaklan.
-
+{JUDGE_RULES}
     Yanıtını SADECE şu JSON formatında ver:
     {{ "score": <0-100 arası sayı>, "reasoning": "<1 cümlelik Türkçe gerekçe>" }}
     ---
@@ -194,15 +615,106 @@ def get_semantic_score(user_answer, gold_standard_answer, category):
     ---
     """
     try:
-        response = model.generate_content(prompt)
-        result = json.loads(response.text)
+        request = JudgeRequest('single', [(CATEGORY_KEYS.get(category, category), category,
+                                           user_answer, gold_standard_answer)])
+        response_text = call_judge(backend, prompt, request, category)
+        result = json.loads(response_text)
         score = int(result.get("score", 0))
         reasoning = result.get("reasoning", "Gerekçe alınamadı.")
-        return score, {"reason": reasoning, "raw": response.text}
+        details = {"reason": reasoning, "raw": response_text}
+        verdict_cache.set(user_answer, gold_standard_answer, category, JUDGE_MODEL_NAME, score, details)
+        return score, details
+    except (JudgeUnavailable, ReplayMiss):
+        # Geçici hata veya replay ıskası: skor 0 olarak kaydedilmemeli
+        raise
     except Exception as e:
-        print(f"Gemini API hatası ({category}): {e}")
+        if isinstance(e, (ValueError, TypeError)):
+            record_judge_error(category, e)  # Yanıt ayrıştırılamadı (API hataları guard'da sayılır)
+        print(f"Hakem LLM hatası ({category}): {e}")
         return 0, {"reason": f"API Hatası: {e}", "raw": str(e)}
 
+def get_batched_scores(answers, gold_standard, known=None):
+    """
+    Dört kategoriyi (tanı, tetkik, tedavi, dozaj) tek bir hakem LLM isteğiyle puanlar.
+    'answers' kategori anahtarından kullanıcı yanıtına, 'gold_standard' ise
+    altın standart JSON'una (tanı, tetkik, ...) karşılık gelir.
+    Başarılı olursa {kategori: (score, {"reason": ..., "raw": ...})} ve ham yanıt
+    metnini döndürür; istek başarısız olur veya yanıt ayrıştırılamazsa (None, hata) döner.
+    Koşullu puanlama (tetkik/dozaj) burada UYGULANMAZ, çağıran taraf uygular.
+    Hakem geçici olarak ulaşılamazsa JudgeUnavailable, replay ıskasında ReplayMiss fırlatılır.
+    Önbellekte kararı bulunan ve 'known' ile verilen (ör. ön puanlayıcının
+    puanladığı) kategoriler isteğe dahil edilmez.
+    """
+    scores = dict(known or {})
+    for key, (label, gold_key) in SCORING_CATEGORIES.items():
+        if key in scores:
+            continue
+        cached = verdict_cache.get(answers.get(key), gold_standard.get(gold_key, ''), label,
+                                   JUDGE_MODEL_NAME, prompt_kind='batch')
+        if cached is not None:
+            scores[key] = cached
+    pending = [key for key in SCORING_CATEGORIES if key not in scores]
+    if not pending:
+        return scores, None
+
+    backend = get_judge_backend()
+    if not backend:
+        return None, "Model not loaded."
+
+    sections = []
+    for key in pending:
+        label, gold_key = SCORING_CATEGORIES[key]
+        sections.append(f"""    [{key}] {label}
+    Altın Standart Yanıt ({label}): "{gold_standard.get(gold_key, '')}"
+    Kullanıcı Yanıtı ({label}): "{answers.get(key)}"
+    ---""")
+    answer_format = ", ".join(
+        f'"{key}": {{ "score": <0-100 arası sayı>, "reasoning": "<1 cümlelik Türkçe gerekçe>" }}'
+        for key in pending
+    )
+    sections_text = "\n".join(sections)
+
+    prompt = f"""
+    Sen, bir hekimin vaka yanıtını bölüm bölüm değerlendiren, pragmatik ve deneyimli bir klinik uzmansın.
+    Temel görevin, her bölüm için "Kullanıcı Yanıtı"nın, hastanın doğru ve güvenli bir şekilde tedavi edilmesini sağlayacak kadar YETERLİ olup olmadığını değerlendirmektir.
+    Her bölümde kullanıcının yanıtını o bölümün "Altın Standart Yanıt"ı ile anlamsal olarak karşılaştır ve 0-100 arasında bir puan ver.
+    Her bölümü diğerlerinden BAĞIMSIZ olarak puanla.
+
+{JUDGE_RULES}
+    Yanıtını SADECE şu JSON formatında ver:
+    {{ {answer_format} }}
+    ---
+{sections_text}
+    """
+    try:
+        request = JudgeRequest('batch', [
+            (key, SCORING_CATEGORIES[key][0], answers.get(key), gold_standard.get(SCORING_CATEGORIES[key][1], ''))
+            for key in pending
+        ])
+        response_text = call_judge(backend, prompt, request, 'batch')
+        result = json.loads(response_text)
+        judged = {}
+        for key in pending:
+            item = result[key]
+            judged[key] = (
+                int(item["score"]),
+                {"reason": item.get("reasoning", "Gerekçe alınamadı."),
+                 "raw": json.dumps(item, ensure_ascii=False)}
+            )
+        for key, (score, details) in judged.items():
+            label, gold_key = SCORING_CATEGORIES[key]
+            verdict_cache.set(answers.get(key), gold_standard.get(gold_key, ''), label,
+                              JUDGE_MODEL_NAME, score, details, prompt_kind='batch')
+        scores.update(judged)
+        return scores, response_text
+    except (JudgeUnavailable, ReplayMiss):
+        raise
+    except Exception as e:
+        if isinstance(e, (ValueError, TypeError, KeyError)):
+            record_judge_error('batch', e)
+        print(f"Hakem LLM toplu puanlama hatası: {e}")
+        return None, str(e)
+
 def admin_required(f):
     """Sadece yönetici kullanıcıların erişebileceği sayfalar için decorator."""
     @wraps(f)
@@ -232,17 +744,18 @@ def research_setup_required(f):
 @login_required
 @research_setup_required
 def index():
-    """Ana sayfa, vakaları rastgele sıralanmış olarak listeler."""
-    cases = Case.query.all()
-    random.shuffle(cases)
-    return render_template('index.html', cases=cases)
+    """Ana sayfa, vakaları en az yanıtlanandan başlayarak, kullanıcıya özgü sabit bir rastgele sırayla listeler."""
+    from case_listing import list_cases, user_seed
+    listing = list_cases(user_seed(current_user.id), page=request.args.get('page', 1, type=int),
+                         per_page=app.config['CASES_PER_PAGE'])
+    return render_template('index.html', cases=listing.items, listing=listing)
 
 @app.route('/case/<int:case_id>', methods=['GET', 'POST'])
 @login_required
 @research_setup_required
 def case_detail(case_id):
     """Vaka detaylarını gösterir, kullanıcıdan yanıt alır ve puanlama görevini kuyruğa ekler."""
-    case = db.session.get(Case, case_id)
+    case = case_cache.get(case_id)
     if not case:
         flash("Vaka bulunamadı.", "danger")
         return redirect(url_for('index'))
@@ -271,21 +784,16 @@ def case_detail(case_id):
             # Skorlar varsayılan olarak 0.0 olacak
         )
         db.session.add(new_response)
-        db.session.commit()
-        
+        db.session.flush()
+
         # ASENKRON PUANLAMA
-        # Puanlama görevini Redis kuyruğuna ekle
-        if queue:
-            try:
-                from tasks import score_and_store_response
-                queue.enqueue(score_and_store_response, new_response.id)
-                app.logger.info(f"Response {new_response.id} puanlama için kuyruğa eklendi.")
-            except Exception as e:
-                app.logger.error(f"Redis kuyruğuna eklenirken hata: {e}")
-                flash("Yanıtınız kaydedildi ancak puanlama başlatılamadı. Lütfen yöneticiye başvurun.", "danger")
-        else:
-            app.logger.warning("Redis bağlantısı yok. Asenkron puanlama atlandı.")
-            flash("Yanıtınız kaydedildi ancak puanlama sistemi aktif değil.", "warning")
+        # Puanlama isteği yanıtla AYNI işlemde giden kutusuna yazılır; worker'daki
+        # dağıtıcı (bkz. outbox.py) kutuyu toplu olarak Redis kuyruğuna aktarır.
+        # Böylece istek Redis'i beklemez ve Redis erişilemezken gelen yanıtlar kaybolmaz.
+        db.session.add(ScoringOutbox(response_id=new_response.id, user_id=current_user.id, case_id=case_id))
+        db.session.commit()
+        if conn is None:
+            app.logger.warning("Redis bağlantısı yok. Yanıt %s puanlama kutusunda bekliyor.", new_response.id)
 
         # Kullanıcıyı sonuçlar sayfasına yönlendir
         # (Sonuçlar hemen görünmeyebilir, tasks.py'nin çalışması gerekir)
@@ -316,7 +824,57 @@ def results(response_id):
     user_response.treatment_reasoning = reasons.get('treatment', 'Puanlama bekleniyor...')
     user_response.dosage_reasoning = reasons.get('dosage', 'Puanlama bekleniyor...')
 
-    return render_template('results.html', user_response=user_response)
+    # Puanlama henüz bitmediyse sayfa skorları SSE ile (Redis yoksa veya akış
+    # sınırı doluysa durum uç noktasını sorgulayarak) bekler
+    pending = user_response.judge_version is None and 'error' not in reasons
+    case_content = case_cache.get(user_response.case_id)
+    return render_template('results.html', user_response=user_response, case_content=case_content,
+                           llm_references=llm_references(case_content) if case_content else [],
+                           pending=pending, live_scores=pending and score_events.available)
+
+@app.route('/results/<int:response_id>/events')
+@login_required
+def results_events(response_id):
+    """
+    Yanıtın skorlarını server-sent events olarak iletir. Puanlama zaten
+    bittiyse skorlar hemen gönderilir; bitmediyse worker'ın yayınlayacağı
+    olay beklenir (bkz. live_scores.py). Redis yoksa 204 döner ve tarayıcı yeniden bağlanmaz.
+    """
+    user_response = db.session.get(UserResponse, response_id)
+    if not user_response:
+        return Response(status=404)
+    if user_response.user_id != current_user.id and not current_user.is_admin:
+        return Response(status=403)
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    reasons = user_response.score_reasons or {}
+    if user_response.judge_version is not None or 'error' in reasons:
+        status = 'error' if 'error' in reasons else 'scored'
+        return Response(format_sse(score_event(user_response, status)), mimetype='text/event-stream', headers=headers)
+    if not score_events.available:
+        return Response(status=204)
+    # Akış, istek bağlamı (ve veritabanı oturumu) kapandıktan sonra sürer
+    return Response(score_events.stream(response_id), mimetype='text/event-stream', headers=headers)
+
+@app.route('/results/<int:response_id>/status')
+@login_required
+def results_status(response_id):
+    """
+    Yanıtın puanlama durumunu JSON olarak döndürür (SSE akış sınırı doluysa veya
+    Redis yoksa sonuç sayfası bu uç noktayı artan aralıklarla sorgular).
+    """
+    user_response = db.session.get(UserResponse, response_id)
+    if not user_response:
+        return jsonify({'error': 'Yanıt bulunamadı.'}), 404
+    if user_response.user_id != current_user.id and not current_user.is_admin:
+        return jsonify({'error': 'Yetkisiz erişim.'}), 403
+
+    reasons = user_response.score_reasons or {}
+    if user_response.judge_version is not None or 'error' in reasons:
+        return jsonify(score_event(user_response, 'error' if 'error' in reasons else 'scored'))
+    last = score_events.last(response_id)
+    status = last['status'] if last and last.get('status') == 'deferred' else 'pending'
+    return jsonify({'status': status, 'response_id': response_id})
 
 # --- 8. KULLANICI YÖNETİMİ VE ARAŞTIRMA AKIŞI ROUTE'LARI ---
 
@@ -406,10 +964,150 @@ def my_responses():
 @admin_required
 def admin_panel():
     """Yönetici paneli ana sayfası."""
-    return render_template('admin.html', 
-                           user_count=User.query.count(), 
-                           response_count=UserResponse.query.count(), 
-                           case_count=Case.query.count())
+    from rescore import stalled_run_ids
+    # Yanıt sayısı user_response taranmadan skor özetinden okunur (yalnızca puanlanmış yanıtlar)
+    overall = db.session.get(ScoreAggregate, ('all', 'all'))
+    # Küçük tablolar: iki sayım tek sorguda
+    user_count, case_count = db.session.execute(db.select(
+        db.select(db.func.count(User.id)).scalar_subquery(),
+        db.select(db.func.count(Case.id)).scalar_subquery(),
+    )).one()
+    rescore_runs = RescoreRun.query.order_by(RescoreRun.id.desc()).limit(5).all()
+    return render_template('admin.html',
+                           user_count=user_count,
+                           response_count=overall.n if overall else 0,
+                           case_count=case_count,
+                           verdict_stats=verdict_cache.stats(),
+                           rescore_runs=rescore_runs,
+                           stalled_runs=stalled_run_ids([run.id for run in rescore_runs if run.status != 'done']))
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """
+    Prometheus metrikleri. METRICS_TOKEN tanımlıysa 'Authorization: Bearer <token>'
+    başlığı gerekir (Prometheus oturum açamadığı için login_required kullanılmaz).
+    """
+    token = app.config['METRICS_TOKEN']
+    if token and request.headers.get('Authorization') != f"Bearer {token}":
+        return Response(status=401)
+    payload, content_type = metrics_payload()
+    return Response(payload, mimetype=content_type)
+
+@app.route('/admin/stats')
+@login_required
+@admin_required
+def admin_stats():
+    """Vaka, unvan ve deneyim aralığına göre skor özetlerini (artımlı özet tablosundan) gösterir."""
+    from aggregates import DIMENSIONS, get_aggregates
+    case_titles = dict(db.session.execute(db.select(Case.id, Case.title)).all())
+    aggregates = {dimension: get_aggregates(dimension) for dimension in DIMENSIONS}
+    return render_template('stats.html', aggregates=aggregates, case_titles=case_titles)
+
+@app.route('/admin/api/stats/<dimension>')
+@login_required
+@admin_required
+def admin_stats_api(dimension):
+    """Bir boyuttaki skor özetlerini JSON olarak döndürür (canlı paneller için)."""
+    from aggregates import DIMENSIONS, get_aggregates
+    if dimension not in DIMENSIONS:
+        return jsonify({"error": f"Bilinmeyen boyut: {dimension}"}), 404
+    return jsonify(get_aggregates(dimension))
+
+@app.route('/admin/api/responses/<int:response_id>/scoring_runs')
+@login_required
+@admin_required
+def admin_scoring_runs_api(response_id):
+    """Bir yanıtın puanlama geçmişini (hakem ham yanıtları dahil) arşivden açarak JSON olarak döndürür."""
+    user_response = db.session.get(UserResponse, response_id)
+    if not user_response:
+        return jsonify({"error": "Yanıt bulunamadı."}), 404
+    judge_version = request.args.get('judge_version')
+    runs = user_response.scoring_runs
+    if judge_version:
+        runs = runs.filter_by(judge_version=judge_version)
+    return jsonify([
+        {'id': run.id, 'judge_version': run.judge_version, 'created_at': run.created_at.isoformat(), 'raw': run.raw}
+        for run in runs
+    ])
+
+@app.route('/admin/stats/rebuild', methods=['POST'])
+@login_required
+@admin_required
+def rebuild_stats():
+    """Skor özetlerini tüm yanıtlardan yeniden hesaplar."""
+    from aggregates import rebuild_aggregates
+    rebuild_aggregates()
+    flash('Skor özetleri yeniden hesaplandı.', 'success')
+    return redirect(url_for('admin_stats'))
+
+@app.route('/admin/analytics')
+@login_required
+@admin_required
+def admin_analytics():
+    """Katılımcılar ile LLM referans yanıtlarının karşılaştırmalı analiz raporu (bkz. analytics.py)."""
+    try:
+        from analytics import GROUP_DIMENSIONS, build_report
+    except ImportError:
+        flash("Analiz raporu için 'numpy' ve 'pandas' paketleri kurulu olmalıdır.", 'danger')
+        return redirect(url_for('admin_panel'))
+    return render_template('analytics.html', report=build_report(), group_titles=GROUP_DIMENSIONS)
+
+@app.route('/admin/analytics/score_references', methods=['POST'])
+@login_required
+@admin_required
+def score_llm_references():
+    """LLM referans yanıtlarının puanlamasını kuyruğa alır (Redis yoksa komut satırı gerekir)."""
+    try:
+        from analytics import enqueue_llm_scoring
+    except ImportError:
+        flash("Analiz raporu için 'numpy' ve 'pandas' paketleri kurulu olmalıdır.", 'danger')
+        return redirect(url_for('admin_panel'))
+    if enqueue_llm_scoring(force=bool(request.form.get('force'))):
+        flash('LLM referans yanıtlarının puanlaması kuyruğa alındı.', 'info')
+    else:
+        flash("Puanlama kuyruğu (Redis) yapılandırılmamış. LLM yanıtlarını komut satırından puanlayın: "
+              "python analytics.py --score-references", 'warning')
+    return redirect(url_for('admin_analytics'))
+
+@app.route('/admin/rescore', methods=['POST'])
+@login_required
+@admin_required
+def start_rescore_run():
+    """Tüm yanıtların (veya seçili vakaların) toplu yeniden puanlamasını başlatır."""
+    from rescore import RescoreQueueUnavailable, find_active_run, start_rescore
+    try:
+        case_ids = [int(x) for x in request.form.get('case_ids', '').replace(',', ' ').split()]
+    except ValueError:
+        flash('Vaka ID listesi yalnızca sayılardan oluşmalıdır.', 'danger')
+        return redirect(url_for('admin_panel'))
+    active = find_active_run(case_ids or None)
+    if active is not None:
+        flash(f'Bu vakaları kapsayan bir yeniden puanlama zaten sürüyor (Çalıştırma #{active.id}).', 'warning')
+        return redirect(url_for('admin_panel'))
+    try:
+        run = start_rescore(case_ids or None)
+    except RescoreQueueUnavailable as e:
+        flash(str(e), 'warning')
+        return redirect(url_for('admin_panel'))
+    flash(f'Yeniden puanlama başlatıldı (Çalıştırma #{run.id}, {run.total} yanıt).', 'success')
+    return redirect(url_for('admin_panel'))
+
+@app.route('/admin/rescore/<int:run_id>/resume', methods=['POST'])
+@login_required
+@admin_required
+def resume_rescore_run(run_id):
+    """Yarım kalmış bir yeniden puanlama çalıştırmasını kaldığı yerden sürdürür."""
+    from rescore import RescoreQueueUnavailable, resume_rescore
+    try:
+        run = resume_rescore(run_id)
+    except RescoreQueueUnavailable as e:
+        flash(str(e), 'warning')
+        return redirect(url_for('admin_panel'))
+    if run is None:
+        flash('Çalıştırma bulunamadı.', 'danger')
+    else:
+        flash(f'Çalıştırma #{run_id} sürdürülüyor.', 'info')
+    return redirect(url_for('admin_panel'))
 
 @app.route('/admin/upload_csv', methods=['POST'])
 @login_required
@@ -423,118 +1121,77 @@ def upload_csv():
 @login_required
 @admin_required
 def upload_json():
-    """JSON formatında toplu vaka yükleme işlemi."""
+    """
+    JSON dizisi veya NDJSON biçiminde toplu vaka yükleme işlemi. Dosya akış
+    halinde ayrıştırılır ve tüm vakalar tek işlemde kaydedilir (bkz. case_import.py).
+    """
+    from case_import import CaseImportError, import_case_stream, format_errors
     json_text = request.form.get('json_text')
     json_file = request.files.get('json_file')
-    raw_data = None
-    
+
     if json_text:
-        raw_data = json_text
+        stream = io.StringIO(json_text)
     elif json_file and json_file.filename != '':
-        try:
-            raw_data = json_file.stream.read().decode("UTF8")
-        except Exception as e:
-            flash(f'Dosya okunurken hata: {e}', 'danger')
-            return redirect(url_for('admin_panel'))
-            
-    if not raw_data:
+        stream = io.TextIOWrapper(json_file.stream, encoding='utf-8-sig')
+    else:
         flash('Yüklenecek JSON verisi bulunamadı.', 'danger')
         return redirect(url_for('admin_panel'))
-        
+
     try:
-        cases_data = json.loads(raw_data)
-        if not isinstance(cases_data, list):
-            raise ValueError("JSON bir liste formatında olmalıdır: [...]")
-            
-        cases_added_count = 0
-        for case_obj in cases_data:
-            # Yeni Vaka oluştur
-            new_case = Case(
-                title=case_obj.get('title', 'Başlıksız Vaka'),
-                anamnesis=json.dumps(case_obj.get('anamnesis', {})),
-                physical_exam=json.dumps(case_obj.get('physical_exam', {})),
-                # AI yanıtları için eski sütunları doldur (results.html uyumluluğu için)
-                chatgpt_response=json.dumps(case_obj.get('chatgpt_response', {})),
-                gemini_response=json.dumps(case_obj.get('gemini_response', {})),
-                deepseek_response=json.dumps(case_obj.get('deepseek_response', {}))
-            )
-            db.session.add(new_case)
-            db.session.commit() # Case'in ID alması için commit et
-
-            # ReferenceAnswer'ları oluştur (tasks.py'nin ihtiyaç duyduğu)
-            ref_answers = [
-                ReferenceAnswer(case_id=new_case.id, source='gold', content=case_obj.get('gold_standard_response', {})),
-                ReferenceAnswer(case_id=new_case.id, source='chatgpt', content=case_obj.get('chatgpt_response', {})),
-                ReferenceAnswer(case_id=new_case.id, source='gemini', content=case_obj.get('gemini_response', {})),
-                ReferenceAnswer(case_id=new_case.id, source='deepseek', content=case_obj.get('deepseek_response', {}))
-            ]
-            db.session.add_all(ref_answers)
-            cases_added_count += 1
-            
-        db.session.commit()
-        flash(f'{cases_added_count} yeni vaka ve referans yanıtları JSON üzerinden yüklendi.', 'success')
+        result = import_case_stream(stream)
+    except (CaseImportError, UnicodeDecodeError) as e:
+        flash(f'Dosya okunurken hata: {e}', 'danger')
+        return redirect(url_for('admin_panel'))
     except Exception as e:
-        db.session.rollback()
         flash(f'Vakalar kaydedilirken hata: {e}', 'danger')
-        
+        return redirect(url_for('admin_panel'))
+
+    if result.error_count:
+        flash(f'{result.error_count} hatalı vaka bulundu, hiçbir vaka kaydedilmedi.', 'danger')
+        for line in format_errors(result.errors[:10]):
+            flash(line, 'danger')
+    elif result.imported == 0:
+        flash('Yüklenecek JSON verisi bulunamadı.', 'danger')
+    else:
+        flash(f'{result.imported} yeni vaka ve referans yanıtları JSON üzerinden yüklendi.', 'success')
     return redirect(url_for('admin_panel'))
 
 @app.route('/admin/export_csv')
 @login_required
 @admin_required
 def export_csv():
-    """Tüm yanıt veri setini CSV formatında indirir."""
-    output = io.StringIO()
-    writer = csv.writer(output)
-    
-    # Kapsamlı başlık satırı
-    header = [
-        'yanit_id', 'kullanici_id', 'kullanici_unvan', 'kullanici_deneyim_yil', 
-        'vaka_id', 'vaka_baslik', 'yanit_suresi_saniye', 'yanit_tarihi',
-        'kullanici_tani', 'kullanici_ayirici_tani', 'kullanici_tetkik', 
-        'kullanici_ilac_grubu', 'kullanici_etken_madde', 'kullanici_doz_notlari',
-        'tani_skoru', 'tetkik_skoru', 'tedavi_skoru', 'doz_skoru', 'final_skor',
-        'tani_gerekcesi', 'tetkik_gerekcesi', 'tedavi_gerekcesi', 'doz_gerekcesi',
-        'altin_standart_tani', 'altin_standart_tetkik', 'altin_standart_tedavi', 'altin_standart_doz',
-        'chatgpt_tani', 'chatgpt_tetkik', 'chatgpt_tedavi', 'chatgpt_doz',
-        'gemini_tani', 'gemini_tetkik', 'gemini_tedavi', 'gemini_doz',
-        'deepseek_tani', 'deepseek_tetkik', 'deepseek_tedavi', 'deepseek_doz'
-    ]
-    writer.writerow(header)
-    
-    for resp in UserResponse.query.all():
-        def clean_text(text):
-            return text.replace('\n', ' ').replace('\r', '') if text else ''
-            
-        # Gerekçeleri JSON'dan al
-        reasons = resp.score_reasons or {}
-        
-        # AI Yanıtlarını Case tablosundaki eski JSON string'lerinden al
-        chatgpt = parse_json_fields(resp.case.chatgpt_response)
-        gemini = parse_json_fields(resp.case.gemini_response)
-        deepseek = parse_json_fields(resp.case.deepseek_response)
-        
-        # Altın Standart yanıtı ReferenceAnswer tablosundan al
-        gold_ref = ReferenceAnswer.query.filter_by(case_id=resp.case_id, source='gold').first()
-        gold = gold_ref.content if gold_ref else {}
-        
-        row = [
-            resp.id, resp.author.id, resp.author.profession, resp.author.experience,
-            resp.case.id, resp.case.title, resp.duration_seconds, resp.created_at.isoformat(),
-            clean_text(resp.user_diagnosis), clean_text(resp.user_differential), clean_text(resp.user_tests),
-            resp.user_drug_class, resp.user_active_ingredient, clean_text(resp.user_dosage_notes),
-            resp.diagnosis_score, resp.investigation_score, resp.treatment_score, resp.dosage_score, resp.final_score,
-            clean_text(reasons.get('diagnosis')), clean_text(reasons.get('tests')),
-            clean_text(reasons.get('treatment')), clean_text(reasons.get('dosage')),
-            gold.get('tanı'), gold.get('tetkik'), gold.get('tedavi_plani'), gold.get('dozaj'),
-            chatgpt.get('tanı'), chatgpt.get('tetkik'), chatgpt.get('tedavi_plani'), chatgpt.get('dozaj'),
-            gemini.get('tanı'), gemini.get('tetkik'), gemini.get('tedavi_plani'), gemini.get('dozaj'),
-            deepseek.get('tanı'), deepseek.get('tetkik'), deepseek.get('tedavi_plani'), deepseek.get('dozaj')
-        ]
-        writer.writerow(row)
-        
-    output.seek(0)
-    return Response(output, mimetype="text/csv", headers={"Content-Disposition": "attachment;filename=LLM_Research_Dataset_Final.csv"})
+    """Tüm yanıt veri setini CSV formatında, satırları akış halinde göndererek indirir."""
+    from export import generate_csv
+    return Response(stream_with_context(generate_csv()), mimetype="text/csv",
+                    headers={"Content-Disposition": "attachment;filename=LLM_Research_Dataset_Final.csv"})
+
+@app.route('/admin/export')
+@login_required
+@admin_required
+def export_dataset():
+    """Veri setini seçilen biçimde (csv, parquet, feather), sütun ve tarih süzgeçleriyle indirir."""
+    from export import EXPORT_FORMATS, parse_export_options, generate_csv, export_columnar_file
+    file_format = request.args.get('format', 'csv')
+    if file_format not in EXPORT_FORMATS:
+        flash(f'Desteklenmeyen dışa aktarım biçimi: {file_format}', 'danger')
+        return redirect(url_for('admin_panel'))
+    try:
+        options = parse_export_options(request.args)
+    except ValueError as e:
+        flash(f'Geçersiz dışa aktarım seçeneği: {e}', 'danger')
+        return redirect(url_for('admin_panel'))
+
+    mimetype, extension = EXPORT_FORMATS[file_format]
+    filename = f"LLM_Research_Dataset_Final.{extension}"
+    if file_format == 'csv':
+        return Response(stream_with_context(generate_csv(**options)), mimetype=mimetype,
+                        headers={"Content-Disposition": f"attachment;filename={filename}"})
+    try:
+        data = export_columnar_file(file_format, **options)
+    except ImportError:
+        flash("Parquet/Feather dışa aktarımı için 'pyarrow' paketi kurulu olmalıdır.", 'danger')
+        return redirect(url_for('admin_panel'))
+    return send_file(data, mimetype=mimetype, as_attachment=True, download_name=filename)
 
 # --- 10. VERİTABANI BAŞLATMA (SEEDING) ---
 
@@ -566,34 +1223,17 @@ def seed_database():
         }
     ]
     
+    # Vakalar, JSON yüklemesiyle aynı toplu içe aktarım yoluyla (tek işlemde) eklenir
+    from case_import import import_cases, format_errors
     try:
-        for case_data in initial_cases_data:
-            # Önce Case'i oluştur
-            new_case = Case(
-                title=case_data.get("title"),
-                anamnesis=json.dumps(case_data.get("anamnesis", {})),
-                physical_exam=json.dumps(case_data.get("physical_exam", {})),
-                chatgpt_response=json.dumps(case_data.get("chatgpt_response", {})),
-                gemini_response=json.dumps(case_data.get("gemini_response", {})),
-                deepseek_response=json.dumps(case_data.get("deepseek_response", {}))
-            )
-            db.session.add(new_case)
-            db.session.commit() # ID alması için
-            
-            # Sonra ilişkili ReferenceAnswer'ları oluştur
-            ref_answers = [
-                ReferenceAnswer(case_id=new_case.id, source='gold', content=case_data.get('gold_standard_response', {})),
-                ReferenceAnswer(case_id=new_case.id, source='chatgpt', content=case_data.get('chatgpt_response', {})),
-                ReferenceAnswer(case_id=new_case.id, source='gemini', content=case_data.get('gemini_response', {})),
-                ReferenceAnswer(case_id=new_case.id, source='deepseek', content=case_data.get('deepseek_response', {}))
-            ]
-            db.session.add_all(ref_answers)
-            
-        db.session.commit()
-        print(f"{len(initial_cases_data)} başlangıç vakası ve referansları eklendi.")
+        result = import_cases(initial_cases_data)
     except Exception as e:
-        db.session.rollback()
         print(f"Seeding sırasında hata: {e}")
+        return
+    if result.error_count:
+        print("Seeding sırasında hata: " + "; ".join(format_errors(result.errors)))
+    else:
+        print(f"{result.imported} başlangıç vakası ve referansları eklendi.")
 
 # --- 11. UYGULAMAYI ÇALIŞTIRMA ---
 if __name__ == '__main__':
@@ -0,0 +1,397 @@
+# -*- coding: utf-8 -*-
+"""
+Uçtan uca yük ve performans ölçümü (benchmark).
+
+Uygulama, geçici bir SQLite veritabanı ve yerel hakem (JUDGE_BACKEND=fake) ile
+aynı süreç içinde çalıştırılır; ağ veya ücretli API çağrısı yapılmaz. İsteğe
+bağlı olarak Redis yerine 'fakeredis' (--fake-redis) veya yerel bir Redis
+(--redis-url) kullanılabilir. Üç aşama ölçülür:
+
+1. participants: N eşzamanlı katılımcı giriş yapar, onam/demografi adımlarını
+   tamamlar ve her biri K vaka için vaka sayfasını açar, yanıt gönderir
+   (case_detail POST) ve sonuç sayfasını P kez yoklar.
+2. scoring: gönderilen yanıtlar WORKER_CONCURRENCY iş parçacığıyla doğrudan
+   score_and_store_response üzerinden puanlanır (RQ kuyruk yükü hariç).
+3. export: --rows kadar sentetik yanıt eklenir ve /admin/export_csv akışı okunur.
+
+Rapor; route bazında istek/saniye, p50/p99 gecikme, iş/saniye ve bellek
+tepe değerlerini içerir. --output ile JSON olarak kaydedilen sonuçlar
+--compare ile başka bir commit'in sonuçlarıyla karşılaştırılabilir; eşik
+aşılırsa çıkış kodu 1 olur.
+
+Kullanım:
+    python benchmark.py [--participants 20] [--cases-per-participant 3] [--polls 3]
+                        [--rows 10000] [--judge-latency 0.05] [--fake-redis]
+                        [--output sonuc.json] [--compare onceki.json] [--tolerance 0.2]
+"""
+
+import argparse
+import datetime
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+# Karşılaştırmada yüksek olması iyi olan metrikler (diğerleri süre/bellek: düşük olması iyi)
+HIGHER_IS_BETTER = ('requests_per_second', 'jobs_per_second', 'rows_per_second')
+
+
+def percentile(values, q):
+    """En yakın sıra (nearest-rank) yöntemiyle yüzdelik değer."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(q / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def peak_rss_mb():
+    """Sürecin şimdiye kadarki en yüksek yerleşik bellek kullanımı (MB)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True,
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class RouteTimer:
+    """Route bazında gecikme ve durum kodlarını toplar (iş parçacığı güvenli)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def request(self, client, route, method, url, **kwargs):
+        started = time.perf_counter()
+        response = client.open(url, method=method, **kwargs)
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.samples[route].append(elapsed)
+            if response.status_code >= 500:
+                self.errors[route] += 1
+        return response
+
+    def summary(self, wall_seconds):
+        routes = {}
+        for route, samples in sorted(self.samples.items()):
+            routes[route] = {
+                'count': len(samples),
+                'errors': self.errors[route],
+                'p50_ms': round(percentile(samples, 50) * 1000, 2),
+                'p99_ms': round(percentile(samples, 99) * 1000, 2),
+                'requests_per_second': round(len(samples) / wall_seconds, 2),
+            }
+        return routes
+
+
+def attach_redis(app_module, tasks_module, conn):
+    """Uygulamanın Redis kullanan bileşenlerini verilen bağlantıya bağlar (fakeredis için)."""
+    app_module.conn = conn
+    app_module._queues.clear()  # get_queue() yeni bağlantıyla yeniden oluşturur
+    app_module.pending_scoring.redis = conn
+    app_module.score_events.redis = conn
+    app_module.case_cache.redis = conn
+    app_module.verdict_cache.redis = conn
+    app_module.judge_single_flight.redis = conn
+    tasks_module.conn = conn
+
+
+def run_participant(app_module, timer, index, case_ids, cases_per_participant, polls, rng):
+    """Bir katılımcının giriş -> vaka yanıtı -> sonuç yoklama akışını çalıştırır."""
+    client = app_module.app.test_client()
+    timer.request(client, 'giris POST', 'POST', '/giris', data={'email': f'katilimci{index}@benchmark.local'})
+    timer.request(client, 'consent POST', 'POST', '/consent')
+    timer.request(client, 'demographics POST', 'POST', '/demographics',
+                  data={'profession': rng.choice(['Pratisyen', 'Uzman', 'Asistan']),
+                        'experience': rng.randint(0, 30)})
+    for case_id in rng.sample(case_ids, min(cases_per_participant, len(case_ids))):
+        timer.request(client, 'case_detail GET', 'GET', f'/case/{case_id}')
+        response = timer.request(client, 'case_detail POST', 'POST', f'/case/{case_id}', data={
+            'user_diagnosis': rng.choice(['Akut Otitis Media', 'Pnömoni', 'Viral enfeksiyon']),
+            'user_differential': 'Otitis eksterna, bronşiolit',
+            'user_tests': rng.choice(['gerekmez', 'Akciğer grafisi', 'Tam kan sayımı']),
+            'user_drug_class': 'Antibiyotik',
+            'user_active_ingredient': rng.choice(['Amoksisilin', 'Klaritromisin']),
+            'user_dosage_notes': rng.choice(['90 mg/kg/gün', 'Standart doz', '']),
+            'duration_seconds': rng.randint(30, 600),
+        })
+        location = response.headers.get('Location')
+        if response.status_code != 302 or not location:
+            continue
+        for _ in range(polls):
+            timer.request(client, 'results GET', 'GET', location)
+
+
+def seed_synthetic_responses(app_module, rows, seed, batch_size=10000):
+    """Dışa aktarım ölçümü için sentetik, puanlanmış yanıtları toplu olarak ekler."""
+    from sqlalchemy import insert, select
+    rng = random.Random(seed)
+    db, User, Case, UserResponse = app_module.db, app_module.User, app_module.Case, app_module.UserResponse
+    with app_module.app.app_context():
+        users = [{'email': f'sentetik{i}@benchmark.local', 'profession': rng.choice(['Pratisyen', 'Uzman']),
+                  'experience': rng.randint(0, 30), 'has_consented': True} for i in range(200)]
+        user_ids = db.session.scalars(insert(User).returning(User.id, sort_by_parameter_order=True), users).all()
+        case_ids = db.session.scalars(select(Case.id)).all()
+        now = datetime.datetime.now(datetime.timezone.utc)
+        for start in range(0, rows, batch_size):
+            batch = []
+            for i in range(start, min(rows, start + batch_size)):
+                scores = [float(rng.choice([0, 50, 70, 80, 90, 100])) for _ in range(4)]
+                batch.append({
+                    'case_id': rng.choice(case_ids), 'user_id': rng.choice(user_ids),
+                    'user_diagnosis': f'Tanı {i % 97}', 'user_differential': 'Ayırıcı tanı\nikinci satır',
+                    'user_tests': 'gerekmez', 'user_drug_class': 'Antibiyotik',
+                    'user_active_ingredient': 'Amoksisilin', 'user_dosage_notes': '90 mg/kg/gün',
+                    'duration_seconds': rng.randint(30, 600), 'created_at': now,
+                    'diagnosis_score': scores[0], 'investigation_score': scores[1],
+                    'treatment_score': scores[2], 'dosage_score': scores[3],
+                    'final_score': sum(scores) / 4,
+                    'score_reasons': {k: 'Sentetik gerekçe.' for k in ('diagnosis', 'tests', 'treatment', 'dosage')},
+                    'judge_version': 'benchmark',
+                })
+            db.session.execute(insert(UserResponse), batch)
+        db.session.commit()
+        return user_ids[0]
+
+
+def phase_participants(app_module, args, rng):
+    with app_module.app.app_context():
+        case_ids = app_module.db.session.scalars(app_module.db.select(app_module.Case.id)).all()
+    timer = RouteTimer()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.participants) as pool:
+        futures = [
+            pool.submit(run_participant, app_module, timer, i, case_ids, args.cases_per_participant, args.polls,
+                        random.Random(rng.random()))
+            for i in range(args.participants)
+        ]
+        for future in futures:
+            future.result()
+    wall = time.perf_counter() - started
+    return {'wall_seconds': round(wall, 3), 'routes': timer.summary(wall), 'peak_rss_mb': round(peak_rss_mb(), 1)}
+
+
+def phase_scoring(app_module, tasks_module):
+    with app_module.app.app_context():
+        UserResponse = app_module.UserResponse
+        response_ids = app_module.db.session.scalars(
+            app_module.db.select(UserResponse.id).where(UserResponse.judge_version.is_(None))
+        ).all()
+    concurrency = app_module.app.config['WORKER_CONCURRENCY']
+    latencies = []
+    lock = threading.Lock()
+
+    def job(response_id):
+        started = time.perf_counter()
+        tasks_module.score_and_store_response(response_id)
+        with lock:
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(job, response_ids))
+    wall = time.perf_counter() - started
+    with app_module.app.app_context():
+        scored = app_module.db.session.scalar(
+            app_module.db.select(app_module.db.func.count(UserResponse.id))
+            .where(UserResponse.id.in_(response_ids), UserResponse.judge_version.isnot(None))
+        ) if response_ids else 0
+    return {
+        'jobs': len(response_ids),
+        'scored': scored,
+        'concurrency': concurrency,
+        'wall_seconds': round(wall, 3),
+        'jobs_per_second': round(len(response_ids) / wall, 2) if wall else None,
+        'job_p50_ms': round(percentile(latencies, 50) * 1000, 2) if latencies else None,
+        'job_p99_ms': round(percentile(latencies, 99) * 1000, 2) if latencies else None,
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+    }
+
+
+def phase_export(app_module, args):
+    seed_started = time.perf_counter()
+    admin_id = seed_synthetic_responses(app_module, args.rows, args.seed)
+    seed_seconds = time.perf_counter() - seed_started
+    with app_module.app.app_context():
+        # Yönetici: ilk katılımcı (ilk kullanıcı otomatik olarak yöneticidir)
+        admin = app_module.db.session.scalar(
+            app_module.db.select(app_module.User).where(app_module.User.is_admin.is_(True))
+        )
+        admin_id = admin.id if admin else admin_id
+        total_rows = app_module.db.session.scalar(app_module.db.select(app_module.db.func.count(app_module.UserResponse.id)))
+    client = app_module.app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(admin_id)
+
+    if args.trace_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    response = client.get('/admin/export_csv', buffered=False)
+    first_byte = None
+    size = 0
+    for chunk in response.iter_encoded():
+        if first_byte is None:
+            first_byte = time.perf_counter() - started
+        size += len(chunk)
+    response.close()
+    wall = time.perf_counter() - started
+    traced_peak = None
+    if args.trace_memory:
+        traced_peak = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+        tracemalloc.stop()
+    return {
+        'rows': total_rows,
+        'seed_seconds': round(seed_seconds, 3),
+        'status': response.status_code,
+        'bytes': size,
+        'first_byte_ms': round((first_byte or 0) * 1000, 2),
+        'wall_seconds': round(wall, 3),
+        'rows_per_second': round(total_rows / wall, 2) if wall else None,
+        'traced_peak_mb': round(traced_peak, 1) if traced_peak is not None else None,
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+    }
+
+
+def flatten(results, prefix=''):
+    """İç içe sonuç sözlüğünü 'aşama.route.metrik' anahtarlı düz sözlüğe çevirir."""
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, name + '.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(current, baseline, tolerance):
+    """Karşılaştırılabilir metrikleri listeler; eşiği aşan gerilemelerin listesini döndürür."""
+    comparable = ('p50_ms', 'p99_ms', 'first_byte_ms', 'wall_seconds', 'peak_rss_mb', 'traced_peak_mb',
+                  *HIGHER_IS_BETTER)
+    current_flat, baseline_flat = flatten(current['phases']), flatten(baseline['phases'])
+    regressions = []
+    print(f"\nKarşılaştırma: {baseline.get('commit')} -> {current.get('commit')} (eşik %{tolerance * 100:.0f})")
+    for name in sorted(current_flat):
+        if not name.endswith(comparable) or name not in baseline_flat or not baseline_flat[name]:
+            continue
+        old, new = baseline_flat[name], current_flat[name]
+        change = (new - old) / old
+        worse = -change if name.endswith(HIGHER_IS_BETTER) else change
+        marker = ''
+        if worse > tolerance:
+            marker = '  <-- GERİLEME'
+            regressions.append(name)
+        print(f"  {name:55s} {old:>12} -> {new:>12} ({change:+.1%}){marker}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Yanıt gönderme, puanlama ve dışa aktarım için uçtan uca benchmark.")
+    parser.add_argument('--participants', type=int, default=20, help="Eşzamanlı katılımcı sayısı")
+    parser.add_argument('--cases-per-participant', type=int, default=3)
+    parser.add_argument('--polls', type=int, default=3, help="Yanıt başına sonuç sayfası yoklama sayısı")
+    parser.add_argument('--cases', type=int, default=20, help="Sentetik vaka sayısı")
+    parser.add_argument('--rows', type=int, default=10000, help="Dışa aktarım için sentetik yanıt sayısı")
+    parser.add_argument('--judge-latency', type=float, default=0.05, help="Fake hakem gecikmesi (sn)")
+    parser.add_argument('--judge-error-rate', type=float, default=0.0)
+    parser.add_argument('--concurrency', type=int, help="WORKER_CONCURRENCY (varsayılan: yapılandırma)")
+    parser.add_argument('--fake-redis', action='store_true', help="Redis yerine fakeredis kullan")
+    parser.add_argument('--redis-url', help="Yerel bir Redis sunucusu kullan")
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('--skip', action='append', default=[], choices=['participants', 'scoring', 'export'])
+    parser.add_argument('--trace-memory', action='store_true', help="Dışa aktarımda tracemalloc ile bellek tepe değerini ölç")
+    parser.add_argument('--output', help="Sonuçları JSON olarak kaydet")
+    parser.add_argument('--compare', help="Önceki bir JSON sonucuyla karşılaştır")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Gerileme eşiği (oran)")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='llm_research_benchmark_')
+    # Uygulama içe aktarılmadan ÖNCE ortam ayarlanmalıdır
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(workdir, 'benchmark.db')
+    os.environ['JUDGE_BACKEND'] = 'fake'
+    os.environ['FAKE_JUDGE_LATENCY'] = str(args.judge_latency)
+    os.environ['FAKE_JUDGE_LATENCY_JITTER'] = str(args.judge_latency / 4)
+    os.environ['FAKE_JUDGE_ERROR_RATE'] = str(args.judge_error_rate)
+    os.environ['FAKE_JUDGE_SEED'] = str(args.seed)
+    os.environ['VERDICT_CACHE_ENABLED'] = '0'  # Her çalıştırma hakem yükünü aynı şekilde ölçsün
+    os.environ['JUDGE_RPM'] = os.environ['JUDGE_TPM'] = str(10 ** 9)
+    if args.concurrency:
+        os.environ['WORKER_CONCURRENCY'] = str(args.concurrency)
+    if args.redis_url:
+        os.environ['REDIS_URL'] = args.redis_url
+    else:
+        os.environ.pop('REDIS_URL', None)
+
+    import app as app_module
+    import tasks as tasks_module
+    from case_import import import_cases
+
+    if args.fake_redis:
+        try:
+            import fakeredis
+        except ImportError:
+            sys.exit("HATA: --fake-redis için 'fakeredis' paketi kurulu olmalıdır.")
+        attach_redis(app_module, tasks_module, fakeredis.FakeRedis())
+
+    rng = random.Random(args.seed)
+    with app_module.app.app_context():
+        app_module.db.create_all()
+        result = import_cases([{
+            'title': f'Benchmark Vakası {i}',
+            'anamnesis': {'Hasta': f'{i % 10 + 1} yaşında.', 'Şikayet': 'Ateş ve öksürük.'},
+            'physical_exam': {'Bulgu': 'Krepitan raller.'},
+            'gold_standard_response': {'tanı': 'Pnömoni', 'tetkik': 'Akciğer grafisi',
+                                       'tedavi_plani': 'Oral antibiyoterapi', 'dozaj': 'Yüksek doz Amoksisilin'},
+            'chatgpt_response': {'tanı': 'Pnömoni'}, 'gemini_response': {'tanı': 'Pnömoni'},
+            'deepseek_response': {'tanı': 'Pnömoni'},
+        } for i in range(args.cases)])
+        if result.error_count:
+            sys.exit(f"HATA: Benchmark vakaları eklenemedi: {result.errors}")
+
+    phases = {}
+    if 'participants' not in args.skip:
+        print(f"[participants] {args.participants} katılımcı x {args.cases_per_participant} vaka...")
+        phases['participants'] = phase_participants(app_module, args, rng)
+    if 'scoring' not in args.skip:
+        print("[scoring] Bekleyen yanıtlar puanlanıyor...")
+        phases['scoring'] = phase_scoring(app_module, tasks_module)
+    if 'export' not in args.skip:
+        print(f"[export] {args.rows} sentetik yanıt ile CSV dışa aktarımı...")
+        phases['export'] = phase_export(app_module, args)
+
+    results = {
+        'commit': git_commit(),
+        'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'params': {k: v for k, v in vars(args).items() if k not in ('output', 'compare')},
+        'phases': phases,
+    }
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get('params') != results['params']:
+            print("UYARI: Karşılaştırılan çalıştırmaların parametreleri farklı.")
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+Ayrıştırılmış vaka içerikleri için süreç içi önbellek.
+
+Case tablosundaki anamnez ve fizik muayene JSON metni olarak saklanır;
+referans yanıtlar (altın standart ve LLM yanıtları) ayrı bir tablodadır. Vakalar
+yüklendikten sonra değişmediği için her vaka bir kez okunup ayrıştırılır ve
+süreç belleğinde (web ve worker süreçlerinin her birinde) tutulur.
+
+Önbellek sürümlüdür: yeni vakalar yazıldığında invalidate() Redis'teki sürüm
+sayacını artırır. Diğer süreçler sürümü en fazla 'check_interval' saniyede bir
+kontrol eder ve sürüm değiştiyse yerel kopyalarını atar. Redis yoksa sürüm
+yalnızca süreç içinde tutulur. Toplam vaka sayısı (ana sayfa sayfalaması
+için) da aynı sürümle saklanır.
+
+Döndürülen CaseContent nesneleri süreçler ve istekler arasında paylaşılır;
+çağıranlar içindeki sözlükleri DEĞİŞTİRMEMELİDİR.
+"""
+
+import json
+import threading
+import time
+from collections import namedtuple
+
+from redis.exceptions import RedisError
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+CaseContent = namedtuple('CaseContent', ['id', 'title', 'anamnesis', 'physical_exam', 'references'])
+
+GOLD_SOURCE = 'gold'
+
+# Karşılaştırma tablosunda bilinen LLM kaynaklarının görünen adları ve sırası.
+# Listede olmayan kaynaklar kendi adlarıyla, alfabetik sırayla sona eklenir.
+LLM_SOURCE_LABELS = {'chatgpt': 'ChatGPT', 'gemini': 'Gemini', 'deepseek': 'Deepseek'}
+
+
+def _parse(data):
+    try:
+        return json.loads(data)
+    except (json.JSONDecodeError, TypeError):
+        return {}
+
+
+def llm_references(content):
+    """Vakanın LLM referans yanıtları (altın standart hariç): [(kaynak, görünen ad, içerik), ...]."""
+    known = list(LLM_SOURCE_LABELS)
+    sources = sorted((source for source in content.references if source != GOLD_SOURCE),
+                     key=lambda source: (known.index(source) if source in known else len(known), source))
+    return [(source, LLM_SOURCE_LABELS.get(source, source), content.references[source]) for source in sources]
+
+
+class CaseCache:
+    """Vaka id'sine göre ayrıştırılmış vaka içeriği ve referans yanıtları tutar."""
+
+    VERSION_KEY = 'case_cache:version'
+
+    def __init__(self, redis_conn, db, case_model, reference_model, check_interval=5.0):
+        self.redis = redis_conn
+        self.db = db
+        self.case_model = case_model
+        self.reference_model = reference_model
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._total = None
+        self._version = None
+        self._checked_at = 0.0
+
+    # --- Sürüm yönetimi ---
+
+    def _remote_version(self):
+        if self.redis is None:
+            return self._version
+        try:
+            return int(self.redis.get(self.VERSION_KEY) or 0)
+        except RedisError as e:
+            print(f"UYARI: Vaka önbelleği sürümü okunamadı: {e}")
+            return self._version
+
+    def _ensure_fresh(self):
+        """Sürüm en son kontrolden bu yana değiştiyse yerel kopyaları atar."""
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return
+        version = self._remote_version()
+        with self._lock:
+            if version != self._version:
+                self._entries = {}
+                self._total = None
+                self._version = version
+            self._checked_at = now
+
+    def invalidate(self):
+        """Tüm süreçlerdeki önbelleği geçersiz kılar (yeni vakalar yazıldıktan sonra çağrılır)."""
+        version = None
+        if self.redis is not None:
+            try:
+                version = self.redis.incr(self.VERSION_KEY)
+            except RedisError as e:
+                print(f"UYARI: Vaka önbelleği sürümü artırılamadı: {e}")
+        with self._lock:
+            self._entries = {}
+            self._total = None
+            self._version = version if version is not None else (self._version or 0) + 1
+            self._checked_at = time.monotonic()
+
+    # --- Okuma ---
+
+    def _load(self, case_ids):
+        """Verilen vakaları iki sorguda okur ve ayrıştırır: {case_id: CaseContent}."""
+        loaded = {}
+        with Session(self.db.engine) as session:
+            references = self.reference_model.load_many(session, case_ids)
+            for row in session.execute(
+                select(self.case_model.id, self.case_model.title, self.case_model.anamnesis,
+                       self.case_model.physical_exam)
+                .where(self.case_model.id.in_(case_ids))
+            ):
+                loaded[row.id] = CaseContent(
+                    id=row.id,
+                    title=row.title,
+                    anamnesis=_parse(row.anamnesis),
+                    physical_exam=_parse(row.physical_exam),
+                    references=references[row.id],
+                )
+        return loaded
+
+    def get_many(self, case_ids):
+        """Vakaları döndürür; önbellekte olmayanlar tek seferde yüklenir. Bulunamayanlar sonuçta yer almaz."""
+        self._ensure_fresh()
+        with self._lock:
+            entries = self._entries
+        missing = [case_id for case_id in set(case_ids) if case_id not in entries]
+        if missing:
+            loaded = self._load(missing)
+            with self._lock:
+                # Yükleme sırasında önbellek geçersiz kılındıysa eski veriyi geri yazma
+                if self._entries is entries:
+                    self._entries.update(loaded)
+            entries = {**entries, **loaded}
+        return {case_id: entries[case_id] for case_id in case_ids if case_id in entries}
+
+    def count(self):
+        """Toplam vaka sayısı; sürüm değişene kadar yeniden sayılmaz."""
+        self._ensure_fresh()
+        with self._lock:
+            total, version = self._total, self._version
+        if total is None:
+            with Session(self.db.engine) as session:
+                total = session.scalar(select(func.count(self.case_model.id)))
+            with self._lock:
+                # Sayım sırasında önbellek geçersiz kılındıysa eski değeri saklama
+                if self._version == version:
+                    self._total = total
+        return total
+
+    def get(self, case_id):
+        """Tek bir vakayı döndürür; vaka yoksa None."""
+        return self.get_many([case_id]).get(case_id)
+
+    def get_reference(self, case_id, source=GOLD_SOURCE):
+        """Vakanın verilen kaynaktaki referans yanıtını döndürür; yoksa None."""
+        content = self.get(case_id)
+        if content is None:
+            return None
+        return content.references.get(source)
@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+"""
+Toplu, tek işlemli (transactional) ve akış halinde vaka içe aktarımı.
+
+Girdi dosyası bütünüyle belleğe okunmaz; öğeler tek tek ayrıştırılır. İki
+biçim desteklenir:
+
+- JSON dizisi:  [ {...}, {...} ]
+- NDJSON:       her satırda bir vaka nesnesi
+
+Her öğe şemaya göre doğrulanır ve hatalar öğe numarasıyla (NDJSON'da satır
+numarası) raporlanır. Geçerli öğeler 'batch_size' büyüklüğünde gruplar halinde
+eklenir: vakalar tek bir çoklu INSERT ... RETURNING ile eklenip id'leri alınır,
+ardından referans yanıtları (altın standart ve her '<kaynak>_response' alanı,
+ör. chatgpt_response -> 'chatgpt') tek bir çoklu INSERT ile yazılır. Tüm içe aktarım TEK işlemdir: herhangi bir öğe hatalıysa
+hiçbir vaka kaydedilmez.
+
+Kullanım (CLI):
+    python case_import.py vakalar.json [--batch-size N] [--dry-run]
+"""
+
+import argparse
+import io
+import json
+import sys
+from collections import namedtuple
+
+from sqlalchemy import insert
+
+from app import app, db, case_cache, Case, ReferenceAnswer
+from prescorer import SYNONYMS_KEY
+
+IMPORT_BATCH_SIZE = 500
+READ_CHUNK_SIZE = 64 * 1024
+MAX_REPORTED_ERRORS = 50
+
+# Altın standart alanı; diğer '<kaynak>_response' alanları LLM referans yanıtlarıdır
+GOLD_FIELD = 'gold_standard_response'
+REFERENCE_SUFFIX = '_response'
+OBJECT_FIELDS = ('anamnesis', 'physical_exam')
+TITLE_MAX_LENGTH = 200
+SOURCE_MAX_LENGTH = 100
+
+ImportResult = namedtuple('ImportResult', ['imported', 'errors', 'error_count'])
+
+
+def reference_sources(item):
+    """Vaka nesnesindeki referans yanıt alanları: [(alan, ReferenceAnswer.source), ...]."""
+    sources = []
+    for field in item:
+        if field == GOLD_FIELD:
+            sources.append((field, 'gold'))
+        elif field.endswith(REFERENCE_SUFFIX) and len(field) > len(REFERENCE_SUFFIX):
+            sources.append((field, field[:-len(REFERENCE_SUFFIX)]))
+    return sources
+
+
+class CaseImportError(ValueError):
+    """Girdi dosyası ayrıştırılamadı (JSON dizisinde söz dizimi hatası gibi)."""
+
+
+def _iter_json_array(stream, buffer):
+    """'[' ile başlayan bir JSON dizisinin öğelerini akış halinde ayrıştırır."""
+    decoder = json.JSONDecoder()
+    pos = buffer.index('[') + 1
+    eof = False
+    position = 0
+    expect_item = True
+
+    def fill():
+        nonlocal buffer, pos, eof
+        chunk = stream.read(READ_CHUNK_SIZE)
+        if not chunk:
+            eof = True
+        buffer = buffer[pos:] + chunk
+        pos = 0
+
+    while True:
+        while pos < len(buffer) and buffer[pos].isspace():
+            pos += 1
+        if pos >= len(buffer):
+            if eof:
+                raise CaseImportError("JSON dizisi beklenmedik şekilde sona erdi (']' eksik).")
+            fill()
+            continue
+
+        char = buffer[pos]
+        if char == ']' and (expect_item is False or position == 0):
+            return
+        if not expect_item:
+            if char != ',':
+                raise CaseImportError(f"{position}. öğeden sonra ',' veya ']' bekleniyordu.")
+            pos += 1
+            expect_item = True
+            continue
+
+        try:
+            item, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError as e:
+            if eof:
+                raise CaseImportError(f"{position + 1}. öğe ayrıştırılamadı: {e.msg}") from e
+            fill()  # Öğe henüz tamamen okunmadı
+            continue
+        position += 1
+        pos = end
+        expect_item = False
+        yield position, item, None
+
+
+def _iter_ndjson(stream, buffer):
+    """Her satırı ayrı bir vaka olarak ayrıştırır; hatalı satırlar öğe hatası olarak döner."""
+    lines = io.StringIO(buffer).readlines()
+    pending = lines.pop() if lines and not lines[-1].endswith('\n') else ''
+    line_number = 0
+
+    def iter_lines():
+        nonlocal pending
+        yield from lines
+        for chunk_line in stream:
+            if pending:
+                chunk_line, pending = pending + chunk_line, ''
+            yield chunk_line
+        if pending:
+            yield pending
+
+    for line in iter_lines():
+        line_number += 1
+        if not line.strip():
+            continue
+        try:
+            yield line_number, json.loads(line), None
+        except json.JSONDecodeError as e:
+            yield line_number, None, f"Geçersiz JSON: {e.msg}"
+
+
+def iter_json_items(stream):
+    """
+    Metin akışındaki vaka nesnelerini (konum, öğe, hata) üçlüleri olarak üretir.
+    Biçim ilk anlamlı karaktere göre belirlenir: '[' JSON dizisi, '{' NDJSON.
+    """
+    buffer = ''
+    while not buffer.strip():
+        chunk = stream.read(READ_CHUNK_SIZE)
+        if not chunk:
+            return
+        buffer += chunk
+    first = buffer.lstrip()[0]
+    if first == '[':
+        yield from _iter_json_array(stream, buffer)
+    elif first == '{':
+        yield from _iter_ndjson(stream, buffer)
+    else:
+        raise CaseImportError("JSON bir liste ([...]) veya satır başına bir nesne (NDJSON) olmalıdır.")
+
+
+def validate_case(item):
+    """Vaka nesnesini şemaya göre doğrular; hata mesajlarının listesini döndürür."""
+    if not isinstance(item, dict):
+        return ["Vaka bir JSON nesnesi ({...}) olmalıdır."]
+    errors = []
+    title = item.get('title')
+    if not isinstance(title, str) or not title.strip():
+        errors.append("'title' boş olmayan bir metin olmalıdır.")
+    elif len(title) > TITLE_MAX_LENGTH:
+        errors.append(f"'title' en fazla {TITLE_MAX_LENGTH} karakter olabilir.")
+    for field in OBJECT_FIELDS:
+        if field in item and not isinstance(item[field], dict):
+            errors.append(f"'{field}' bir JSON nesnesi olmalıdır.")
+    for field, source in reference_sources(item):
+        if not isinstance(item[field], dict):
+            errors.append(f"'{field}' bir JSON nesnesi olmalıdır.")
+        elif len(source) > SOURCE_MAX_LENGTH:
+            errors.append(f"'{field}' kaynak adı en fazla {SOURCE_MAX_LENGTH} karakter olabilir.")
+    gold = item.get('gold_standard_response')
+    if not gold:
+        errors.append("'gold_standard_response' zorunludur (puanlama için altın standart).")
+    elif isinstance(gold, dict) and SYNONYMS_KEY in gold:
+        synonyms = gold[SYNONYMS_KEY]
+        if not isinstance(synonyms, dict) or not all(
+                isinstance(v, list) and all(isinstance(x, str) for x in v) for v in synonyms.values()):
+            errors.append(f"'{SYNONYMS_KEY}' alan adından metin listesine bir nesne olmalıdır "
+                          f"(ör. {{\"tanı\": [\"AOM\"]}}).")
+    return errors
+
+
+def _insert_batch(batch):
+    """Bir grup vakayı ve referans yanıtlarını iki çoklu INSERT ile ekler (commit edilmez)."""
+    case_ids = db.session.scalars(
+        insert(Case).returning(Case.id, sort_by_parameter_order=True),
+        [{
+            'title': item['title'].strip(),
+            'anamnesis': json.dumps(item.get('anamnesis', {})),
+            'physical_exam': json.dumps(item.get('physical_exam', {})),
+        } for item in batch]
+    ).all()
+    db.session.execute(insert(ReferenceAnswer), [
+        ReferenceAnswer.values_for(case_id, source, item[field])
+        for case_id, item in zip(case_ids, batch)
+        for field, source in reference_sources(item)
+    ])
+
+
+def import_cases(items, batch_size=IMPORT_BATCH_SIZE, dry_run=False):
+    """
+    Vakaları tek işlemde içe aktarır. 'items' ya (konum, öğe, hata) üçlüleri
+    (bkz. iter_json_items) ya da doğrudan vaka sözlükleri üreten bir yinelenebilirdir.
+
+    Herhangi bir öğe hatalıysa (veya dry_run ise) işlem geri alınır ve imported=0 döner.
+    Hatalar [(konum, mesaj), ...] olarak en fazla MAX_REPORTED_ERRORS adet raporlanır.
+    """
+    errors = []
+    error_count = 0
+    imported = 0
+    batch = []
+
+    def report(position, message):
+        nonlocal error_count
+        error_count += 1
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append((position, message))
+
+    try:
+        for index, entry in enumerate(items, start=1):
+            position, item, parse_error = entry if isinstance(entry, tuple) else (index, entry, None)
+            if parse_error:
+                report(position, parse_error)
+                continue
+            item_errors = validate_case(item)
+            if item_errors:
+                report(position, ' '.join(item_errors))
+                continue
+            if error_count:
+                continue  # İşlem zaten geri alınacak; yalnızca doğrulamaya devam et
+            batch.append(item)
+            if len(batch) >= batch_size:
+                _insert_batch(batch)
+                imported += len(batch)
+                batch = []
+        if batch and not error_count:
+            _insert_batch(batch)
+            imported += len(batch)
+    except CaseImportError as e:
+        report(None, str(e))
+    except Exception:
+        db.session.rollback()
+        raise
+
+    if error_count or dry_run:
+        db.session.rollback()
+        return ImportResult(0 if error_count else imported, errors, error_count)
+    db.session.commit()
+    case_cache.invalidate()
+    return ImportResult(imported, errors, error_count)
+
+
+def import_case_stream(stream, **kwargs):
+    """Metin akışındaki (JSON dizisi veya NDJSON) vakaları içe aktarır."""
+    return import_cases(iter_json_items(stream), **kwargs)
+
+
+def format_errors(errors):
+    """Hata listesini okunabilir satırlara çevirir."""
+    return [f"Öğe {position}: {message}" if position is not None else message for position, message in errors]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="JSON dizisi veya NDJSON dosyasından vakaları içe aktarır.")
+    parser.add_argument('path', help="Vaka dosyası ('-' standart girdi)")
+    parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE)
+    parser.add_argument('--dry-run', action='store_true', help="Yalnızca doğrula, kaydetme")
+    args = parser.parse_args()
+
+    with app.app_context():
+        if args.path == '-':
+            result = import_case_stream(sys.stdin, batch_size=args.batch_size, dry_run=args.dry_run)
+        else:
+            with open(args.path, encoding='utf-8-sig') as f:
+                result = import_case_stream(f, batch_size=args.batch_size, dry_run=args.dry_run)
+    for line in format_errors(result.errors):
+        print(f"HATA: {line}")
+    if result.error_count:
+        sys.exit(f"{result.error_count} hatalı öğe bulundu, hiçbir vaka kaydedilmedi.")
+    print(f"{result.imported} vaka {'doğrulandı' if args.dry_run else 'içe aktarıldı'}.")
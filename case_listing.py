@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+Ana sayfa için vaka listesi: dengeli, kullanıcıya göre sabit rastgele sıra.
+
+Vakalar yanıt sayısı en az olandan başlayarak listelenir; böylece katılımcılar
+vaka bankasına dengeli dağılır. Aynı yanıt sayısına sahip vakalar, kullanıcıya
+özgü bir tohumdan (seed) türetilen sözde rastgele bir permütasyonla sıralanır:
+sıra kullanıcıdan kullanıcıya değişir, ancak aynı kullanıcı için sayfa
+yenilemelerinde sabit kalır.
+
+Sorgu yalnızca id/başlık sütunlarını okur (anamnez, muayene ve LLM yanıtları gibi
+büyük metin sütunları okunmaz), yanıt sayılarını user_response'u saymak yerine
+skor özetlerinden (score_aggregate, 'case' boyutu; bkz. aggregates.py) alır ve
+sayfalanır. Yanıt sayısı, puanlanmış yanıtları kapsar. Toplam vaka sayısı her
+görüntülemede sayılmaz, vaka önbelleğinden (bkz. case_cache.py) okunur.
+
+Sıralama anahtarı kullanıcıya özgü olduğu için bir indeksle karşılanamaz:
+veritabanı her görüntülemede vaka başına bir (id, yanıt sayısı) satırını sıralar.
+Vaka bankası yöneticilerin yüklediği, yüzlerle sınırlı bir kümedir ve sıralanan
+satırlar metin sütunu içermez; bu sıralama sayfa maliyetinde belirleyici değildir.
+"""
+
+import hashlib
+import math
+from collections import namedtuple
+
+from sqlalchemy import BigInteger, String, and_, case, cast, func, select
+
+from app import db, case_cache, Case, ScoreAggregate
+
+CaseListItem = namedtuple('CaseListItem', ['id', 'title', 'response_count'])
+CaseListPage = namedtuple('CaseListPage', ['items', 'page', 'pages', 'total'])
+
+# Permütasyon modülü: 2^31 - 1 (asal, P ≡ 3 mod 4). Ara değerler 2^62'yi aşmaz,
+# böylece hesap PostgreSQL'de de BIGINT sınırları içinde kalır.
+_MODULUS = 2 ** 31 - 1
+
+
+def _shuffle_key(id_column, offset, multiplier):
+    """
+    id'yi tohuma bağlı bir permütasyonla karıştıran SQL ifadesi: önce doğrusal
+    (id * multiplier + offset mod P), ardından karesel kalıntı permütasyonu
+    (x <= P/2 ise x^2 mod P, değilse P - x^2 mod P). Karesel adım, doğrusal
+    adımın ürettiği aritmetik dizi görünümünü bozar.
+    """
+    x = (cast(id_column, BigInteger) * multiplier + offset) % _MODULUS
+    residue = (x * x) % _MODULUS
+    return case((x <= _MODULUS // 2, residue), else_=_MODULUS - residue)
+
+
+def user_seed(user_id):
+    """Kullanıcı id'sinden (offset, multiplier) tohum çiftini türetir."""
+    digest = hashlib.sha256(f"case-order:{user_id}".encode('utf-8')).digest()
+    offset = int.from_bytes(digest[:4], 'big') % _MODULUS
+    multiplier = int.from_bytes(digest[4:8], 'big') % (_MODULUS - 1) + 1
+    return offset, multiplier
+
+
+def list_cases(seed, page=1, per_page=50):
+    """
+    Vakaların bir sayfasını (CaseListPage) döndürür. 'seed', user_seed ile
+    üretilmiş (offset, multiplier) çiftidir.
+    """
+    offset, multiplier = seed
+    total = case_cache.count()
+    pages = max(1, math.ceil(total / per_page))
+    page = min(max(1, page), pages)
+
+    response_count = func.coalesce(ScoreAggregate.n, 0)
+    shuffle_key = _shuffle_key(Case.id, offset, multiplier)
+    rows = db.session.execute(
+        select(Case.id, Case.title, response_count)
+        .outerjoin(ScoreAggregate, and_(ScoreAggregate.dimension == 'case',
+                                        ScoreAggregate.key == cast(Case.id, String)))
+        .order_by(response_count, shuffle_key, Case.id)
+        .limit(per_page)
+        .offset((page - 1) * per_page)
+    ).all()
+    return CaseListPage([CaseListItem(*row) for row in rows], page, pages, total)
@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+"""
+Araştırma veri setinin dışa aktarımı.
+
+Yanıtlar anahtar kümesi (keyset) sayfalamasıyla sabit boyutlu gruplar halinde
+okunur; kullanıcı bilgileri aynı sorguda JOIN ile alınır. Vaka başlıkları,
+altın standart ve LLM referans yanıtları ise dışa aktarım başında vaka
+önbelleğinden (bkz. case_cache.py) vaka başına BİR KEZ alınır. Böylece satır
+başına ek sorgu yapılmaz ve bellek kullanımı satır sayısından bağımsız kalır.
+
+CSV'ye ek olarak veri seti Parquet ve Arrow IPC (Feather) biçimlerinde, doğru
+veri tipleriyle ve tekrar eden metin sütunları sözlük kodlamalı (dictionary
+encoded) olarak yazılabilir. Her biçim sütun seçimi ve tarih aralığı süzgeci destekler.
+Parquet/Feather için 'pyarrow' paketi gerekir.
+"""
+
+import csv
+import datetime
+import io
+import tempfile
+
+from sqlalchemy import select
+
+from app import db, case_cache, User, Case, UserResponse
+
+EXPORT_BATCH_SIZE = 1000
+
+# Kapsamlı başlık satırı
+EXPORT_HEADER = [
+    'yanit_id', 'kullanici_id', 'kullanici_unvan', 'kullanici_deneyim_yil',
+    'vaka_id', 'vaka_baslik', 'yanit_suresi_saniye', 'yanit_tarihi',
+    'kullanici_tani', 'kullanici_ayirici_tani', 'kullanici_tetkik',
+    'kullanici_ilac_grubu', 'kullanici_etken_madde', 'kullanici_doz_notlari',
+    'tani_skoru', 'tetkik_skoru', 'tedavi_skoru', 'doz_skoru', 'final_skor',
+    'tani_gerekcesi', 'tetkik_gerekcesi', 'tedavi_gerekcesi', 'doz_gerekcesi',
+    'altin_standart_tani', 'altin_standart_tetkik', 'altin_standart_tedavi', 'altin_standart_doz',
+    'chatgpt_tani', 'chatgpt_tetkik', 'chatgpt_tedavi', 'chatgpt_doz',
+    'gemini_tani', 'gemini_tetkik', 'gemini_tedavi', 'gemini_doz',
+    'deepseek_tani', 'deepseek_tetkik', 'deepseek_tedavi', 'deepseek_doz'
+]
+
+REFERENCE_FIELDS = ('tanı', 'tetkik', 'tedavi_plani', 'dozaj')
+# Dışa aktarılan referans kaynakları (ReferenceAnswer.source) ve başlıktaki sütun önekleri
+EXPORT_REFERENCE_SOURCES = {'gold': 'altin_standart_', 'chatgpt': 'chatgpt_', 'gemini': 'gemini_',
+                            'deepseek': 'deepseek_'}
+
+# Sütun tipleri (Parquet/Arrow şeması için). Listede olmayan sütunlar düz metindir.
+INTEGER_COLUMNS = {'yanit_id', 'kullanici_id', 'kullanici_deneyim_yil', 'vaka_id', 'yanit_suresi_saniye'}
+FLOAT_COLUMNS = {'tani_skoru', 'tetkik_skoru', 'tedavi_skoru', 'doz_skoru', 'final_skor'}
+TIMESTAMP_COLUMNS = {'yanit_tarihi'}
+# Az sayıda farklı değeri olan, çok tekrar eden metin sütunları: sözlük kodlaması uygulanır
+DICTIONARY_COLUMNS = {'vaka_baslik', 'kullanici_unvan', 'kullanici_ilac_grubu'} | {
+    c for c in EXPORT_HEADER if c.startswith(tuple(EXPORT_REFERENCE_SOURCES.values()))
+}
+
+# CSV'de satır sonları temizlenen serbest metin sütunları
+_CSV_CLEANED_COLUMNS = {
+    'kullanici_tani', 'kullanici_ayirici_tani', 'kullanici_tetkik', 'kullanici_doz_notlari',
+    'tani_gerekcesi', 'tetkik_gerekcesi', 'tedavi_gerekcesi', 'doz_gerekcesi',
+}
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+    'feather': ('application/vnd.apache.arrow.file', 'arrow'),
+}
+
+# Dışa aktarımda okunan sütunlar (hakem ham yanıtları ayrı tabloda, scoring_run; burada okunmaz)
+_EXPORT_COLUMNS = (
+    UserResponse.id, UserResponse.user_id, User.profession, User.experience,
+    UserResponse.case_id, UserResponse.duration_seconds, UserResponse.created_at,
+    UserResponse.user_diagnosis, UserResponse.user_differential, UserResponse.user_tests,
+    UserResponse.user_drug_class, UserResponse.user_active_ingredient, UserResponse.user_dosage_notes,
+    UserResponse.diagnosis_score, UserResponse.investigation_score, UserResponse.treatment_score,
+    UserResponse.dosage_score, UserResponse.final_score, UserResponse.score_reasons,
+)
+
+
+def clean_text(text):
+    return text.replace('\n', ' ').replace('\r', '') if text else ''
+
+
+def parse_export_options(args):
+    """
+    İstek parametrelerinden (columns, start, end) dışa aktarım seçeneklerini üretir.
+    start/end YYYY-MM-DD biçimindedir ve end günü dahildir. Geçersiz girdide ValueError fırlatır.
+    """
+    columns = [c.strip() for c in (args.get('columns') or '').split(',') if c.strip()] or list(EXPORT_HEADER)
+    unknown = [c for c in columns if c not in EXPORT_HEADER]
+    if unknown:
+        raise ValueError(f"Bilinmeyen sütun(lar): {', '.join(unknown)}")
+    start = end = None
+    if args.get('start'):
+        start = datetime.datetime.combine(datetime.date.fromisoformat(args['start']), datetime.time.min)
+    if args.get('end'):
+        end = datetime.datetime.combine(datetime.date.fromisoformat(args['end']) + datetime.timedelta(days=1),
+                                        datetime.time.min)
+    return {'columns': columns, 'start': start, 'end': end}
+
+
+def load_case_references():
+    """
+    Her vaka için başlığı ve EXPORT_REFERENCE_SOURCES kaynaklarının referans
+    alanlarını vaka önbelleğinden alır: {case_id: (title, [16 alan])}.
+    """
+    case_ids = db.session.scalars(select(Case.id)).all()
+    references = {}
+    for case_id, content in case_cache.get_many(case_ids).items():
+        values = []
+        for source in EXPORT_REFERENCE_SOURCES:
+            reference = content.references.get(source) or {}
+            values.extend(reference.get(field) for field in REFERENCE_FIELDS)
+        references[case_id] = (content.title, values)
+    return references
+
+
+def iter_response_batches(batch_size=EXPORT_BATCH_SIZE, start=None, end=None):
+    """
+    UserResponse satırlarını (kullanıcı bilgileriyle birlikte) id sırasına göre
+    gruplar halinde üretir. start/end verilirse created_at aralığına göre süzer.
+    """
+    last_id = 0
+    while True:
+        query = (
+            select(*_EXPORT_COLUMNS)
+            .join(User, User.id == UserResponse.user_id)
+            .where(UserResponse.id > last_id)
+        )
+        if start is not None:
+            query = query.where(UserResponse.created_at >= start)
+        if end is not None:
+            query = query.where(UserResponse.created_at < end)
+        rows = db.session.execute(query.order_by(UserResponse.id).limit(batch_size)).all()
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1].id
+
+
+def iter_record_batches(batch_size=EXPORT_BATCH_SIZE, start=None, end=None):
+    """
+    EXPORT_HEADER sırasına uygun, ham (tipli) değerlerden oluşan satır gruplarını
+    üretir: tarih datetime olarak, metinler olduğu gibi kalır.
+    """
+    references = load_case_references()
+    empty_references = (None, [None] * len(EXPORT_REFERENCE_SOURCES) * len(REFERENCE_FIELDS))
+    for rows in iter_response_batches(batch_size, start, end):
+        batch = []
+        for r in rows:
+            title, reference_values = references.get(r.case_id, empty_references)
+            reasons = r.score_reasons or {}
+            batch.append([
+                r.id, r.user_id, r.profession, r.experience,
+                r.case_id, title, r.duration_seconds, r.created_at,
+                r.user_diagnosis, r.user_differential, r.user_tests,
+                r.user_drug_class, r.user_active_ingredient, r.user_dosage_notes,
+                r.diagnosis_score, r.investigation_score, r.treatment_score, r.dosage_score, r.final_score,
+                reasons.get('diagnosis'), reasons.get('tests'), reasons.get('treatment'), reasons.get('dosage'),
+                *reference_values
+            ])
+        yield batch
+
+
+def generate_csv(batch_size=EXPORT_BATCH_SIZE, columns=None, start=None, end=None):
+    """CSV içeriğini grup grup metin parçaları halinde üretir (akış yanıtı için)."""
+    columns = columns or EXPORT_HEADER
+    indexes = [EXPORT_HEADER.index(c) for c in columns]
+    cleaned = {i for i in indexes if EXPORT_HEADER[i] in _CSV_CLEANED_COLUMNS}
+    date_index = EXPORT_HEADER.index('yanit_tarihi')
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for batch in iter_record_batches(batch_size, start, end):
+        for record in batch:
+            row = []
+            for i in indexes:
+                value = record[i]
+                if i in cleaned:
+                    value = clean_text(value)
+                elif i == date_index:
+                    value = value.isoformat()
+                row.append(value)
+            writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+    yield buffer.getvalue()
+
+
+def arrow_schema(columns):
+    """Seçili sütunlar için Arrow şemasını üretir."""
+    import pyarrow as pa
+
+    fields = []
+    for name in columns:
+        if name in INTEGER_COLUMNS:
+            arrow_type = pa.int64()
+        elif name in FLOAT_COLUMNS:
+            arrow_type = pa.float64()
+        elif name in TIMESTAMP_COLUMNS:
+            arrow_type = pa.timestamp('us', tz='UTC')
+        elif name in DICTIONARY_COLUMNS:
+            arrow_type = pa.dictionary(pa.int32(), pa.string())
+        else:
+            arrow_type = pa.string()
+        fields.append(pa.field(name, arrow_type))
+    return pa.schema(fields)
+
+
+def write_columnar(sink, file_format, batch_size=EXPORT_BATCH_SIZE, columns=None, start=None, end=None):
+    """
+    Veri setini 'parquet' veya 'feather' (Arrow IPC) biçiminde 'sink' dosyasına
+    yazar. Her satır grubu ayrı bir Arrow kayıt grubu (Parquet row group) olur;
+    böylece bellekte aynı anda yalnızca bir grup tutulur.
+    """
+    import pyarrow as pa
+
+    columns = columns or EXPORT_HEADER
+    indexes = [EXPORT_HEADER.index(c) for c in columns]
+    schema = arrow_schema(columns)
+
+    if file_format == 'parquet':
+        import pyarrow.parquet as pq
+        writer = pq.ParquetWriter(sink, schema, compression='zstd')
+        write_batch = writer.write_batch
+    else:
+        writer = pa.ipc.new_file(sink, schema, options=pa.ipc.IpcWriteOptions(compression='zstd'))
+        write_batch = writer.write_batch
+
+    try:
+        for batch in iter_record_batches(batch_size, start, end):
+            arrays = [
+                pa.array([record[i] for record in batch], type=field.type)
+                for i, field in zip(indexes, schema)
+            ]
+            write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+    finally:
+        writer.close()
+
+
+def export_columnar_file(file_format, **options):
+    """Sütunsal dışa aktarımı geçici bir dosyaya yazar ve başa sarılmış dosyayı döndürür."""
+    tmp = tempfile.TemporaryFile()
+    write_columnar(tmp, file_format, **options)
+    tmp.seek(0)
+    return tmp
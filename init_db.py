@@ -1,4 +1,6 @@
-from app import app, db, seed_database
+from app import app, db, seed_database, ScoreAggregate
+from aggregates import rebuild_aggregates
+from migrations import run_migrations
 
 print("Veritabanı başlatma script'i (init_db.py) çalışıyor...")
 
@@ -7,8 +9,16 @@ with app.app_context():
     # Tüm tabloları oluştur
     db.create_all()
     print("Tablolar başarıyla oluşturuldu.")
+
+    # Mevcut tablolara sonradan eklenen indeks/sütunlar (bkz. migrations.py)
+    run_migrations()
     
     # Başlangıç verilerini (vakaları) ekle
     seed_database()
 
+    # Skor özetleri henüz oluşturulmadıysa mevcut yanıtlardan hesapla
+    if ScoreAggregate.query.first() is None:
+        rebuild_aggregates()
+        print("Skor özetleri hesaplandı.")
+
 print("Veritabanı başlatma tamamlandı.")
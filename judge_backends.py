@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+"""
+Değiştirilebilir hakem LLM arka uçları.
+
+Hangi arka ucun kullanılacağı JUDGE_BACKEND ayarıyla seçilir:
+
+- gemini: Google Gemini API (üretim).
+- fake:   ağ bağlantısı olmadan, girdilere göre deterministik skorlar üreten
+          yerel hakem. Gecikme ve hata oranı ayarlanabilir; kuyruk/worker
+          verimini API ücreti ödemeden ölçmek (yük testi) için kullanılır.
+- replay: puanlama arşivinde (scoring_run) saklanmış hakem yanıtlarını
+          yeniden sunar; geçmiş bir puanlama çalıştırmasını birebir
+          yeniden üretmek için kullanılır.
+
+Her arka uç generate(prompt, request) metodunu sağlar ve '.text' alanı olan bir
+yanıt döndürür. 'request' (JudgeRequest), istem metninin yapılandırılmış
+karşılığıdır; fake ve replay arka uçları istemi ayrıştırmak yerine bunu kullanır.
+Arka ucun model_name değeri karar önbelleği anahtarına ve hakem sürümüne
+(JUDGE_VERSION) girer; böylece farklı arka uçların kararları birbirine karışmaz.
+"""
+
+import hashlib
+import json
+import random
+import threading
+import time
+from collections import namedtuple
+
+from verdict_cache import normalize_answer
+
+# kind: 'single' (tek kategori) veya 'batch' (toplu istem)
+# items: [(kategori anahtarı, istemdeki etiket, kullanıcı yanıtı, altın standart yanıt), ...]
+JudgeRequest = namedtuple('JudgeRequest', ['kind', 'items'])
+JudgeUsage = namedtuple('JudgeUsage', ['prompt_token_count', 'candidates_token_count'])
+JudgeResponse = namedtuple('JudgeResponse', ['text', 'usage_metadata'])
+
+
+class FakeJudgeError(Exception):
+    """Fake arka ucun enjekte ettiği geçici hata (code alanı rate_limiter.is_retryable ile uyumlu)."""
+
+    def __init__(self, message, code=503):
+        super().__init__(message)
+        self.code = code
+
+
+class ReplayMiss(LookupError):
+    """Replay arka ucunda istenen karar için saklanmış bir hakem yanıtı yok."""
+
+
+def _response_text(request, verdicts):
+    """Kategori kararlarını ({"score", "reasoning"}) istem türüne uygun JSON metnine çevirir."""
+    if request.kind == 'single':
+        return json.dumps(verdicts[request.items[0][0]], ensure_ascii=False)
+    return json.dumps(verdicts, ensure_ascii=False)
+
+
+class GeminiBackend:
+    """Google Gemini API üzerinden hakem."""
+
+    name = 'gemini'
+    model_name = 'gemini-2.5-flash'
+
+    def __init__(self, api_key):
+        if not api_key or api_key == "AIzaSy...":
+            raise ValueError("GEMINI_API_KEY bulunamadı veya ayarlanmamış. Lütfen .env dosyanızı kontrol edin.")
+        # SDK ağır bir bağımlılıktır; yalnızca Gemini arka ucu oluşturulduğunda yüklenir
+        import google.generativeai as genai
+        genai.configure(api_key=api_key)
+        self.model = genai.GenerativeModel(
+            model_name=self.model_name,
+            generation_config={"response_mime_type": "application/json"}
+        )
+
+    def generate(self, prompt, request=None):
+        return self.model.generate_content(prompt)
+
+
+class FakeBackend:
+    """
+    Deterministik yerel hakem. Aynı (kategori, yanıt, altın standart) için her
+    zaman aynı skoru verir: normalize edilmiş yanıt altın standarda eşitse 100,
+    değilse içerik özetinden türetilen 40-95 arası bir skor.
+    """
+
+    name = 'fake'
+    model_name = 'fake-judge'
+
+    def __init__(self, latency=0.5, latency_jitter=0.2, error_rate=0.0, error_code=503, seed=None):
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.error_code = error_code
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def score_for(label, user_answer, gold_answer):
+        user, gold = normalize_answer(user_answer), normalize_answer(gold_answer)
+        if user and user == gold:
+            return 100
+        digest = hashlib.sha256(f"{label}|{user}|{gold}".encode('utf-8')).digest()
+        return 40 + digest[0] % 56
+
+    def generate(self, prompt, request):
+        with self._lock:
+            delay = max(0.0, self._random.gauss(self.latency, self.latency_jitter))
+            fail = self._random.random() < self.error_rate
+        time.sleep(delay)
+        if fail:
+            raise FakeJudgeError("Fake hakem: enjekte edilmiş geçici hata.", code=self.error_code)
+        verdicts = {
+            key: {"score": self.score_for(label, user, gold), "reasoning": f"Deterministik test skoru ({label})."}
+            for key, label, user, gold in request.items
+        }
+        text = _response_text(request, verdicts)
+        return JudgeResponse(text, JudgeUsage(len(prompt) // 4, len(text) // 4))
+
+
+class ReplayBackend:
+    """
+    Puanlama arşivindeki (ScoringRun) hakem yanıtlarını yeniden sunar. Kayıtlar
+    ilk kullanımda (kategori etiketi, normalize yanıt, normalize altın standart)
+    anahtarıyla belleğe alınır; aynı anahtar için en son puanlama geçerlidir.
+    'judge_version' verilirse yalnızca o hakem sürümünün kayıtları kullanılır.
+    """
+
+    name = 'replay'
+    model_name = 'replay'
+
+    def __init__(self, judge_version=None):
+        self.judge_version = judge_version
+        self._index = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(label, user_answer, gold_answer):
+        return label, normalize_answer(user_answer), normalize_answer(gold_answer)
+
+    def _load(self):
+        # app ve tasks bu modülü içe aktardığı için burada (ilk kullanımda) içe aktarılır
+        from sqlalchemy import select
+        from app import app, db, case_cache, SCORING_CATEGORIES, ScoringRun, UserResponse
+        from tasks import build_user_answers
+
+        index = {}
+        with app.app_context():
+            query = (
+                select(ScoringRun, UserResponse)
+                .join(UserResponse, UserResponse.id == ScoringRun.response_id)
+                .order_by(ScoringRun.id)
+            )
+            if self.judge_version:
+                query = query.where(ScoringRun.judge_version == self.judge_version)
+            for run, ur in db.session.execute(query):
+                raw = run.raw
+                gold = case_cache.get_reference(ur.case_id, 'gold') or {}
+                answers = build_user_answers(ur)
+                sources = raw.get('decision_source') or {}
+                for key, (label, gold_key) in SCORING_CATEGORIES.items():
+                    if sources.get(key, 'judge') != 'judge':
+                        continue  # Ön puanlayıcı veya koşullu puanlama kararı, hakem yanıtı değil
+                    try:
+                        verdict = json.loads(raw.get(key) or '')
+                        verdict = {"score": verdict["score"], "reasoning": verdict.get("reasoning", "")}
+                    except (ValueError, TypeError, KeyError):
+                        continue  # Koşullu puanlamada atlanan veya hatalı kategori
+                    index[self._key(label, answers[key], gold.get(gold_key, ''))] = verdict
+        return index
+
+    def generate(self, prompt, request):
+        with self._lock:
+            if self._index is None:
+                self._index = self._load()
+        verdicts = {}
+        for key, label, user, gold in request.items:
+            verdict = self._index.get(self._key(label, user, gold))
+            if verdict is None:
+                raise ReplayMiss(f"Replay: '{label}' için saklanmış hakem yanıtı bulunamadı.")
+            verdicts[key] = verdict
+        return JudgeResponse(_response_text(request, verdicts), None)
+
+
+JUDGE_BACKENDS = {
+    GeminiBackend.name: GeminiBackend,
+    FakeBackend.name: FakeBackend,
+    ReplayBackend.name: ReplayBackend,
+}
+
+
+def create_backend(config, api_key=None):
+    """Uygulama yapılandırmasına göre hakem arka ucunu oluşturur."""
+    name = config['JUDGE_BACKEND']
+    if name == 'gemini':
+        return GeminiBackend(api_key)
+    if name == 'fake':
+        return FakeBackend(
+            latency=config['FAKE_JUDGE_LATENCY'],
+            latency_jitter=config['FAKE_JUDGE_LATENCY_JITTER'],
+            error_rate=config['FAKE_JUDGE_ERROR_RATE'],
+            error_code=config['FAKE_JUDGE_ERROR_CODE'],
+            seed=config['FAKE_JUDGE_SEED'],
+        )
+    if name == 'replay':
+        return ReplayBackend(judge_version=config['JUDGE_REPLAY_VERSION'])
+    raise ValueError(f"Bilinmeyen JUDGE_BACKEND: {name} (seçenekler: {', '.join(JUDGE_BACKENDS)})")
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+Skorların sonuç sayfasına canlı iletimi (Redis pub/sub + server-sent events).
+
+Worker, bir yanıtın puanlaması veritabanına yazıldığında (veya ertelendiğinde /
+başarısız olduğunda) 'scores:<yanıt_id>' kanalına bir olay yayınlar. Sonuç
+sayfası bu kanala bir EventSource ile bağlanır; olay geldiğinde skorlar sayfa
+yenilenmeden gösterilir. Böylece kullanıcıların sayfayı tekrar tekrar
+yenilemesi (ve her yenilemede sonuç sorgusunun çalışması) önlenir.
+
+Abonelik, sayfa çizildikten sonra kurulduğu için arada yayınlanan olay
+kaçabilir; bu nedenle son olay kısa bir süre ayrıca bir anahtarda saklanır ve
+abone olunduktan hemen sonra okunur.
+
+Web süreci gthread ile çalışır: açık her akış bir iş parçacığını ve bir pub/sub
+bağlantısını tutar. Bu nedenle bir akış en fazla 'stream_timeout' saniye (kısa
+bir long-poll) sürer ve süreç başına en fazla 'max_streams' akış aynı anda
+açık olabilir. Sınır doluysa akış hemen 'poll' olayıyla kapanır; tarayıcı
+skorları JSON durum uç noktasından artan aralıklarla sorgular.
+"""
+
+import json
+import threading
+import time
+
+from redis.exceptions import RedisError
+
+# Olay durumları: 'deferred' ara bir durumdur, diğerleri akışı sonlandırır
+FINAL_STATUSES = ('scored', 'error')
+
+
+def score_event(response, status='scored'):
+    """Bir UserResponse'tan istemciye gönderilecek olay verisini üretir."""
+    reasons = response.score_reasons or {}
+    return {
+        'status': status,
+        'response_id': response.id,
+        'scores': {
+            'diagnosis': response.diagnosis_score,
+            'tests': response.investigation_score,
+            'treatment': response.treatment_score,
+            'dosage': response.dosage_score,
+        },
+        'final_score': response.final_score,
+        'reasons': reasons,
+    }
+
+
+def format_sse(data, event='score'):
+    """Olay verisini SSE biçimine çevirir."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+class ScoreEvents:
+    """Skor olaylarını yayınlar ve SSE akışı olarak dinler."""
+
+    LAST_EVENT_TTL = 300
+
+    def __init__(self, redis_conn, stream_timeout=10, heartbeat=5, max_streams=2):
+        self.redis = redis_conn
+        self.stream_timeout = stream_timeout
+        self.heartbeat = heartbeat
+        self._slots = threading.BoundedSemaphore(max_streams)
+
+    @property
+    def available(self):
+        return self.redis is not None
+
+    def _channel(self, response_id):
+        return f"scores:{response_id}"
+
+    def _last_key(self, response_id):
+        return f"scores:last:{response_id}"
+
+    def publish(self, response_id, data):
+        """Olayı yayınlar. Redis hataları puanlamayı etkilemez, yalnızca uyarı basılır."""
+        if self.redis is None:
+            return
+        payload = json.dumps(data, ensure_ascii=False)
+        try:
+            pipe = self.redis.pipeline()
+            pipe.set(self._last_key(response_id), payload, ex=self.LAST_EVENT_TTL)
+            pipe.publish(self._channel(response_id), payload)
+            pipe.execute()
+        except RedisError as e:
+            print(f"UYARI: Skor olayı yayınlanamadı (Response ID {response_id}): {e}")
+
+    def last(self, response_id):
+        """Yanıt için yayınlanan son olay (yoksa veya Redis hatasında None)."""
+        if self.redis is None:
+            return None
+        try:
+            last = self.redis.get(self._last_key(response_id))
+        except RedisError as e:
+            print(f"UYARI: Son skor olayı okunamadı (Response ID {response_id}): {e}")
+            return None
+        return json.loads(last) if last is not None else None
+
+    def stream(self, response_id):
+        """
+        SSE metin parçaları üretir. Son durum (scored/error) geldiğinde veya
+        'stream_timeout' dolduğunda akış biter; tarayıcı 'retry' süresi sonunda
+        yeniden bağlanır. Bekleme sırasında veritabanı bağlantısı tutulmaz.
+        Açık akış sayısı sınırdaysa yalnızca bir 'poll' olayı gönderilir.
+        """
+        # Yuva, üreteç çalışmaya başladığında alınır ki 'finally' her zaman bıraksın
+        if not self._slots.acquire(blocking=False):
+            yield format_sse({'status': 'busy', 'response_id': response_id}, event='poll')
+            return
+        pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        try:
+            pubsub.subscribe(self._channel(response_id))
+            yield "retry: 3000\n\n"
+            last = self.redis.get(self._last_key(response_id))
+            if last is not None:
+                data = json.loads(last)
+                yield format_sse(data)
+                if data.get('status') in FINAL_STATUSES:
+                    return
+            deadline = time.monotonic() + self.stream_timeout
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                message = pubsub.get_message(timeout=min(self.heartbeat, remaining))
+                if message is None:
+                    yield ": bekleniyor\n\n"
+                    continue
+                data = json.loads(message['data'])
+                yield format_sse(data)
+                if data.get('status') in FINAL_STATUSES:
+                    return
+        except RedisError as e:
+            print(f"UYARI: Skor olay akışı kesildi (Response ID {response_id}): {e}")
+        finally:
+            pubsub.close()
+            self._slots.release()
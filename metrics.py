@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+Puanlama hattı ve web uygulaması için Prometheus metrikleri.
+
+- Hakem LLM: kategori ve istem türüne (single/batch) göre çağrı süresi,
+  istem/yanıt token sayıları, hata sınıfları, yeniden denemeler, erişilemezlik
+  (deneme bütçesi / devre kesici), karar önbelleği isabetleri ve birleştirilen
+  (single-flight) istekler ile yerel ön puanlayıcı kararları.
+- Puanlama işleri: kuyrukta bekleme süresi, yanıtın kaydından skorların
+  yazılmasına kadar geçen uçtan uca süre ve iş sonuçları.
+- Web: route (endpoint) bazında istek süreleri.
+
+Web uygulaması metrikleri /metrics adresinden, worker ise METRICS_PORT
+portunda ayrı bir HTTP sunucusundan yayınlar (bkz. worker.py). Birden fazla
+gunicorn süreci çalışıyorsa PROMETHEUS_MULTIPROC_DIR ayarlanmalıdır; bu
+durumda /metrics tüm süreçlerin metriklerini birleştirir.
+"""
+
+import datetime
+import os
+
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram,
+                               generate_latest, multiprocess)
+
+# LLM çağrıları saniyeler, uçtan uca puanlama ise dakikalar sürebilir
+JUDGE_BUCKETS = (0.25, 0.5, 1, 2, 3, 5, 8, 13, 20, 30, 60)
+JOB_BUCKETS = (0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300, 600, 1800)
+
+JUDGE_CALL_SECONDS = Histogram(
+    'judge_call_seconds', "Tek bir hakem LLM isteğinin süresi (yeniden denemeler ayrı ölçülür).",
+    ['category', 'outcome'], buckets=JUDGE_BUCKETS)
+JUDGE_TOKENS = Counter(
+    'judge_tokens_total', "Hakem LLM istem/yanıt token sayısı.", ['category', 'direction'])
+JUDGE_ERRORS = Counter(
+    'judge_errors_total', "Hakem LLM hataları, hata sınıfına göre.", ['category', 'error_class'])
+JUDGE_RETRIES = Counter(
+    'judge_retries_total', "Geçici hatalar nedeniyle yeniden denenen hakem istekleri.", ['category'])
+JUDGE_UNAVAILABLE = Counter(
+    'judge_unavailable_total', "Hakem LLM erişilemez sayıldı (bütçe tükendi veya devre açık).", ['reason'])
+JUDGE_CACHE = Counter(
+    'judge_cache_total', "Hakem karar önbelleği sorguları.", ['result'])
+JUDGE_COALESCED = Counter(
+    'judge_coalesced_total', "Uçuştaki aynı bir isteğin sonucunu bekleyerek gönderilmeyen hakem istekleri.",
+    ['scope'])
+PRESCORER_DECISIONS = Counter(
+    'prescorer_decisions_total', "Yerel ön puanlayıcı: hakeme gitmeden puanlanan (decided) ve hakeme bırakılan (escalated) kategoriler.",
+    ['category', 'outcome'])
+
+SCORING_QUEUE_WAIT_SECONDS = Histogram(
+    'scoring_queue_wait_seconds', "Puanlama işinin kuyrukta bekleme süresi.", buckets=JOB_BUCKETS)
+SCORING_END_TO_END_SECONDS = Histogram(
+    'scoring_end_to_end_seconds', "Yanıtın kaydından skorların veritabanına yazılmasına kadar geçen süre.",
+    buckets=JOB_BUCKETS)
+SCORING_JOBS = Counter(
+    'scoring_jobs_total', "Puanlama işleri, sonuca göre.", ['outcome'])
+OUTBOX_DISPATCHED = Counter(
+    'scoring_outbox_rows_total', "Puanlama kutusu satırları: kuyruğa aktarılan, aktarılamayan ve süpürücünün eklediği.",
+    ['outcome'])
+
+HTTP_REQUEST_SECONDS = Histogram(
+    'http_request_seconds', "Flask route'larının yanıt süresi.", ['endpoint', 'method', 'status'])
+
+
+def _utc(value):
+    """Saat dilimi bilgisi olmayan (veritabanından gelen) zamanları UTC kabul eder."""
+    if value.tzinfo is None:
+        return value.replace(tzinfo=datetime.timezone.utc)
+    return value
+
+
+def seconds_between(start, end=None):
+    """İki zaman arasındaki saniye; end verilmezse şimdiye kadar."""
+    if start is None:
+        return None
+    end = end or datetime.datetime.now(datetime.timezone.utc)
+    return max(0.0, (_utc(end) - _utc(start)).total_seconds())
+
+
+def record_judge_tokens(category, response):
+    """SDK yanıtındaki kullanım bilgisinden (usage_metadata) token sayılarını kaydeder."""
+    usage = getattr(response, 'usage_metadata', None)
+    if usage is None:
+        return
+    prompt_tokens = getattr(usage, 'prompt_token_count', None)
+    response_tokens = getattr(usage, 'candidates_token_count', None)
+    if prompt_tokens:
+        JUDGE_TOKENS.labels(category, 'prompt').inc(prompt_tokens)
+    if response_tokens:
+        JUDGE_TOKENS.labels(category, 'response').inc(response_tokens)
+
+
+def record_judge_error(category, error):
+    JUDGE_ERRORS.labels(category, type(error).__name__).inc()
+
+
+def record_scoring_job(job, created_at, outcome):
+    """Bir puanlama işinin kuyruk bekleme ve uçtan uca sürelerini kaydeder."""
+    SCORING_JOBS.labels(outcome).inc()
+    if job is not None and job.enqueued_at is not None and job.started_at is not None:
+        SCORING_QUEUE_WAIT_SECONDS.observe(seconds_between(job.enqueued_at, job.started_at))
+    if outcome == 'scored' and created_at is not None:
+        SCORING_END_TO_END_SECONDS.observe(seconds_between(created_at))
+
+
+def metrics_payload():
+    """Prometheus metin biçimindeki metrikleri ve içerik tipini döndürür."""
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
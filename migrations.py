@@ -0,0 +1,296 @@
+# -*- coding: utf-8 -*-
+"""
+Şema geçişleri ve sık kullanılan sorguların plan kontrolü.
+
+db.create_all() yalnızca eksik TABLOLARI oluşturur; mevcut bir tabloya
+sonradan eklenen indeksleri veya sütunları uygulamaz. Bu modül, mevcut
+veritabanlarına uygulanması gereken değişiklikleri sıralı geçişler olarak
+tutar. Uygulanan geçişler 'schema_migration' tablosuna yazılır; her geçiş
+kendi işleminde (transaction) çalışır ve yalnızca bir kez uygulanır.
+init_db.py (Procfile 'release' aşaması) create_all'dan sonra bekleyen
+geçişleri uygular.
+
+Geçişler hem SQLite hem PostgreSQL'de çalışacak şekilde yazılır ve tekrar
+çalıştırılabilir olmalıdır (ör. CREATE INDEX IF NOT EXISTS): yeni bir
+veritabanında aynı indeksler create_all tarafından zaten oluşturulmuş olur.
+
+check_query_plans, puanlama, dışa aktarım ve sonuç sayfalarının sık çalışan
+sorgularının EXPLAIN planlarında beklenen indeksin kullanıldığını ve ayrıca
+sıralama yapılmadığını doğrular.
+
+Kullanım (CLI):
+    python migrations.py                 # bekleyen geçişleri uygula
+    python migrations.py --status        # uygulanmış / bekleyen geçişler
+    python migrations.py --check-plans   # sorgu planlarını kontrol et (başarısızsa çıkış kodu 1)
+"""
+
+import argparse
+import json
+import sys
+from collections import namedtuple
+
+from sqlalchemy import bindparam, func, insert, inspect, literal_column, select, text, update
+
+from app import app, db, Case, ReferenceAnswer, REFERENCE_ANSWER_FIELDS, SchemaMigration, ScoringRun, UserResponse
+
+Migration = namedtuple('Migration', ['id', 'description', 'apply'])
+
+
+def _hot_path_indexes(connection):
+    statements = (
+        # Altın standart / referans yanıt araması (puanlama işleri, dışa aktarım)
+        "CREATE INDEX IF NOT EXISTS ix_reference_answer_case_source ON reference_answer (case_id, source)",
+        # Kullanıcının yanıtları, en yeniden eskiye (my_responses)
+        "CREATE INDEX IF NOT EXISTS ix_user_response_user_created ON user_response (user_id, created_at DESC)",
+        # Vaka bazlı istatistikler ve yeniden puanlama filtreleri
+        "CREATE INDEX IF NOT EXISTS ix_user_response_case_id ON user_response (case_id)",
+    )
+    for statement in statements:
+        connection.execute(text(statement))
+
+
+MIGRATION_BATCH_SIZE = 1000
+
+
+def _archive_llm_raw(connection):
+    """
+    user_response.llm_raw JSON sütunundaki hakem ham yanıtlarını sıkıştırılmış
+    scoring_run satırlarına taşır, hakem sürümünü user_response.judge_version
+    sütununa yazar ve llm_raw sütununu kaldırır (SQLite 3.35+ veya PostgreSQL).
+    """
+    ScoringRun.__table__.create(connection, checkfirst=True)
+    columns = {column['name'] for column in inspect(connection).get_columns('user_response')}
+    if 'judge_version' not in columns:
+        connection.execute(text("ALTER TABLE user_response ADD COLUMN judge_version VARCHAR(150)"))
+    if 'llm_raw' not in columns:
+        return  # Yeni veritabanı: tablo zaten yeni şemayla oluşturuldu
+
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            text("SELECT id, llm_raw FROM user_response WHERE llm_raw IS NOT NULL AND id > :last_id "
+                 "ORDER BY id LIMIT :limit"),
+            {'last_id': last_id, 'limit': MIGRATION_BATCH_SIZE}
+        ).all()
+        if not rows:
+            break
+        archive, versions = [], []
+        for response_id, raw in rows:
+            raw = json.loads(raw) if isinstance(raw, str) else raw
+            if not isinstance(raw, dict):
+                continue  # 'null' olarak yazılmış JSON
+            values = ScoringRun.values_for(response_id, raw)
+            archive.append(values)
+            versions.append({'response_id': response_id, 'version': values['judge_version']})
+        if archive:
+            connection.execute(insert(ScoringRun), archive)
+            table = UserResponse.__table__
+            connection.execute(
+                update(table).where(table.c.id == bindparam('response_id')).values(judge_version=bindparam('version')),
+                versions
+            )
+        last_id = rows[-1][0]
+    connection.execute(text("ALTER TABLE user_response DROP COLUMN llm_raw"))
+
+
+# Case tablosunda referans yanıtların ikinci kopyasını tutan eski sütunlar -> ReferenceAnswer.source
+LEGACY_REFERENCE_COLUMNS = {'chatgpt_response': 'chatgpt', 'gemini_response': 'gemini', 'deepseek_response': 'deepseek'}
+
+
+def _json_value(value):
+    """JSON sütun değerini sözlüğe çevirir (SQLite metin, PostgreSQL ayrıştırılmış değer döndürür)."""
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except json.JSONDecodeError:
+            return {}
+    return value if isinstance(value, dict) else {}
+
+
+def _normalize_reference_answers(connection):
+    """
+    reference_answer.content JSON sütununu alan başına sütunlara (diagnosis, tests,
+    treatment_plan, dosage, extra) böler. Case tablosundaki eski
+    chatgpt/gemini/deepseek_response JSON kopyalarından reference_answer'da
+    karşılığı olmayanları ekler ve bu sütunları ve content'i kaldırır.
+    """
+    table = ReferenceAnswer.__table__
+    field_columns = (*REFERENCE_ANSWER_FIELDS.values(), 'extra')
+    columns = {column['name'] for column in inspect(connection).get_columns('reference_answer')}
+    for column in field_columns:
+        if column not in columns:
+            column_type = 'JSON' if column == 'extra' else 'TEXT'
+            connection.execute(text(f"ALTER TABLE reference_answer ADD COLUMN {column} {column_type}"))
+
+    if 'content' in columns:
+        last_id = 0
+        while True:
+            rows = connection.execute(
+                text("SELECT id, case_id, source, content FROM reference_answer WHERE id > :last_id "
+                     "ORDER BY id LIMIT :limit"),
+                {'last_id': last_id, 'limit': MIGRATION_BATCH_SIZE}
+            ).all()
+            if not rows:
+                break
+            updates = []
+            for row_id, case_id, source, content in rows:
+                values = ReferenceAnswer.values_for(case_id, source, _json_value(content))
+                updates.append({'row_id': row_id, **{column: values[column] for column in field_columns}})
+            connection.execute(
+                update(table).where(table.c.id == bindparam('row_id'))
+                .values(**{column: bindparam(column) for column in field_columns}),
+                updates
+            )
+            last_id = rows[-1][0]
+        connection.execute(text("ALTER TABLE reference_answer DROP COLUMN content"))
+
+    case_columns = {column['name'] for column in inspect(connection).get_columns('case')}
+    legacy = [column for column in LEGACY_REFERENCE_COLUMNS if column in case_columns]
+    if not legacy:
+        return
+    existing = set(connection.execute(select(table.c.case_id, table.c.source)).all())
+    case_table = Case.__table__
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            select(case_table.c.id, *[literal_column(column) for column in legacy])
+            .where(case_table.c.id > last_id).order_by(case_table.c.id).limit(MIGRATION_BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        missing = []
+        for case_id, *contents in rows:
+            for column, content in zip(legacy, contents):
+                source = LEGACY_REFERENCE_COLUMNS[column]
+                content = _json_value(content)
+                if content and (case_id, source) not in existing:
+                    missing.append(ReferenceAnswer.values_for(case_id, source, content))
+        if missing:
+            connection.execute(insert(table), missing)
+        last_id = rows[-1][0]
+    for column in legacy:
+        connection.execute(text(f'ALTER TABLE "case" DROP COLUMN {column}'))
+
+
+def _rescore_claims(connection):
+    """Yeniden puanlama planlaması ve parçaları için sahiplik sütunları (bkz. rescore._claim)."""
+    for table in ('rescore_run', 'rescore_chunk'):
+        columns = {column['name'] for column in inspect(connection).get_columns(table)}
+        if 'claim_token' not in columns:
+            connection.execute(text(f"ALTER TABLE {table} ADD COLUMN claim_token VARCHAR(32)"))
+        if 'claimed_at' not in columns:
+            connection.execute(text(f"ALTER TABLE {table} ADD COLUMN claimed_at TIMESTAMP"))
+
+
+MIGRATIONS = [
+    Migration('0001_hot_path_indexes', "Referans yanıt ve kullanıcı yanıtı sorguları için indeksler",
+              _hot_path_indexes),
+    Migration('0002_scoring_run_archive', "Hakem ham yanıtlarının sıkıştırılmış puanlama arşivine taşınması",
+              _archive_llm_raw),
+    Migration('0003_normalized_reference_answers', "Referans yanıtların alan başına sütunlara ayrılması",
+              _normalize_reference_answers),
+    Migration('0004_rescore_claims', "Yeniden puanlama adımlarının tek bir işe sahiplendirilmesi",
+              _rescore_claims),
+]
+
+
+def applied_migrations():
+    """Uygulanmış geçiş id'lerinin kümesi."""
+    SchemaMigration.__table__.create(db.engine, checkfirst=True)
+    return set(db.session.scalars(select(SchemaMigration.id)))
+
+
+def pending_migrations():
+    applied = applied_migrations()
+    return [migration for migration in MIGRATIONS if migration.id not in applied]
+
+
+def run_migrations():
+    """Bekleyen geçişleri sırayla uygular ve uygulananların id'lerini döndürür."""
+    done = []
+    for migration in pending_migrations():
+        with db.engine.begin() as connection:
+            migration.apply(connection)
+            connection.execute(insert(SchemaMigration).values(id=migration.id))
+        print(f"Geçiş uygulandı: {migration.id} ({migration.description})")
+        done.append(migration.id)
+    return done
+
+
+# --- Sorgu planı kontrolü ---
+
+# (ad, sorgu, kullanılması beklenen indeks, sıralama indeksle mi sağlanmalı)
+HotQuery = namedtuple('HotQuery', ['name', 'statement', 'index', 'ordered'])
+
+
+def hot_queries():
+    return [
+        HotQuery('gold_reference',
+                 select(ReferenceAnswer.diagnosis).where(ReferenceAnswer.case_id == 1, ReferenceAnswer.source == 'gold'),
+                 'ix_reference_answer_case_source', False),
+        HotQuery('my_responses',
+                 select(UserResponse).where(UserResponse.user_id == 1).order_by(UserResponse.created_at.desc()),
+                 'ix_user_response_user_created', True),
+        HotQuery('case_response_count',
+                 select(func.count(UserResponse.id)).where(UserResponse.case_id == 1),
+                 'ix_user_response_case_id', False),
+        HotQuery('scoring_runs',
+                 select(ScoringRun.payload).where(ScoringRun.response_id == 1, ScoringRun.judge_version == 'v1'),
+                 'ix_scoring_run_response_version', False),
+    ]
+
+
+def explain(connection, statement):
+    """Sorgunun plan satırlarını (metin) döndürür."""
+    sql = str(statement.compile(dialect=connection.dialect, compile_kwargs={'literal_binds': True}))
+    if connection.dialect.name == 'sqlite':
+        return [row[-1] for row in connection.execute(text(f"EXPLAIN QUERY PLAN {sql}"))]
+    return [row[0] for row in connection.execute(text(f"EXPLAIN {sql}"))]
+
+
+def check_query_plans():
+    """
+    Her sık sorgu için (ad, plan, hata listesi) döndürür. PostgreSQL'de küçük
+    tablolarda planlayıcı tam taramayı seçebileceği için kontrol sırasında
+    enable_seqscan kapatılır; bu, indeksin KULLANILABİLİR olduğunu doğrular.
+    """
+    results = []
+    with db.engine.connect() as connection:
+        if connection.dialect.name == 'postgresql':
+            connection.execute(text("SET LOCAL enable_seqscan = off"))
+        for query in hot_queries():
+            plan = explain(connection, query.statement)
+            plan_text = "\n".join(plan)
+            problems = []
+            if query.index not in plan_text:
+                problems.append(f"{query.index} kullanılmıyor")
+            if query.ordered and ('TEMP B-TREE' in plan_text or 'Sort' in plan_text):
+                problems.append("sıralama indeksle sağlanmıyor")
+            results.append((query.name, plan, problems))
+        connection.rollback()
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Şema geçişlerini uygular ve sorgu planlarını kontrol eder.")
+    parser.add_argument('--status', action='store_true', help="Uygulanmış ve bekleyen geçişleri göster")
+    parser.add_argument('--check-plans', action='store_true', help="Sık sorguların indeks kullandığını doğrula")
+    args = parser.parse_args()
+
+    with app.app_context():
+        if args.status:
+            applied = applied_migrations()
+            for migration in MIGRATIONS:
+                state = 'uygulandı' if migration.id in applied else 'bekliyor'
+                print(f"{migration.id:<30} {state:<10} {migration.description}")
+        elif args.check_plans:
+            failed = False
+            for name, plan, problems in check_query_plans():
+                print(f"{name}: {'OK' if not problems else 'HATA: ' + ', '.join(problems)}")
+                for line in plan:
+                    print(f"    {line}")
+                failed = failed or bool(problems)
+            sys.exit(1 if failed else 0)
+        else:
+            if not run_migrations():
+                print("Bekleyen geçiş yok.")
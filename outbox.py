@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+Puanlama için işlemsel giden kutusu (transactional outbox).
+
+case_detail, yeni yanıtı ve bir 'scoring_outbox' satırını aynı veritabanı
+işleminde kaydeder; web isteği Redis'e hiç dokunmaz. Kutudaki satırlar:
+
+- Dağıtıcı (dispatch_batch): kutudan en eski satırları alır (PostgreSQL'de
+  FOR UPDATE SKIP LOCKED ile; birden fazla dağıtıcı aynı satırı almaz), bekleyen
+  iş kayıtlarını (bkz. scoring_queues.PendingScoring) ve RQ işlerini tek bir
+  Redis pipeline'ı ile ekler, ardından satırları siler. Redis erişilemezse
+  işlem geri alınır ve satırlar bir sonraki turda yeniden denenir. Kuyruğa
+  ekleme başarılı olup silme başarısız olursa aynı yanıt ikinci kez kuyruğa
+  girebilir; bekleyen iş tekilleştirmesi ve puanlanmış yanıtların atlanması
+  bunu zararsız kılar.
+- Süpürücü (sweep_stragglers): uzun süredir puanlanmamış, hata kaydı olmayan
+  ve kutuda da bulunmayan yanıtları (ör. kutudan önceki sürümde Redis
+  erişilemezken kaydedilmiş veya işi kaybolmuş yanıtlar) kutuya geri ekler.
+
+Dağıtıcı ve süpürücü worker sürecinde bir iş parçacığında çalışır (bkz.
+worker.py, OutboxDispatcher); ayrıca CLI ile tek seferlik çalıştırılabilir.
+
+Kullanım (CLI):
+    python outbox.py            # kutuyu bir kez boşalt
+    python outbox.py --sweep    # önce süpürücüyü çalıştır
+    python outbox.py --status   # kutudaki satır sayısı ve en eski satırın yaşı
+"""
+
+import argparse
+import datetime
+import threading
+import time
+
+from rq import Queue
+from sqlalchemy import delete, exists, func, insert, select
+
+from app import app, db, conn, get_queue, pending_scoring, ScoringOutbox, UserResponse
+from metrics import OUTBOX_DISPATCHED
+from tasks import score_pending_responses
+
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+def dispatch_batch(batch_size=None):
+    """Kutudaki en eski satırları kuyruğa aktarır; aktarılan satır sayısını döndürür."""
+    batch_size = batch_size or app.config['OUTBOX_BATCH_SIZE']
+    rows = db.session.execute(
+        select(ScoringOutbox.id, ScoringOutbox.response_id, ScoringOutbox.user_id, ScoringOutbox.case_id,
+               ScoringOutbox.lane)
+        .order_by(ScoringOutbox.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    ).all()
+    if not rows:
+        db.session.rollback()
+        return 0
+
+    new_pairs = []
+    try:
+        lanes = {}
+        for row in rows:
+            lanes.setdefault(row.lane, []).append((row.user_id, row.case_id, row.response_id))
+        pipe = pending_scoring.redis.pipeline()
+        for lane, items in lanes.items():
+            pairs = pending_scoring.add_many(items)
+            new_pairs.extend(pairs)
+            get_queue(lane).enqueue_many(
+                [Queue.prepare_data(score_pending_responses, (user_id, case_id)) for user_id, case_id in pairs],
+                pipeline=pipe,
+            )
+        pipe.execute()
+    except Exception:
+        db.session.rollback()
+        for user_id, case_id in new_pairs:
+            pending_scoring.release(user_id, case_id)
+        OUTBOX_DISPATCHED.labels('failed').inc(len(rows))
+        raise
+
+    db.session.execute(delete(ScoringOutbox).where(ScoringOutbox.id.in_([row.id for row in rows])))
+    db.session.commit()
+    OUTBOX_DISPATCHED.labels('dispatched').inc(len(rows))
+    return len(rows)
+
+
+def drain(batch_size=None):
+    """Kutu boşalana kadar dağıtır; toplam aktarılan satır sayısını döndürür."""
+    total = 0
+    while True:
+        count = dispatch_batch(batch_size)
+        total += count
+        if count == 0:
+            return total
+
+
+def sweep_stragglers(min_age=None, limit=500):
+    """
+    'min_age' saniyeden eski, puanlanmamış ve kutuda olmayan yanıtları kutuya
+    ekler; eklenen satır sayısını döndürür.
+    """
+    min_age = app.config['OUTBOX_SWEEP_AFTER'] if min_age is None else min_age
+    cutoff = _now() - datetime.timedelta(seconds=min_age)
+    stragglers = db.session.execute(
+        select(UserResponse.id, UserResponse.user_id, UserResponse.case_id)
+        .where(UserResponse.judge_version.is_(None), UserResponse.score_reasons.is_(None),
+               UserResponse.created_at < cutoff,
+               ~exists().where(ScoringOutbox.response_id == UserResponse.id))
+        .order_by(UserResponse.id)
+        .limit(limit)
+    ).all()
+    if stragglers:
+        db.session.execute(insert(ScoringOutbox), [
+            {'response_id': response_id, 'user_id': user_id, 'case_id': case_id, 'lane': 'interactive'}
+            for response_id, user_id, case_id in stragglers
+        ])
+        app.logger.warning("Puanlanmamış %s yanıt puanlama kutusuna yeniden eklendi.", len(stragglers))
+    db.session.commit()
+    OUTBOX_DISPATCHED.labels('swept').inc(len(stragglers))
+    return len(stragglers)
+
+
+def outbox_status():
+    count, oldest = db.session.execute(select(func.count(ScoringOutbox.id), func.min(ScoringOutbox.created_at))).one()
+    age = None
+    if oldest is not None:
+        oldest = oldest if oldest.tzinfo else oldest.replace(tzinfo=datetime.timezone.utc)
+        age = round((_now() - oldest).total_seconds(), 1)
+    return {'pending': count, 'oldest_age_seconds': age}
+
+
+class OutboxDispatcher(threading.Thread):
+    """
+    Kutuyu OUTBOX_POLL_INTERVAL aralıklarla boşaltan ve OUTBOX_SWEEP_INTERVAL
+    aralıklarla süpürücüyü çalıştıran arka plan iş parçacığı.
+    """
+
+    def __init__(self):
+        super().__init__(name='outbox-dispatcher', daemon=True)
+        self.stopping = threading.Event()
+
+    def stop(self):
+        self.stopping.set()
+
+    def run(self):
+        poll_interval = app.config['OUTBOX_POLL_INTERVAL']
+        sweep_interval = app.config['OUTBOX_SWEEP_INTERVAL']
+        next_sweep = 0.0
+        while not self.stopping.is_set():
+            with app.app_context():
+                try:
+                    if sweep_interval and next_sweep <= time.monotonic():
+                        sweep_stragglers()
+                        next_sweep = time.monotonic() + sweep_interval
+                    drain()
+                except Exception as e:
+                    app.logger.error("Puanlama kutusu dağıtılamadı, yeniden denenecek: %s", e)
+                    db.session.rollback()
+                finally:
+                    db.session.remove()
+            self.stopping.wait(poll_interval)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Puanlama kutusunu RQ kuyruğuna aktarır.")
+    parser.add_argument('--sweep', action='store_true', help="Önce puanlanmamış yanıtları kutuya ekle")
+    parser.add_argument('--status', action='store_true', help="Kutunun durumunu göster")
+    args = parser.parse_args()
+
+    with app.app_context():
+        if args.status:
+            print(outbox_status())
+        else:
+            if conn is None:
+                raise SystemExit("HATA: REDIS_URL tanımlı değil, kutu dağıtılamaz.")
+            if args.sweep:
+                print(f"{sweep_stragglers()} yanıt kutuya eklendi.")
+            print(f"{drain()} satır kuyruğa aktarıldı.")
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""
+Hakem LLM'den önce çalışan yerel (ağ bağlantısız) ön puanlayıcı.
+
+Tanı ve ilaç yanıtlarının çoğu, altın standart alanıyla (tanı, tedavi_plani,
+dozaj) neredeyse birebir örtüşen kısa terimlerdir. Ön puanlayıcı bu açık
+eşleşmeleri hakeme göndermeden puanlar; emin olmadığı her yanıtı hakeme bırakır.
+
+Karşılaştırma, altın standart metni ve eş anlamlılarına karşı yapılır:
+
+- Normalizasyon: Türkçe'ye uygun küçük harf (I -> ı, İ -> i), noktalama
+  atılır, ardından diakritikler katlanır (ç -> c, ı -> i, ...) ki Türkçe
+  karakter kullanmadan yazılan yanıtlar da eşleşsin.
+- Kısaltmalar: genel sözlük (KISALTMALAR) ve vakaya özgü eş anlamlılar.
+  Vakaya özgü liste altın standart JSON'unda tutulur:
+      "gold_standard_response": {"tanı": "Akut Otitis Media", ...,
+                                 "es_anlamlilar": {"tanı": ["AOM", "Orta kulak iltihabı"]}}
+- Kelime eşleşmesi: yanıt, bir varyantın tüm kelimelerini içeriyor ve en
+  fazla EXTRA_TOKENS ek kelime taşıyorsa (ör. "Sol akut otitis media"). Ek
+  kelime yalnızca yön/taraf bildiren nötr bir kelime olabilir (NEUTRAL_EXTRA_TOKENS);
+  "olası", "kronik", "gerekir" gibi anlamı değiştiren kelimeler hakeme gider.
+- Karakter n-gram benzerliği: yazım hatalarını yakalamak için (ör. "otitis medya");
+  yalnızca kelime sayısı aynı olan yanıtlara uygulanır.
+
+Kelime ve n-gram kuralları, yanıttaki ve varyanttaki sayılar (doz, süre,
+sıklık) birebir aynı değilse uygulanmaz. Dozaj kategorisinde (EXACT_ONLY_FIELDS)
+yalnızca birebir eşleşme kabul edilir; küçük bir metin farkı büyük bir doz
+farkı olabilir.
+
+Olumsuzlama içeren yanıtlar ve altın standartlar ("... değil", "ekarte",
+Türkçe -me/-ma olumsuzluk ekiyle çekimlenmiş fiiller: "gerekmez",
+"önerilmez", "yapılmamalı") birebir eşleşme dışında her zaman hakeme gider.
+Boş yanıtlar 0 puan alır; ancak altın standart kendisi bir olumsuzlama veya
+"gerekmez" ifadesiyse (ör. "Doz ayarlaması gerekmez") boş yanıt doğru olabilir
+ve hakeme gider. Sözcük düzeyinde örtüşmeme, anlamsal bir ıska
+anlamına gelmez (ör. "orta kulak iltihabı"); bu nedenle ön puanlayıcı hiçbir
+zaman sözcük farkına dayanarak düşük puan VERMEZ, bu yanıtlar hakeme gider.
+
+Kararlar puanlama arşivinde (scoring_run) 'decision_source' altında 'prescorer'
+olarak işaretlenir (bkz. tasks.score_answers); analizde hakem kararlarından ayrılabilir.
+"""
+
+import json
+import re
+import unicodedata
+
+# Kurallar veya sözlük değiştiğinde ARTIRIN (kararların ham kaydına yazılır)
+PRESCORER_VERSION = 'p3'
+
+# Altın standart JSON'unda vakaya özgü eş anlamlıların tutulduğu anahtar
+SYNONYMS_KEY = 'es_anlamlilar'
+
+EXTRA_TOKENS = 1
+NGRAM_SIZE = 3
+NGRAM_THRESHOLD = 0.8
+
+# Yalnızca birebir eşleşmeyle karar verilen altın standart alanları
+EXACT_ONLY_FIELDS = {'dozaj'}
+
+# Kelime eşleşmesinde izin verilen tek ek kelime (katlanmış biçimde)
+NEUTRAL_EXTRA_TOKENS = {'sol', 'sag', 'solda', 'sagda', 'bilateral'}
+
+# Katlanmış (diakritiksiz) biçimde: kısaltma -> açılım
+KISALTMALAR = {
+    'aom': 'akut otitis media',
+    'tkp': 'toplum kokenli pnomoni',
+    'iye': 'idrar yolu enfeksiyonu',
+    'usye': 'ust solunum yolu enfeksiyonu',
+    'asye': 'alt solunum yolu enfeksiyonu',
+    'age': 'akut gastroenterit',
+    'akg': 'akciger grafisi',
+    'pa': 'posteroanterior',
+    'tks': 'tam kan sayimi',
+    'hemogram': 'tam kan sayimi',
+    'crp': 'c reaktif protein',
+    'tit': 'tam idrar tetkiki',
+}
+
+# Yanıtı veya kategori etiketini süsleyen, anlam taşımayan kelimeler
+_STOPWORDS = {'ve', 'ile', 'bir', 'icin', 'ilac', 'grubu', 'etken', 'madde', 'tani', 'tedavi', 'plani'}
+
+_NEGATIONS = {'degil', 'yok', 'yoktur', 'disla', 'dislanir', 'dislandi', 'ekarte', 'olmayan', 'haric'}
+# Fiilin -me/-ma olumsuzluk ekiyle çekimlenmiş biçimleri (katlanmış): gerekmez,
+# onerilmez, yapilmamali, gerekmiyor, istenmedi, vermeyin, gerekmemektedir...
+_NEGATED_VERB = re.compile(
+    r'\w{2,}m[ae](z|zlar|zler|mali|meli|di|mis|yin|yiniz|yacak|yecek|makta|mekte|maktadir|mektedir)(dir|tir)?$'
+    r'|\w{2,}m(iyor|uyor)(lar|ler)?(dir|tir)?$'
+)
+_NUMBER = re.compile(r'\d+(?:[.,]\d+)?')
+
+_FOLD = str.maketrans('çğıöşüâîû', 'cgiosuaiu')
+_NON_WORD = re.compile(r'[^\w]+', re.UNICODE)
+
+
+def fold(text):
+    """Türkçe'ye uygun küçük harf, noktalama temizliği ve diakritik katlama."""
+    if text is None:
+        return ''
+    text = str(text).replace('I', 'ı').replace('İ', 'i').lower().translate(_FOLD)
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return ' '.join(_NON_WORD.sub(' ', text).replace('_', ' ').split())
+
+
+def tokens(text):
+    """Katlanmış metnin kelimeleri; kısaltmalar açılır, dolgu kelimeleri atılır."""
+    words = []
+    for word in fold(text).split():
+        words.extend(KISALTMALAR.get(word, word).split())
+    return [word for word in words if word not in _STOPWORDS]
+
+
+def is_negated(words):
+    """Kelimelerden biri olumsuzlama sözcüğü veya olumsuz çekimli bir fiilse True."""
+    return any(word in _NEGATIONS or _NEGATED_VERB.match(word) for word in words)
+
+
+def numbers(text):
+    """Metindeki sayılar, sıralı (ör. '80-90 mg/kg/gün, 2 dozda' -> ['2', '80', '90'])."""
+    return sorted(number.replace(',', '.') for number in _NUMBER.findall(fold(text)))
+
+
+def ngrams(text, size=NGRAM_SIZE):
+    padded = f" {text} "
+    return {padded[i:i + size] for i in range(max(1, len(padded) - size + 1))}
+
+
+def ngram_similarity(a, b):
+    """Karakter n-gram kümelerinin Dice benzerliği (0-1)."""
+    if not a or not b:
+        return 0.0
+    grams_a, grams_b = ngrams(a), ngrams(b)
+    return 2 * len(grams_a & grams_b) / (len(grams_a) + len(grams_b))
+
+
+def gold_variants(gold_content, gold_key):
+    """Altın standart alanı ve vakaya özgü eş anlamlıları."""
+    variants = [gold_content.get(gold_key)]
+    synonyms = (gold_content.get(SYNONYMS_KEY) or {}).get(gold_key) or []
+    variants.extend(synonyms if isinstance(synonyms, list) else [synonyms])
+    return [str(v) for v in variants if v and str(v).strip()]
+
+
+def _verdict(score, rule, reasoning, variant=None):
+    raw = {"score": score, "reasoning": reasoning, "source": "prescorer", "rule": rule,
+           "version": PRESCORER_VERSION}
+    if variant is not None:
+        raw["matched"] = variant
+    return score, {"reason": reasoning, "raw": json.dumps(raw, ensure_ascii=False), "source": "prescorer"}
+
+
+def prescore(user_answer, variants, gold_key=None):
+    """
+    Yanıtı altın standart varyantlarıyla karşılaştırır. Emin olunan durumda
+    (score, details) döndürür, aksi halde None (yanıt hakeme gönderilmeli).
+    'gold_key' EXACT_ONLY_FIELDS içindeyse yalnızca birebir eşleşme kabul edilir.
+    """
+    user_tokens = tokens(user_answer)
+    if not user_tokens:
+        # "Gerekmez" türü bir altın standartta boş yanıt doğru olabilir
+        if any(is_negated(tokens(variant)) for variant in variants):
+            return None
+        return _verdict(0, 'empty', "Yanıt boş.")
+    if not variants:
+        return None
+
+    # Olumsuzlama içeren yanıt veya varyant yalnızca birebir eşleşebilir
+    exact_only = gold_key in EXACT_ONLY_FIELDS or is_negated(user_tokens)
+    user_text = ' '.join(user_tokens)
+    user_numbers = numbers(user_answer)
+    for variant in variants:
+        variant_tokens = tokens(variant)
+        if not variant_tokens:
+            continue
+        variant_text = ' '.join(variant_tokens)
+        if user_text == variant_text:
+            return _verdict(100, 'exact', "Yanıt altın standartla birebir örtüşüyor.", variant)
+        if exact_only or is_negated(variant_tokens) or numbers(variant) != user_numbers:
+            continue
+        extra = set(user_tokens) - set(variant_tokens)
+        if (set(variant_tokens) <= set(user_tokens) and len(user_tokens) - len(variant_tokens) <= EXTRA_TOKENS
+                and extra <= NEUTRAL_EXTRA_TOKENS):
+            return _verdict(100, 'tokens', "Yanıt altın standardın tüm terimlerini içeriyor.", variant)
+        if len(user_tokens) == len(variant_tokens) and ngram_similarity(user_text, variant_text) >= NGRAM_THRESHOLD:
+            return _verdict(100, 'ngram', "Yanıt altın standartla (yazım farkı dışında) örtüşüyor.", variant)
+    return None
@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+"""
+Hakem LLM çağrıları için istemci taraflı hız sınırlama, yeniden deneme ve devre kesici.
+
+- Hız sınırı: dakikadaki istek ve token sayısı için iki token kovası. Redis
+  varsa kovalar tüm worker süreçleri arasında (atomik bir Lua betiğiyle)
+  paylaşılır, yoksa süreç içinde tutulur.
+- Yeniden deneme: 429 ve geçici 5xx/zaman aşımı hataları, rastgele sapmalı
+  (jitter) üstel bekleme ile bir deneme bütçesi dahilinde tekrarlanır.
+- Devre kesici: art arda çok sayıda geçici hata alındığında devre belirli bir
+  süre açılır ve çağrılar hiç gönderilmeden JudgeUnavailable ile reddedilir.
+
+Bütçe tükendiğinde veya devre açıkken JudgeUnavailable fırlatılır; çağıran taraf
+bu durumda skoru 0 olarak KAYDETMEMELİ, işi gecikmeli olarak yeniden kuyruğa almalıdır.
+"""
+
+import random
+import threading
+import time
+
+from redis.exceptions import RedisError
+
+from metrics import (JUDGE_CALL_SECONDS, JUDGE_RETRIES, JUDGE_UNAVAILABLE, record_judge_error,
+                     record_judge_tokens)
+
+# Geçici kabul edilen HTTP durum kodları (google.api_core istisnalarının 'code' alanı)
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class JudgeUnavailable(Exception):
+    """Hakem LLM geçici olarak kullanılamıyor; iş 'retry_after' saniye sonra yeniden denenmeli."""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def is_retryable(error):
+    """Hatanın geçici (yeniden denenebilir) olup olmadığını belirler."""
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    return getattr(error, 'code', None) in RETRYABLE_STATUS_CODES
+
+
+def estimate_tokens(prompt, expected_output_tokens=150):
+    """İstem için kaba token tahmini (~4 karakter/token) ve beklenen yanıt payı."""
+    return len(prompt) // 4 + expected_output_tokens
+
+
+# İki kovayı (istek ve token) birlikte ve atomik olarak tüketir.
+# Yeterli kapasite yoksa hiçbir şey tüketmez ve beklenmesi gereken süreyi döndürür.
+_TAKE_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local function refill(key, capacity, rate)
+    local v = redis.call('HMGET', key, 'tokens', 'ts')
+    local tokens = tonumber(v[1]) or capacity
+    local ts = tonumber(v[2]) or now
+    return math.min(capacity, tokens + math.max(0, now - ts) * rate)
+end
+local req_cap, req_rate = tonumber(ARGV[1]), tonumber(ARGV[2])
+local tok_cap, tok_rate = tonumber(ARGV[3]), tonumber(ARGV[4])
+local need = tonumber(ARGV[5])
+local req = refill(KEYS[1], req_cap, req_rate)
+local tok = refill(KEYS[2], tok_cap, tok_rate)
+local wait = 0
+if req < 1 then wait = math.max(wait, (1 - req) / req_rate) end
+if tok < need then wait = math.max(wait, (need - tok) / tok_rate) end
+if wait == 0 then
+    req = req - 1
+    tok = tok - need
+end
+redis.call('HSET', KEYS[1], 'tokens', req, 'ts', now)
+redis.call('HSET', KEYS[2], 'tokens', tok, 'ts', now)
+redis.call('EXPIRE', KEYS[1], 120)
+redis.call('EXPIRE', KEYS[2], 120)
+return tostring(wait)
+"""
+
+
+class TokenBucketLimiter:
+    """Dakikadaki istek (rpm) ve token (tpm) sınırları için paylaşımlı token kovası."""
+
+    def __init__(self, redis_conn, requests_per_minute, tokens_per_minute, name='judge'):
+        self.redis = redis_conn
+        self.req_capacity = float(requests_per_minute)
+        self.req_rate = requests_per_minute / 60.0
+        self.tok_capacity = float(tokens_per_minute)
+        self.tok_rate = tokens_per_minute / 60.0
+        self.keys = [f"rate_limit:{name}:requests", f"rate_limit:{name}:tokens"]
+        self._script = redis_conn.register_script(_TAKE_SCRIPT) if redis_conn is not None else None
+        self._lock = threading.Lock()
+        self._local = {'req': self.req_capacity, 'tok': self.tok_capacity, 'ts': time.monotonic()}
+
+    def try_acquire(self, tokens):
+        """Kapasite varsa tüketir ve 0 döndürür; yoksa beklenmesi gereken saniyeyi döndürür."""
+        tokens = min(tokens, self.tok_capacity)
+        if self._script is not None:
+            try:
+                wait = self._script(keys=self.keys, args=[
+                    self.req_capacity, self.req_rate, self.tok_capacity, self.tok_rate, tokens
+                ])
+                return float(wait)
+            except RedisError as e:
+                print(f"UYARI: Paylaşımlı hız sınırlayıcıya ulaşılamadı, yerel sınır kullanılıyor: {e}")
+        return self._try_acquire_local(tokens)
+
+    def _try_acquire_local(self, tokens):
+        with self._lock:
+            now = time.monotonic()
+            elapsed = now - self._local['ts']
+            req = min(self.req_capacity, self._local['req'] + elapsed * self.req_rate)
+            tok = min(self.tok_capacity, self._local['tok'] + elapsed * self.tok_rate)
+            wait = 0.0
+            if req < 1:
+                wait = max(wait, (1 - req) / self.req_rate)
+            if tok < tokens:
+                wait = max(wait, (tokens - tok) / self.tok_rate)
+            if wait == 0:
+                req -= 1
+                tok -= tokens
+            self._local.update(req=req, tok=tok, ts=now)
+            return wait
+
+
+class CircuitBreaker:
+    """
+    Art arda 'threshold' geçici hatadan sonra devreyi 'cooldown' saniye açar.
+    Durum Redis'te tutulduğu için tüm worker'lar aynı devreyi görür.
+    """
+
+    def __init__(self, redis_conn, threshold, cooldown, name='judge'):
+        self.redis = redis_conn
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures_key = f"circuit:{name}:failures"
+        self.open_until_key = f"circuit:{name}:open_until"
+        self._local = {'failures': 0, 'open_until': 0.0}
+
+    def check(self):
+        """Devre açıksa JudgeUnavailable fırlatır."""
+        open_until = self._get_open_until()
+        remaining = open_until - time.time()
+        if remaining > 0:
+            raise JudgeUnavailable("Hakem LLM devre kesicisi açık.", retry_after=remaining)
+
+    def record_success(self):
+        if self.redis is not None:
+            try:
+                self.redis.delete(self.failures_key)
+                return
+            except RedisError:
+                pass
+        self._local['failures'] = 0
+
+    def record_failure(self):
+        failures = None
+        if self.redis is not None:
+            try:
+                pipe = self.redis.pipeline()
+                pipe.incr(self.failures_key)
+                pipe.expire(self.failures_key, max(60, self.cooldown * 2))
+                failures = pipe.execute()[0]
+            except RedisError:
+                failures = None
+        if failures is None:
+            self._local['failures'] += 1
+            failures = self._local['failures']
+        if failures >= self.threshold:
+            self._open()
+
+    def _open(self):
+        open_until = time.time() + self.cooldown
+        print(f"UYARI: Hakem LLM devre kesicisi {self.cooldown} saniyeliğine açıldı.")
+        if self.redis is not None:
+            try:
+                pipe = self.redis.pipeline()
+                pipe.set(self.open_until_key, open_until, ex=self.cooldown + 5)
+                pipe.delete(self.failures_key)
+                pipe.execute()
+                return
+            except RedisError:
+                pass
+        self._local.update(open_until=open_until, failures=0)
+
+    def _get_open_until(self):
+        if self.redis is not None:
+            try:
+                value = self.redis.get(self.open_until_key)
+                return float(value) if value else 0.0
+            except RedisError:
+                pass
+        return self._local['open_until']
+
+
+class JudgeCallGuard:
+    """Hakem LLM çağrısını hız sınırı, yeniden deneme ve devre kesici ile sarar."""
+
+    def __init__(self, redis_conn, requests_per_minute, tokens_per_minute, max_retries=5,
+                 base_delay=1.0, max_delay=30.0, retry_budget_seconds=120.0,
+                 breaker_threshold=5, breaker_cooldown=60):
+        self.limiter = TokenBucketLimiter(redis_conn, requests_per_minute, tokens_per_minute)
+        self.breaker = CircuitBreaker(redis_conn, breaker_threshold, breaker_cooldown)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_budget_seconds = retry_budget_seconds
+
+    def backoff_delay(self, attempt):
+        """'Full jitter' üstel bekleme süresi."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def call(self, func, prompt, category='unknown'):
+        """
+        func(prompt) çağrısını korumalı olarak yapar. Kalıcı hatalar (örn. 400)
+        olduğu gibi fırlatılır; geçici hatalarda bütçe tükenirse JudgeUnavailable fırlatılır.
+        Her deneme 'category' etiketiyle ölçülür (bkz. metrics.py).
+        """
+        deadline = time.monotonic() + self.retry_budget_seconds
+        tokens = estimate_tokens(prompt)
+        attempt = 0
+        while True:
+            try:
+                self.breaker.check()
+            except JudgeUnavailable:
+                JUDGE_UNAVAILABLE.labels('circuit_open').inc()
+                raise
+
+            wait = self.limiter.try_acquire(tokens)
+            while wait > 0:
+                if time.monotonic() + wait > deadline:
+                    JUDGE_UNAVAILABLE.labels('rate_limit').inc()
+                    raise JudgeUnavailable("Hakem LLM hız sınırı bütçesi aşıldı.", retry_after=wait)
+                time.sleep(wait)
+                wait = self.limiter.try_acquire(tokens)
+
+            started = time.perf_counter()
+            try:
+                result = func(prompt)
+            except Exception as e:
+                JUDGE_CALL_SECONDS.labels(category, 'error').observe(time.perf_counter() - started)
+                record_judge_error(category, e)
+                if not is_retryable(e):
+                    raise
+                self.breaker.record_failure()
+                delay = self.backoff_delay(attempt)
+                attempt += 1
+                if attempt > self.max_retries or time.monotonic() + delay > deadline:
+                    JUDGE_UNAVAILABLE.labels('retries_exhausted').inc()
+                    raise JudgeUnavailable(f"Hakem LLM geçici hatası, deneme bütçesi tükendi: {e}",
+                                           retry_after=self.breaker.cooldown) from e
+                JUDGE_RETRIES.labels(category).inc()
+                print(f"UYARI: Hakem LLM geçici hatası ({e}), {delay:.1f} sn sonra yeniden denenecek.")
+                time.sleep(delay)
+                continue
+
+            JUDGE_CALL_SECONDS.labels(category, 'ok').observe(time.perf_counter() - started)
+            record_judge_tokens(category, result)
+            self.breaker.record_success()
+            return result
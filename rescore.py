@@ -0,0 +1,411 @@
+# -*- coding: utf-8 -*-
+"""
+Toplu yeniden puanlama hattı.
+
+Hakem istemi veya modeli değiştiğinde tüm UserResponse kayıtlarının yeniden
+puanlanması için kullanılır:
+
+1. start_rescore: bir RescoreRun oluşturur; etkilenen vakaların altın standart
+   yanıtlarını TEK sorguda alıp çalıştırmaya sabitler (gold_snapshot).
+2. plan_rescore: yanıt id'lerini anahtar kümesi (keyset) sayfalamasıyla
+   okuyarak ardışık id aralıklarına (RescoreChunk) böler ve her parçayı kuyruğa ekler.
+3. rescore_chunk: parçadaki yanıtları küçük gruplar halinde eşzamanlı puanlar,
+   sonuçları toplu UPDATE ile yazar, hakem ham yanıtlarını puanlama arşivine
+   (ScoringRun) ekler; skor özetlerini ve ilerlemeyi (cursor_id) aynı işlemde
+   günceller.
+
+Her adım veritabanındaki kontrol noktasından devam edebilir; resume_rescore
+yarım kalmış bir çalıştırmayı kaldığı yerden sürdürür.
+
+Planlama ve her parça aynı anda yalnızca bir iş tarafından yürütülür: iş
+başlarken satırı koşullu bir UPDATE ile sahiplenir (claim_token, claimed_at)
+ve sahipliği her grubun yazıldığı işlemde yeniler. Sahiplik başka bir işe
+geçtiyse grup geri alınır ve iş durur; böylece skor özetleri, ilerleme ve
+puanlama arşivi iki kez güncellenmez. resume_rescore yalnızca sahipliği
+RESCORE_LEASE_SECONDS boyunca yenilenmemiş (takılmış) adımları yeniden kuyruğa ekler.
+
+İşler 'rescore' şeridine (yönetici paneli) veya 'backfill' şeridine eklenir
+(bkz. scoring_queues.py); etkileşimli puanlamaların önüne geçmezler. Aynı
+vakaları kapsayan tamamlanmamış bir çalıştırma varsa yenisi başlatılmaz.
+Redis yapılandırılmamışsa işler kuyruğa eklenemez; çalıştırma yalnızca
+komut satırından --inline ile (aynı süreçte) yapılabilir, web isteği içinde
+hiçbir zaman puanlama yapılmaz.
+
+Kullanım (CLI):
+    python rescore.py [--case-id ID ...] [--chunk-size N] [--lane rescore|backfill] [--inline]
+    python rescore.py --resume RUN_ID [--lane rescore|backfill] [--inline]
+    python rescore.py --status RUN_ID
+"""
+
+import argparse
+import datetime
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import func, insert, or_, select, true, update
+
+from app import (app, db, get_queue, User, UserResponse, ReferenceAnswer, RescoreRun, RescoreChunk, ScoringRun,
+                 JUDGE_VERSION)
+from aggregates import SCORE_METRICS, add_response_delta, apply_deltas, new_deltas
+from judge_backends import ReplayMiss
+from rate_limiter import JudgeUnavailable
+from tasks import build_user_answers, score_answers
+
+# Parça içindeki yanıtları eşzamanlı puanlamak için havuz
+response_executor = ThreadPoolExecutor(max_workers=app.config['WORKER_CONCURRENCY'], thread_name_prefix='rescore')
+
+RESCORE_JOB_TIMEOUT = 3600
+
+
+class RescoreQueueUnavailable(RuntimeError):
+    """Puanlama kuyruğu (Redis) yok ve çalıştırma inline istenmedi."""
+
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+def _lease_expired(model):
+    """Sahipliği yok veya RESCORE_LEASE_SECONDS boyunca yenilenmemiş satırlar."""
+    expired = _now() - datetime.timedelta(seconds=app.config['RESCORE_LEASE_SECONDS'])
+    return or_(model.claimed_at.is_(None), model.claimed_at < expired)
+
+
+def _claim(model, row_id, claim, status):
+    """
+    Satırı ('status' durumundaysa) bu iş adına sahiplenir. Sahipsiz, süresi
+    dolmuş, henüz hiçbir işin üstlenmediği (yalnızca kuyruğa eklenmiş) veya
+    zaten bu işe ait satırlar sahiplenilebilir. Başarılıysa True.
+    """
+    result = db.session.execute(
+        update(model)
+        .where(model.id == row_id, model.status == status,
+               or_(model.claim_token.is_(None), model.claim_token == claim, _lease_expired(model)))
+        .values(claim_token=claim, claimed_at=_now())
+    )
+    db.session.commit()
+    return result.rowcount == 1
+
+
+def _renew(model, row_id, claim, claimed_at=None):
+    """Sahipliği açık işlem içinde yeniler; sahiplik başka bir işe geçtiyse False (çağıran geri almalı)."""
+    result = db.session.execute(
+        update(model).where(model.id == row_id, model.claim_token == claim)
+        .values(claimed_at=claimed_at or _now())
+    )
+    return result.rowcount == 1
+
+
+def _mark_dispatched(model, row_ids):
+    """Kuyruğa eklenen adımların sahipliğini sıfırlar: ilk başlayan iş sahiplenir, eski iş durur."""
+    if row_ids:
+        db.session.execute(update(model).where(model.id.in_(row_ids)).values(claim_token=None, claimed_at=_now()))
+        db.session.commit()
+
+
+def stalled_run_ids(run_ids):
+    """Verilen çalıştırmalardan takılmış olanlar (sahipliği süresi dolmuş planlama veya parça)."""
+    if not run_ids:
+        return set()
+    planning = db.session.scalars(
+        select(RescoreRun.id).where(RescoreRun.id.in_(run_ids), RescoreRun.status == 'planning',
+                                    _lease_expired(RescoreRun))
+    )
+    chunks = db.session.scalars(
+        select(RescoreChunk.run_id).where(RescoreChunk.run_id.in_(run_ids), RescoreChunk.status == 'pending',
+                                          _lease_expired(RescoreChunk))
+    )
+    return set(planning) | set(chunks)
+
+
+def _require_queue(inline, lane):
+    if not inline and get_queue(lane) is None:
+        raise RescoreQueueUnavailable(
+            "Puanlama kuyruğu (Redis) yapılandırılmamış; yeniden puanlamayı komut satırından "
+            "çalıştırın: python rescore.py --inline"
+        )
+
+# Puanlama için okunan sütunlar (gerekçeler gibi JSON sütunları okunmaz).
+# Eski skorlar, kullanıcı bilgileri ve süre, skor özetlerinin güncellenmesi için okunur.
+_ANSWER_COLUMNS = (
+    UserResponse.id, UserResponse.case_id, UserResponse.user_diagnosis, UserResponse.user_tests,
+    UserResponse.user_drug_class, UserResponse.user_active_ingredient, UserResponse.user_dosage_notes,
+    UserResponse.duration_seconds, User.profession, User.experience,
+    UserResponse.judge_version.isnot(None).label('was_scored'),
+    *[getattr(UserResponse, column) for column in SCORE_METRICS],
+)
+
+
+def _response_filter(run):
+    """Çalıştırmanın vaka filtresini (varsa) döndürür."""
+    if run.case_ids:
+        return UserResponse.case_id.in_(run.case_ids)
+    return true()
+
+
+def find_active_run(case_ids=None):
+    """Verilen vakaların tamamını kapsayan, tamamlanmamış bir çalıştırma varsa döndürür."""
+    wanted = set(case_ids or ())
+    active = db.session.scalars(
+        select(RescoreRun).where(RescoreRun.status.in_(('planning', 'running'))).order_by(RescoreRun.id)
+    )
+    for run in active:
+        if not run.case_ids or (wanted and wanted <= set(run.case_ids)):
+            return run
+    return None
+
+
+def start_rescore(case_ids=None, chunk_size=100, inline=False, lane='rescore'):
+    """
+    Yeni bir yeniden puanlama çalıştırması oluşturur ve planlamayı başlatır.
+    Aynı vakaları kapsayan tamamlanmamış bir çalıştırma varsa yenisi
+    oluşturulmaz, mevcut çalıştırma döndürülür. Redis yoksa ve 'inline'
+    verilmediyse çalıştırma oluşturulmadan RescoreQueueUnavailable fırlatılır.
+    """
+    _require_queue(inline, lane)
+    active = find_active_run(case_ids)
+    if active is not None:
+        app.logger.info("Yeniden puanlama zaten sürüyor (Run %s), yeni çalıştırma başlatılmadı.", active.id)
+        return active
+
+    run = RescoreRun(case_ids=case_ids or None, chunk_size=chunk_size, judge_version=JUDGE_VERSION)
+
+    references = ReferenceAnswer.load_many(db.session, run.case_ids, sources=['gold'])
+    run.gold_snapshot = {str(case_id): sources['gold'] for case_id, sources in references.items() if 'gold' in sources}
+    run.total = db.session.scalar(select(func.count(UserResponse.id)).where(_response_filter(run)))
+
+    run.claimed_at = _now()
+    db.session.add(run)
+    db.session.commit()
+    _dispatch(plan_rescore, run.id, inline=inline, lane=lane)
+    return run
+
+
+def resume_rescore(run_id, inline=False, lane='rescore'):
+    """
+    Yarım kalmış bir çalıştırmanın takılmış parçalarını ve (gerekirse)
+    planlamasını yeniden başlatır. Kuyrukta bekleyen, çalışan veya ertelenmiş
+    (sahipliği süresi dolmamış) adımlar yeniden kuyruğa eklenmez.
+    """
+    _require_queue(inline, lane)
+    run = db.session.get(RescoreRun, run_id)
+    if run is None or run.status == 'done':
+        return run
+    stalled = db.session.scalars(
+        select(RescoreChunk.id).where(RescoreChunk.run_id == run_id, RescoreChunk.status == 'pending',
+                                      _lease_expired(RescoreChunk))
+    ).all()
+    plan_stalled = run.status == 'planning' and db.session.scalar(
+        select(RescoreRun.id).where(RescoreRun.id == run_id, _lease_expired(RescoreRun))
+    ) is not None
+    _mark_dispatched(RescoreChunk, stalled)
+    if plan_stalled:
+        _mark_dispatched(RescoreRun, [run_id])
+    for chunk_id in stalled:
+        _dispatch(rescore_chunk, run_id, chunk_id, inline=inline, lane=lane)
+    if plan_stalled:
+        _dispatch(plan_rescore, run_id, inline=inline, lane=lane)
+    elif run.status == 'running':
+        _finish_run_if_complete(run_id)
+    return run
+
+
+def plan_rescore(run_id, inline=False, lane='rescore'):
+    """
+    Yanıtları keyset sayfalamasıyla parçalara böler ve her parçayı kuyruğa ekler.
+    Her parça, plan_cursor ile aynı işlemde kaydedilir; böylece planlama da devam ettirilebilir.
+    Planlamayı başka bir iş sahiplendiyse hiçbir şey yapılmaz.
+    """
+    with app.app_context():
+        claim = uuid.uuid4().hex
+        if not _claim(RescoreRun, run_id, claim, 'planning'):
+            app.logger.info("Run %s planlaması başka bir işte sürüyor (veya bitti), atlandı.", run_id)
+            return
+        run = db.session.get(RescoreRun, run_id)
+        while True:
+            ids = db.session.scalars(
+                select(UserResponse.id)
+                .where(UserResponse.id > run.plan_cursor, _response_filter(run))
+                .order_by(UserResponse.id)
+                .limit(run.chunk_size)
+            ).all()
+            if not ids:
+                break
+            if not _renew(RescoreRun, run_id, claim):
+                db.session.rollback()
+                app.logger.warning("Run %s planlamasının sahipliği başka bir işe geçti, durduruldu.", run_id)
+                return
+            chunk = RescoreChunk(run_id=run.id, first_id=ids[0], last_id=ids[-1], cursor_id=ids[0] - 1,
+                                 claimed_at=_now())
+            run.plan_cursor = ids[-1]
+            db.session.add(chunk)
+            db.session.commit()
+            _dispatch(rescore_chunk, run.id, chunk.id, inline=inline, lane=lane)
+
+        if not _renew(RescoreRun, run_id, claim):
+            db.session.rollback()
+            return
+        run.status = 'running'
+        db.session.commit()
+        _finish_run_if_complete(run_id)
+
+
+def _score_row(row, gold_content):
+    """Tek bir yanıtı puanlar ve toplu UPDATE için parametre sözlüğünü döndürür."""
+    if gold_content is None:
+        return {'id': row.id, 'score_reasons': {"error": "Altın Standart yanıt bulunamadı."}}
+    with app.app_context():
+        values = score_answers(build_user_answers(row), gold_content, row.id)
+    values['id'] = row.id
+    return values
+
+
+def rescore_chunk(run_id, chunk_id, deferrals=0, inline=False, lane='rescore', claim=None):
+    """
+    Bir parçayı kaldığı yerden (cursor_id) itibaren puanlar. Her grup toplu
+    UPDATE ile yazılır ve ilerleme aynı işlemde kaydedilir. Hakem ulaşılamazsa
+    parça gecikmeli olarak yeniden kuyruğa alınır. Replay arka ucunda saklanmış
+    karar yoksa (ReplayMiss) grup yazılmaz ve iş başarısız olur; parça
+    'pending' kalır ve sahipliğin süresi dolunca resume ile sürdürülebilir.
+    Parçayı başka bir iş sahiplendiyse hiçbir şey yapılmaz; ertelenen iş
+    'claim' ile kendi sahipliğini devralır.
+    """
+    with app.app_context():
+        claim = claim or uuid.uuid4().hex
+        if not _claim(RescoreChunk, chunk_id, claim, 'pending'):
+            app.logger.info("Yeniden puanlama parçası %s başka bir işte sürüyor (veya bitti), atlandı.", chunk_id)
+            return
+        run = db.session.get(RescoreRun, run_id)
+        chunk = db.session.get(RescoreChunk, chunk_id)
+        if run is None or chunk is None:
+            return
+        gold_by_case = {int(case_id): content for case_id, content in (run.gold_snapshot or {}).items()}
+        group_size = app.config['WORKER_CONCURRENCY']
+
+        try:
+            while True:
+                rows = db.session.execute(
+                    select(*_ANSWER_COLUMNS)
+                    .join(User, User.id == UserResponse.user_id)
+                    .where(UserResponse.id > chunk.cursor_id, UserResponse.id <= chunk.last_id, _response_filter(run))
+                    .order_by(UserResponse.id)
+                    .limit(group_size)
+                ).all()
+                if not rows:
+                    break
+                futures = [response_executor.submit(_score_row, row, gold_by_case.get(row.case_id)) for row in rows]
+                updates = [future.result() for future in futures]
+                archive = [ScoringRun.values_for(values['id'], values.pop('llm_raw'))
+                           for values in updates if 'llm_raw' in values]
+
+                db.session.execute(update(UserResponse), updates)
+                if archive:
+                    db.session.execute(insert(ScoringRun), archive)
+                deltas = new_deltas()
+                for row, values in zip(rows, updates):
+                    if 'final_score' not in values:
+                        continue  # altın standart yok, skorlar değişmedi
+                    old_scores = {column: getattr(row, column) for column in SCORE_METRICS} if row.was_scored else None
+                    add_response_delta(deltas, row.case_id, row.profession, row.experience,
+                                       old_scores, values, row.duration_seconds)
+                apply_deltas(db.session, deltas)
+                if not _renew(RescoreChunk, chunk_id, claim):
+                    db.session.rollback()
+                    app.logger.warning("Yeniden puanlama parçası %s başka bir işe geçti, grup yazılmadı.", chunk_id)
+                    return
+                chunk.cursor_id = rows[-1].id
+                run.scored = RescoreRun.scored + len(rows)
+                db.session.commit()
+
+            if not _renew(RescoreChunk, chunk_id, claim):
+                db.session.rollback()
+                return
+            chunk.status = 'done'
+            db.session.commit()
+        except JudgeUnavailable as e:
+            db.session.rollback()
+            queue = get_queue(lane)
+            if queue is None or inline or deferrals >= app.config['JUDGE_MAX_DEFERRALS']:
+                app.logger.error("Yeniden puanlama parçası %s durdu, devam için resume kullanın: %s", chunk_id, e)
+                return
+            delay = datetime.timedelta(seconds=max(1.0, e.retry_after))
+            # Sahiplik ertelenen işte kalır: gecikme süresince parça takılmış sayılmaz
+            if _renew(RescoreChunk, chunk_id, claim, claimed_at=_now() + delay):
+                db.session.commit()
+            queue.enqueue_in(delay, rescore_chunk, run_id, chunk_id, deferrals=deferrals + 1, lane=lane,
+                             claim=claim, job_timeout=RESCORE_JOB_TIMEOUT)
+            app.logger.warning("Hakem LLM'e ulaşılamadı, yeniden puanlama parçası %s ertelendi: %s", chunk_id, e)
+            return
+        except ReplayMiss as e:
+            db.session.rollback()
+            app.logger.error("Yeniden puanlama parçası %s durdu, skor yazılmadı: %s", chunk_id, e)
+            raise
+
+        _finish_run_if_complete(run_id)
+
+
+def _finish_run_if_complete(run_id):
+    """Planlaması bitmiş ve bekleyen parçası kalmamış çalıştırmayı tamamlandı olarak işaretler."""
+    run = db.session.get(RescoreRun, run_id)
+    if run is None or run.status != 'running':
+        return
+    pending = db.session.scalar(
+        select(func.count(RescoreChunk.id)).where(RescoreChunk.run_id == run_id, RescoreChunk.status == 'pending')
+    )
+    if pending == 0:
+        run.status = 'done'
+        run.finished_at = datetime.datetime.now(datetime.timezone.utc)
+        db.session.commit()
+        app.logger.info("Yeniden puanlama tamamlandı: Run %s (%s yanıt)", run_id, run.scored)
+
+
+def _dispatch(job, *args, inline=False, lane='rescore'):
+    """İşi şeridin kuyruğuna ekler; inline istenirse aynı süreçte çalıştırır."""
+    if inline:
+        job(*args, inline=True)
+        return
+    _require_queue(inline, lane)
+    get_queue(lane).enqueue(job, *args, lane=lane, job_timeout=RESCORE_JOB_TIMEOUT)
+
+
+def rescore_progress(run):
+    """Çalıştırmanın ilerleme özetini döndürür."""
+    done_chunks = sum(1 for chunk in run.chunks if chunk.status == 'done')
+    return {
+        'id': run.id,
+        'status': run.status,
+        'judge_version': run.judge_version,
+        'scored': run.scored,
+        'total': run.total,
+        'percent': round(100.0 * run.scored / run.total, 1) if run.total else 100.0,
+        'chunks_done': done_chunks,
+        'chunks_total': len(run.chunks),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="UserResponse kayıtlarını toplu olarak yeniden puanlar.")
+    parser.add_argument('--case-id', type=int, action='append', dest='case_ids', help="Yalnızca bu vaka(lar)")
+    parser.add_argument('--chunk-size', type=int, default=100)
+    parser.add_argument('--resume', type=int, metavar='RUN_ID', help="Yarım kalmış çalıştırmayı sürdür")
+    parser.add_argument('--status', type=int, metavar='RUN_ID', help="Çalıştırmanın ilerlemesini göster")
+    parser.add_argument('--lane', choices=('rescore', 'backfill'), default='backfill',
+                        help="İşlerin ekleneceği puanlama şeridi (varsayılan: backfill)")
+    parser.add_argument('--inline', action='store_true', help="Kuyruk yerine bu süreçte çalıştır")
+    args = parser.parse_args()
+
+    with app.app_context():
+        try:
+            if args.status:
+                run = db.session.get(RescoreRun, args.status)
+            elif args.resume:
+                run = resume_rescore(args.resume, inline=args.inline, lane=args.lane)
+            else:
+                run = start_rescore(args.case_ids, args.chunk_size, inline=args.inline, lane=args.lane)
+        except RescoreQueueUnavailable as e:
+            raise SystemExit(str(e))
+        if run is None:
+            print("Çalıştırma bulunamadı.")
+        else:
+            db.session.refresh(run)
+            print(rescore_progress(run))
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""
+Hakem ham yanıtları için sıkıştırılmış puanlama arşivi.
+
+Her puanlama (ilk puanlama ve her yeniden puanlama), hakemin ham yanıtlarını ve
+karar kaynaklarını içeren yükü (payload) 'scoring_run' tablosuna yeni bir satır
+olarak ekler; satırlar hiç güncellenmez (yalnızca ekleme). user_response
+satırında yalnızca güncel skorlar, kısa gerekçeler ve son puanlamanın hakem
+sürümü (judge_version) tutulur. Böylece sonuç, yanıt listesi ve dışa aktarım
+sorguları ham yükleri okumaz; puanlama geçmişi ise kaybolmaz.
+
+Yük JSON olarak kodlanıp sıkıştırılır. 'zstandard' paketi kuruluysa zstd,
+değilse standart kütüphanedeki zlib kullanılır; kullanılan kodek satırda
+saklanır, böylece iki kodekle yazılmış satırlar bir arada okunabilir.
+"""
+
+import json
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # zlib'e düşülür
+    zstandard = None
+
+ZSTD_LEVEL = 9
+ZLIB_LEVEL = 6
+
+
+def default_codec():
+    return 'zstd' if zstandard is not None else 'zlib'
+
+
+def encode_payload(payload, codec=None):
+    """Yükü JSON olarak kodlayıp sıkıştırır; (kodek, bayt dizisi) döndürür."""
+    codec = codec or default_codec()
+    data = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    if codec == 'zstd':
+        return codec, zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    if codec == 'zlib':
+        return codec, zlib.compress(data, ZLIB_LEVEL)
+    raise ValueError(f"Bilinmeyen arşiv kodeği: {codec}")
+
+
+def decode_payload(codec, data):
+    """encode_payload ile sıkıştırılmış yükü çözer."""
+    if codec == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("zstd ile sıkıştırılmış puanlama kaydı için 'zstandard' paketi gerekir.")
+        data = zstandard.ZstdDecompressor().decompress(data)
+    elif codec == 'zlib':
+        data = zlib.decompress(data)
+    else:
+        raise ValueError(f"Bilinmeyen arşiv kodeği: {codec}")
+    return json.loads(data.decode('utf-8'))
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+Puanlama işleri için öncelik şeritleri (RQ kuyrukları) ve bekleyen iş tekilleştirme.
+
+Puanlama işleri üç şeride ayrılır:
+
+- interactive: yeni gönderilen yanıtlar; kullanıcı sonuç sayfasında bekliyor.
+- rescore:     yöneticinin başlattığı toplu yeniden puanlamalar (bkz. rescore.py).
+- backfill:    acelesi olmayan geriye dönük işler (ör. CLI'dan başlatılan
+               yeniden puanlamalar).
+
+Worker'lar (bkz. worker.py) her işten sonra kuyruk sırasını şerit ağırlıklarına
+göre rastgele yeniden dizer: dolu kuyruklar arasından ağırlığı yüksek olanın
+önce seçilme olasılığı daha yüksektir, ancak düşük öncelikli şeritler de hiç
+beklemeden aç kalmaz (ağırlıklı adillik).
+
+Bir kullanıcının aynı vaka için art arda gönderdiği yanıtlar tek bir bekleyen
+işte toplanır (PendingScoring): kuyrukta o kullanıcı/vaka için bekleyen bir iş
+varsa yeni iş eklenmez, bekleyen iş yeni yanıtı da puanlar.
+"""
+
+import random
+
+from redis.exceptions import RedisError
+
+LANES = ('interactive', 'rescore', 'backfill')
+LANE_QUEUES = {lane: f"scoring-{lane}" for lane in LANES}
+DEFAULT_LANE_WEIGHTS = {'interactive': 6, 'rescore': 3, 'backfill': 1}
+
+# Şeritlerden önce kullanılan tek kuyruk; dağıtımdan önce eklenmiş işlerin
+# boşaltılması için worker'lar bu kuyruğu da dinler.
+LEGACY_QUEUE = 'default'
+
+
+def parse_lane_weights(value):
+    """'interactive=6,rescore=3,backfill=1' biçimindeki ayarı sözlüğe çevirir."""
+    weights = dict(DEFAULT_LANE_WEIGHTS)
+    for part in (value or '').split(','):
+        if not part.strip():
+            continue
+        lane, _, weight = part.partition('=')
+        lane = lane.strip()
+        if lane not in LANE_QUEUES:
+            raise ValueError(f"Bilinmeyen puanlama şeridi: {lane} (seçenekler: {', '.join(LANES)})")
+        weights[lane] = max(0.001, float(weight))
+    return weights
+
+
+def queue_weights(lane_weights):
+    """Kuyruk adı -> ağırlık (eski 'default' kuyruğu en düşük ağırlıkla)."""
+    weights = {LANE_QUEUES[lane]: weight for lane, weight in lane_weights.items()}
+    weights[LEGACY_QUEUE] = min(weights.values())
+    return weights
+
+
+def weighted_order(items, weights, rng=random):
+    """
+    Öğeleri ağırlıklı rastgele sırayla döndürür (Efraimidis-Spirakis): bir öğenin
+    başa gelme olasılığı, ağırlığının toplam ağırlığa oranıdır.
+    """
+    return sorted(items, key=lambda item: rng.random() ** (1.0 / weights.get(item, 1.0)), reverse=True)
+
+
+class PendingScoring:
+    """
+    Kullanıcı/vaka başına bekleyen puanlama işlerini tekilleştirir.
+
+    add() yanıtı kullanıcı/vaka kümesine ekler ve yalnızca o çift için bekleyen
+    bir iş yoksa True döndürür (çağıran işi kuyruğa ekler). İş başladığında
+    take() kümeyi ve işaretçiyi tek bir işlemde boşaltır; bu andan sonra gelen
+    yanıtlar için yeni bir iş eklenir. İşaretçinin süresi, kaybolan bir iş
+    nedeniyle yeni işlerin sonsuza kadar engellenmemesi içindir; kümede kalan
+    yanıtlar bir sonraki işte puanlanır. İşin puanlayamadığı yanıtlar restore()
+    ile kümeye geri eklenir; bir sonraki iş veya giden kutusu süpürücüsü
+    (bkz. outbox.py) onları yeniden kuyruğa alır.
+    """
+
+    MARKER_TTL = 3600
+    SET_TTL = 24 * 3600
+
+    def __init__(self, redis_conn):
+        self.redis = redis_conn
+
+    def _keys(self, user_id, case_id):
+        base = f"scoring:pending:{user_id}:{case_id}"
+        return f"{base}:responses", f"{base}:job"
+
+    def add(self, user_id, case_id, response_id):
+        return bool(self.add_many([(user_id, case_id, response_id)]))
+
+    def add_many(self, items):
+        """
+        add() işleminin toplu hali: (user_id, case_id, response_id) listesini tek
+        bir pipeline ile ekler ve yeni bir iş gerektiren (user_id, case_id)
+        çiftlerini (ilk görülme sırasıyla) döndürür.
+        """
+        pipe = self.redis.pipeline()
+        for user_id, case_id, response_id in items:
+            responses_key, marker_key = self._keys(user_id, case_id)
+            pipe.sadd(responses_key, response_id)
+            pipe.expire(responses_key, self.SET_TTL)
+            pipe.set(marker_key, 1, nx=True, ex=self.MARKER_TTL)
+        results = pipe.execute()
+        new_pairs = {}
+        for (user_id, case_id, _), marker_set in zip(items, results[2::3]):
+            if marker_set:
+                new_pairs[(user_id, case_id)] = True
+        return list(new_pairs)
+
+    def release(self, user_id, case_id):
+        """İş kuyruğa eklenemediğinde işaretçiyi kaldırır."""
+        try:
+            self.redis.delete(self._keys(user_id, case_id)[1])
+        except RedisError as e:
+            print(f"UYARI: Bekleyen puanlama işaretçisi silinemedi (User {user_id}, Case {case_id}): {e}")
+
+    def restore(self, user_id, case_id, response_ids):
+        """take() ile alınıp puanlanamayan yanıtları kümeye geri ekler (işaretçi kurulmaz)."""
+        responses_key = self._keys(user_id, case_id)[0]
+        try:
+            pipe = self.redis.pipeline()
+            pipe.sadd(responses_key, *response_ids)
+            pipe.expire(responses_key, self.SET_TTL)
+            pipe.execute()
+        except RedisError as e:
+            print(f"UYARI: Puanlanamayan yanıtlar kümeye geri eklenemedi (User {user_id}, Case {case_id}): {e}")
+
+    def take(self, user_id, case_id):
+        """Bekleyen yanıt id'lerini (artan sırada) alır ve kümeyi boşaltır."""
+        responses_key, marker_key = self._keys(user_id, case_id)
+        pipe = self.redis.pipeline()
+        pipe.delete(marker_key)
+        pipe.smembers(responses_key)
+        pipe.delete(responses_key)
+        members = pipe.execute()[1]
+        return sorted(int(member) for member in members)
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+Eşzamanlı, aynı hakem isteklerinin birleştirilmesi (single-flight).
+
+Aynı vakayı aynı anda yanıtlayan bir grup katılımcı, birebir aynı hakem
+istemlerinin farklı worker'larda aynı anda gönderilmesine yol açabilir. Karar
+önbelleği (verdict_cache.py) yalnızca ilk istek TAMAMLANDIKTAN sonra işe yarar;
+bu modül ise uçuştaki istekleri birleştirir:
+
+- Süreç içinde: aynı parmak izine sahip çağrılardan ilki hakeme gider, diğer
+  iş parçacıkları onun sonucunu (veya hatasını) bekler.
+- Süreçler arasında (Redis): ilk worker parmak izi üzerinde kısa ömürlü bir
+  kilit (SET NX PX) alır ve sonucu kısa bir süre saklar; kilidi alamayanlar
+  sonucu bekler. Lider hata alırsa kilit bırakılır ve bekleyenlerden biri
+  liderliği devralır. Bekleme süresi aşılırsa çağrı doğrudan yapılır.
+
+Birleştirilen değer hakemin ham yanıt metnidir; böylece bekleyenler aynı
+metni aynı şekilde ayrıştırır.
+"""
+
+import hashlib
+import threading
+import time
+import uuid
+
+from redis.exceptions import RedisError
+
+from metrics import JUDGE_COALESCED
+
+# Kilidi yalnızca sahibi (aynı token) silebilir
+_RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def request_fingerprint(*parts):
+    """İstemin ve hakem sürümünün parmak izi (SHA-256)."""
+    return hashlib.sha256('\x1f'.join(parts).encode('utf-8')).hexdigest()
+
+
+class _InFlight:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Aynı anahtarlı çağrıları süreç içinde ve (Redis varsa) süreçler arasında birleştirir."""
+
+    def __init__(self, redis_conn, lock_ttl=30, result_ttl=30, poll_interval=0.1, enabled=True):
+        self.redis = redis_conn
+        self.lock_ttl = lock_ttl
+        self.result_ttl = result_ttl
+        self.poll_interval = poll_interval
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def call(self, key, func):
+        """func() sonucunu (metin) döndürür; aynı anahtarla uçuşta bir çağrı varsa onu bekler."""
+        if not self.enabled:
+            return func()
+        with self._lock:
+            in_flight = self._calls.get(key)
+            leader = in_flight is None
+            if leader:
+                in_flight = self._calls[key] = _InFlight()
+
+        if not leader:
+            JUDGE_COALESCED.labels('local').inc()
+            in_flight.event.wait()
+            if in_flight.error is not None:
+                raise in_flight.error
+            return in_flight.result
+
+        try:
+            in_flight.result = self._call_shared(key, func)
+            return in_flight.result
+        except Exception as e:
+            in_flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            in_flight.event.set()
+
+    def _call_shared(self, key, func):
+        if self.redis is None:
+            return func()
+        lock_key = f"single_flight:{key}:lock"
+        result_key = f"single_flight:{key}:result"
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + self.lock_ttl
+        while True:
+            try:
+                cached = self.redis.get(result_key)
+                if cached is not None:
+                    JUDGE_COALESCED.labels('redis').inc()
+                    return cached.decode('utf-8')
+                acquired = self.redis.set(lock_key, token, nx=True, px=int(self.lock_ttl * 1000))
+            except RedisError as e:
+                print(f"UYARI: Single-flight kilidine ulaşılamadı, istek doğrudan gönderiliyor: {e}")
+                return func()
+
+            if acquired:
+                try:
+                    result = func()
+                    try:
+                        self.redis.set(result_key, result, ex=self.result_ttl)
+                    except RedisError:
+                        pass
+                    return result
+                finally:
+                    try:
+                        self.redis.eval(_RELEASE_SCRIPT, 1, lock_key, token)
+                    except RedisError:
+                        pass
+
+            if time.monotonic() >= deadline:
+                # Lider çok uzun sürdü: beklemeyi bırakıp çağrıyı kendimiz yaparız
+                return func()
+            time.sleep(self.poll_interval)
@@ -1,23 +1,164 @@
-import os
-import json
-from redis import Redis
-from rq import Queue
-from app import app, db, get_semantic_score, UserResponse, ReferenceAnswer
-
-# app.py'de tanımlanan Redis bağlantısını ve kuyruğu al
-# Bu, worker'ın da aynı bağlantı ayarlarını kullanmasını sağlar.
-redis_url = os.getenv('REDIS_URL')
-if not redis_url:
-    print("HATA: tasks.py REDIS_URL bulamadı. Worker çalışmayacak.")
-    conn = None
-else:
-    conn = Redis.from_url(redis_url)
-
-def score_and_store_response(response_id):
+import random
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+from rq import Queue, get_current_job
+from sqlalchemy import select
+from app import (app, db, conn, get_semantic_score, get_batched_scores, SCORING_CATEGORIES, JUDGE_VERSION,
+                 case_cache, score_events, pending_scoring, ScoringRun, UserResponse)
+from judge_backends import ReplayMiss
+from rate_limiter import JudgeUnavailable
+from live_scores import score_event
+from metrics import PRESCORER_DECISIONS, record_scoring_job
+from prescorer import gold_variants, prescore
+from aggregates import SCORE_METRICS, record_response_scores
+
+# Kategori anahtarı -> UserResponse skor sütunu
+SCORE_FIELDS = {
+    'diagnosis': 'diagnosis_score',
+    'tests': 'investigation_score',
+    'treatment': 'treatment_score',
+    'dosage': 'dosage_score',
+}
+
+# Koşullu kategoriler: yalnızca bağlı oldukları kategori eşiği geçerse puanlanır.
+GATE_THRESHOLD = 70
+GATED_CATEGORIES = {
+    'tests': ('diagnosis', "Tanı yetersiz/hatalı olduğu için tetkik puanlanmadı."),
+    'dosage': ('treatment', "İlaç seçimi yetersiz/hatalı olduğu için dozaj puanlanmadı."),
+}
+
+def build_user_answers(ur):
+    """UserResponse'tan her kategori için hakeme gönderilecek yanıt metnini üretir."""
+    return {
+        'diagnosis': ur.user_diagnosis,
+        'tests': ur.user_tests,
+        'treatment': f"İlaç Grubu: {ur.user_drug_class}, Etken Madde: {ur.user_active_ingredient}",
+        'dosage': ur.user_dosage_notes,
+    }
+
+# Hakem çağrıları için süreç genelinde paylaşılan iş parçacığı havuzu.
+# Havuz boyutu, bu süreçte aynı anda uçuşta olabilecek hakem isteği sayısını sınırlar.
+judge_executor = ThreadPoolExecutor(max_workers=app.config['JUDGE_MAX_IN_FLIGHT'], thread_name_prefix='judge')
+
+def _in_app_context(func, *args):
+    """Havuz iş parçacığında (önbellek DB erişimi için) uygulama bağlamı içinde çalıştırır."""
+    with app.app_context():
+        return func(*args)
+
+def _judge_concurrently(keys, answers, gold_content):
+    """Verilen kategorileri havuz üzerinden paralel olarak puanlar."""
+    futures = {}
+    for key in keys:
+        label, gold_key = SCORING_CATEGORIES[key]
+        futures[key] = judge_executor.submit(
+            _in_app_context, get_semantic_score, answers[key], gold_content.get(gold_key, ''), label
+        )
+    return {key: future.result() for key, future in futures.items()}
+
+def score_categories_individually(answers, gold_content, known=None):
+    """
+    Kategorileri kategori başına bir hakem çağrısıyla puanlar. Bağımsız çağrılar
+    paralel yürütülür: önce tanı ve tedavi, ardından koşulu sağlanan tetkik/dozaj.
+    Koşulu sağlanmayan ve 'known' ile zaten puanlanmış kategoriler için hakem çağrısı yapılmaz.
+    """
+    results = dict(known or {})
+    independent = [key for key in SCORING_CATEGORIES if key not in GATED_CATEGORIES and key not in results]
+    results.update(_judge_concurrently(independent, answers, gold_content))
+    follow_ups = [key for key, (parent, _) in GATED_CATEGORIES.items()
+                  if key not in results and results[parent][0] >= GATE_THRESHOLD]
+    results.update(_judge_concurrently(follow_ups, answers, gold_content))
+    return results
+
+def apply_gating(results):
+    """
+    Koşullu puanlama kurallarını uygular: tetkik yalnızca tanı >= 70 ise,
+    dozaj yalnızca tedavi >= 70 ise puanlanır; aksi halde skor 0 olur.
+    """
+    gated = {}
+    for key in SCORING_CATEGORIES:
+        gate = GATED_CATEGORIES.get(key)
+        if gate and results[gate[0]][0] < GATE_THRESHOLD:
+            gated[key] = (0, {"reason": gate[1], "raw": None, "source": "gate"})
+        else:
+            gated[key] = results[key]
+    return gated
+
+def prescore_answers(answers, gold_content):
+    """
+    Ön puanlayıcının (bkz. prescorer.py) emin olduğu kategorileri
+    {kategori: (score, details)} olarak döndürür; diğerleri hakeme gider.
+    """
+    if not app.config.get('PRESCORER_ENABLED'):
+        return {}
+    decided = {}
+    for key, (label, gold_key) in SCORING_CATEGORIES.items():
+        verdict = prescore(answers.get(key), gold_variants(gold_content, gold_key), gold_key)
+        PRESCORER_DECISIONS.labels(label, 'decided' if verdict else 'escalated').inc()
+        if verdict is not None:
+            decided[key] = verdict
+    return decided
+
+def score_answers(answers, gold_content, response_id=None):
+    """
+    Yanıt metinlerini altın standarda göre puanlar ve UserResponse'a yazılacak
+    sütun değerlerini (dört kategori skoru, final skor, gerekçeler, hakem sürümü)
+    döndürür. 'llm_raw' anahtarı bir sütun değildir: hakemin ham yanıtlarıdır ve
+    puanlama arşivine (ScoringRun, bkz. scoring_archive.py) yazılır.
+    Veritabanına dokunmaz; tekli ve toplu (yeniden) puanlama ortak kullanır.
+    Önce ön puanlayıcı çalışır; yalnızca kalan kategoriler hakeme gönderilir.
+    Her kategorinin karar kaynağı (prescorer / judge / gate) arşiv kaydında 'decision_source' altına yazılır.
+    Hakem geçici olarak ulaşılamazsa JudgeUnavailable fırlatılır.
+    """
+    prescored = prescore_answers(answers, gold_content)
+    results = None
+    if len(prescored) == len(SCORING_CATEGORIES):
+        results = prescored
+    elif app.config.get('JUDGE_BATCH_SCORING'):
+        results, batch_raw = judge_executor.submit(
+            _in_app_context, get_batched_scores, answers, gold_content, prescored
+        ).result()
+        if results is None:
+            app.logger.warning("Toplu puanlama başarısız, kategori bazlı puanlamaya geçiliyor (Response ID %s): %s",
+                               response_id, batch_raw)
+    if results is None:
+        results = score_categories_individually(answers, gold_content, prescored)
+
+    values = {}
+    reasons = {}
+    llm_raw = {'judge_version': JUDGE_VERSION, 'decision_source': {}}
+    for key, (score, raw) in apply_gating(results).items():
+        values[SCORE_FIELDS[key]] = float(score)
+        reasons[key] = raw.get('reason')
+        llm_raw[key] = raw.get('raw')
+        llm_raw['decision_source'][key] = raw.get('source', 'judge')
+
+    scores = [values[column] for column in SCORE_FIELDS.values()]
+    values['final_score'] = round(sum(scores) / max(1, len(scores)), 2)
+    values['score_reasons'] = reasons
+    values['judge_version'] = JUDGE_VERSION
+    values['llm_raw'] = llm_raw
+    return values
+
+def defer_scoring(response_id, deferrals, retry_after):
+    """
+    Hakem LLM'e ulaşılamadığında puanlama işini, geldiği kuyruğa gecikmeli
+    olarak yeniden ekler (RQ zamanlayıcısı gerekir, bkz. worker.py).
+    Gecikme süresine, işlerin aynı anda geri dönmemesi için rastgele pay eklenir.
+    """
+    job = get_current_job()
+    queue = Queue(job.origin if job else 'default', connection=conn)
+    delay = max(1.0, retry_after) * random.uniform(1.0, 1.5)
+    queue.enqueue_in(datetime.timedelta(seconds=delay), score_and_store_response, response_id, deferrals=deferrals + 1)
+    return delay
+
+def score_and_store_response(response_id, deferrals=0):
     """
     Bir kullanıcı yanıtını (UserResponse) Gemini API kullanarak puanlar
     ve sonuçları veritabanına kaydeder. Bu fonksiyon RQ worker'ı
     tarafından asenkron olarak çalıştırılır.
+    Hakem geçici olarak ulaşılamazsa skor yazılmaz, iş ertelenir. Replay
+    arka ucunda saklanmış karar yoksa (ReplayMiss) skor yazılmaz, iş başarısız sayılır.
+    Sonucu ('scored', 'deferred', 'error', 'failed'; yanıt yoksa None) döndürür.
     """
     with app.app_context():
         try:
@@ -27,68 +168,92 @@ def score_and_store_response(response_id):
                 app.logger.warning("UserResponse bulunamadı: %s", response_id)
                 return
 
-            # Altın standart yanıtı 'ReferenceAnswer' tablosundan al
-            gold = ReferenceAnswer.query.filter_by(case_id=ur.case_id, source='gold').first()
-            if not gold:
+            # Altın standart yanıtı vaka önbelleğinden al ('ReferenceAnswer' tablosu)
+            gold_content = case_cache.get_reference(ur.case_id, 'gold')
+            if gold_content is None:
                 app.logger.error("Altın Standart yanıt bulunamadı (Case ID: %s)", ur.case_id)
                 ur.score_reasons = {"error": "Altın Standart yanıt bulunamadı."}
                 db.session.commit()
-                return
+                score_events.publish(response_id, score_event(ur, 'error'))
+                record_scoring_job(get_current_job(), None, 'error')
+                return 'error'
             
-            gold_content = gold.content # Bu zaten bir JSON (dict) olmalı
-            
-            reasons = {}
-            llm_raw = {}
-
-            # 2. Puanlama Aşamaları
-            
-            # Tanı
-            diag_score, diag_raw = get_semantic_score(ur.user_diagnosis, gold_content.get('tanı', ''), 'Tanı')
-            ur.diagnosis_score = float(diag_score)
-            reasons['diagnosis'] = diag_raw.get('reason')
-            llm_raw['diagnosis'] = diag_raw.get('raw')
-
-            # Tetkik (Tanı skoruna koşullu)
-            if diag_score >= 70:
-                tests_score, tests_raw = get_semantic_score(ur.user_tests, gold_content.get('tetkik', ''), 'Tetkik')
-                ur.investigation_score = float(tests_score)
-                reasons['tests'] = tests_raw.get('reason')
-                llm_raw['tests'] = tests_raw.get('raw')
-            else:
-                ur.investigation_score = 0.0
-                reasons['tests'] = "Tanı yetersiz/hatalı olduğu için tetkik puanlanmadı."
-                llm_raw['tests'] = None
-
-            # Tedavi (İlaç seçimi)
-            treat_text = f"İlaç Grubu: {ur.user_drug_class}, Etken Madde: {ur.user_active_ingredient}"
-            treat_score, treat_raw = get_semantic_score(treat_text, gold_content.get('tedavi_plani', ''), 'Tedavi Planı')
-            ur.treatment_score = float(treat_score)
-            reasons['treatment'] = treat_raw.get('reason')
-            llm_raw['treatment'] = treat_raw.get('raw')
-
-            # Dozaj (Tedavi skoruna koşullu)
-            if treat_score >= 70:
-                dosage_score, dosage_raw = get_semantic_score(ur.user_dosage_notes, gold_content.get('dozaj', ''), 'Dozaj')
-                ur.dosage_score = float(dosage_score)
-                reasons['dosage'] = dosage_raw.get('reason')
-                llm_raw['dosage'] = dosage_raw.get('raw')
-            else:
-                ur.dosage_score = 0.0
-                reasons['dosage'] = "İlaç seçimi yetersiz/hatalı olduğu için dozaj puanlanmadı."
-                llm_raw['dosage'] = None
+            # Yanıt daha önce puanlandıysa eski skorları özetlerden çıkarılacak
+            previous_scores = None
+            if ur.judge_version is not None:
+                previous_scores = {column: getattr(ur, column) for column in SCORE_METRICS}
 
-            # 3. Final Skoru Hesapla ve Kaydet
-            scores = [s for s in [ur.diagnosis_score, ur.investigation_score, ur.treatment_score, ur.dosage_score] if s is not None]
-            ur.final_score = round(sum(scores) / max(1, len(scores)), 2)
+            # 2. Puanlama Aşamaları ve 3. Final Skoru
+            values = score_answers(build_user_answers(ur), gold_content, response_id)
+            db.session.add(ScoringRun(**ScoringRun.values_for(ur.id, values.pop('llm_raw'))))
+            for column, value in values.items():
+                setattr(ur, column, value)
             
-            ur.score_reasons = reasons
-            ur.llm_raw = llm_raw
+            # 4. Skor özetlerini aynı işlem içinde güncelle
+            record_response_scores(db.session, ur, previous_scores)
             
             db.session.add(ur)
             db.session.commit()
             
+            # 5. Sonuç sayfasını bekleyen kullanıcıya skorları canlı ilet
+            score_events.publish(response_id, score_event(ur))
+            
+            record_scoring_job(get_current_job(), ur.created_at, 'scored')
             app.logger.info("Puanlama tamamlandı: Response ID %s", response_id)
+            return 'scored'
+
+        except JudgeUnavailable as e:
+            db.session.rollback()
+            if conn is not None and deferrals < app.config['JUDGE_MAX_DEFERRALS']:
+                delay = defer_scoring(response_id, deferrals, e.retry_after)
+                app.logger.warning("Hakem LLM'e ulaşılamadı (%s), Response ID %s puanlaması %.0f sn ertelendi.",
+                                   e, response_id, delay)
+                score_events.publish(response_id, {'status': 'deferred', 'response_id': response_id,
+                                                   'retry_after': round(delay)})
+                record_scoring_job(get_current_job(), None, 'deferred')
+                return 'deferred'
+            else:
+                app.logger.error("Hakem LLM'e ulaşılamadı, Response ID %s puanlanamadı: %s", response_id, e)
+                ur = db.session.get(UserResponse, response_id)
+                ur.score_reasons = {"error": f"Hakem LLM'e ulaşılamadı: {e}"}
+                db.session.commit()
+                score_events.publish(response_id, score_event(ur, 'error'))
+                record_scoring_job(get_current_job(), None, 'error')
+                return 'error'
+
+        except ReplayMiss as e:
+            db.session.rollback()
+            app.logger.error("Response ID %s puanlanamadı, skor yazılmadı: %s", response_id, e)
+            record_scoring_job(get_current_job(), None, 'failed')
+            return 'failed'
 
         except Exception as e:
             app.logger.exception("score_and_store_response hatası")
             db.session.rollback()
+            record_scoring_job(get_current_job(), None, 'failed')
+            return 'failed'
+
+def score_pending_responses(user_id, case_id):
+    """
+    Bir kullanıcının bir vaka için bekleyen (henüz puanlanmamış) yanıtlarını
+    puanlar. Art arda gönderilen yanıtlar tek bir işte toplanır (bkz.
+    scoring_queues.PendingScoring); bu arada başka bir yolla puanlanmış
+    yanıtlar atlanır. Puanlaması başarısız olan veya iş yarıda kesildiği için
+    (zaman aşımı, kapanış) hiç puanlanmayan yanıtlar kümeye geri eklenir.
+    """
+    response_ids = pending_scoring.take(user_id, case_id)
+    remaining = set(response_ids)
+    try:
+        with app.app_context():
+            scored = set(db.session.scalars(
+                select(UserResponse.id).where(UserResponse.id.in_(response_ids), UserResponse.judge_version.isnot(None))
+            )) if response_ids else set()
+        for response_id in response_ids:
+            if response_id in scored:
+                app.logger.info("Response ID %s zaten puanlanmış, atlandı.", response_id)
+            elif score_and_store_response(response_id) == 'failed':
+                continue
+            remaining.discard(response_id)
+    finally:
+        if remaining:
+            pending_scoring.restore(user_id, case_id, sorted(remaining))
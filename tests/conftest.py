@@ -0,0 +1,13 @@
+# -*- coding: utf-8 -*-
+"""
+Testler, 'app' içe aktarılmadan önce geçici bir SQLite veritabanına ve yerel
+hakem arka ucuna yönlendirilir (app.py yapılandırmayı içe aktarımda okur).
+"""
+
+import os
+import tempfile
+
+_db_dir = tempfile.mkdtemp(prefix='llm_research_test_')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_db_dir, 'test.db')
+os.environ['JUDGE_BACKEND'] = 'fake'
+os.environ.pop('REDIS_URL', None)
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""Ön puanlayıcının (prescorer.py) yalnızca açık eşleşmelerde karar verdiğini doğrular."""
+
+import json
+
+import pytest
+
+from prescorer import prescore
+
+
+def _score(user_answer, gold, gold_key='tanı'):
+    verdict = prescore(user_answer, [gold], gold_key)
+    return None if verdict is None else verdict[0]
+
+
+@pytest.mark.parametrize('user_answer, gold, gold_key', [
+    # Sayılar farklı: n-gram veya kelime eşleşmesiyle 100 verilmemeli
+    ("Amoksisilin 40 mg/kg/gün, 2 dozda", "Amoksisilin 80-90 mg/kg/gün, 2 dozda", 'tedavi_plani'),
+    ("Seftriakson 100 mg/kg/gün", "Seftriakson 50 mg/kg/gün", 'tedavi_plani'),
+    # Dozaj alanında yalnızca birebir eşleşme kabul edilir
+    ("Amoksisilin 80-90 mg/kg/gün, 2 dozda", "Amoksisilin 80-90 mg/kg/gün 2 dozda verilir", 'dozaj'),
+    ("Yüksek doz amoksisilinn", "Yüksek doz Amoksisilin", 'dozaj'),
+    # -me/-ma olumsuzluğu (yanıtta veya altın standartta)
+    ("Ek tetkik gerekir", "Ek tetkik gerekmez", 'tetkik'),
+    ("Akciğer grafisi gerekmez", "Akciğer Grafisi", 'tetkik'),
+    ("Antibiyotik önerilmez", "Antibiyotik", 'tedavi_plani'),
+    ("Antibiyotik verilmemeli", "Antibiyotik", 'tedavi_plani'),
+    ("Akut otitis media değil", "Akut Otitis Media", 'tanı'),
+    # Tek ek kelime anlamı değiştiriyorsa
+    ("Akciğer grafisi gerekir", "Akciğer Grafisi", 'tetkik'),
+    ("Olası akut otitis media", "Akut Otitis Media", 'tanı'),
+    ("Kronik otitis media", "Otitis Media", 'tanı'),
+])
+def test_escalates_to_judge(user_answer, gold, gold_key):
+    assert _score(user_answer, gold, gold_key) is None
+
+
+@pytest.mark.parametrize('user_answer, gold, gold_key, rule', [
+    ("Akciger grafisi", "Akciğer Grafisi", 'tetkik', 'exact'),
+    ("AOM", "Akut Otitis Media", 'tanı', 'exact'),
+    ("Yüksek doz amoksisilin", "Yüksek doz Amoksisilin", 'dozaj', 'exact'),
+    ("Ek tetkik gerekmez.", "Ek tetkik gerekmez", 'tetkik', 'exact'),
+    ("Sol akut otitis media", "Akut Otitis Media", 'tanı', 'tokens'),
+    ("Akut otitis medya", "Akut Otitis Media", 'tanı', 'ngram'),
+])
+def test_prescores_clear_matches(user_answer, gold, gold_key, rule):
+    verdict = prescore(user_answer, [gold], gold_key)
+    assert verdict is not None
+    score, details = verdict
+    assert score == 100
+    assert json.loads(details['raw'])['rule'] == rule
+
+
+def test_empty_answer_scores_zero():
+    assert _score("  ", "Akut Otitis Media") == 0
+
+
+@pytest.mark.parametrize('gold, gold_key', [
+    ("Doz ayarlaması gerekmez", 'dozaj'),
+    ("Tedavi gerekmez", 'tedavi_plani'),
+    ("Ek tetkik gerekmez", 'tetkik'),
+])
+def test_empty_answer_escalates_when_gold_says_nothing_is_needed(gold, gold_key):
+    assert _score("", gold, gold_key) is None
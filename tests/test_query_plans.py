@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+"""Sık çalışan sorguların indeksle çalıştığını ve geçişlerin tekrar çalıştırılabildiğini doğrular."""
+
+import pytest
+
+from app import app, db
+from migrations import check_query_plans, hot_queries, run_migrations
+
+
+@pytest.fixture(scope='module')
+def migrated():
+    with app.app_context():
+        db.create_all()
+        first = run_migrations()
+        yield first
+        db.session.remove()
+
+
+def test_all_hot_queries_are_index_backed(migrated):
+    with app.app_context():
+        results = check_query_plans()
+    assert [name for name, _, _ in results] == [query.name for query in hot_queries()]
+    problems = {name: problems for name, _, problems in results if problems}
+    assert problems == {}
+
+
+def test_migrations_are_idempotent(migrated):
+    with app.app_context():
+        assert run_migrations() == []
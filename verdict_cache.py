@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+"""
+Hakem LLM kararları için içerik adresli önbellek.
+
+Aynı (normalize edilmiş kullanıcı yanıtı, altın standart yanıt, kategori,
+istem sürümü, model adı) beşlisi için hakem LLM'e tekrar istek gönderilmez.
+Kararlar önce Redis'te, Redis yoksa veya hata verirse veritabanındaki
+'judge_verdict' tablosunda aranır. İstem sürümü anahtarın bir parçası olduğu
+için sürüm artırıldığında eski kayıtlar hiçbir zaman eşleşmez; böylece farklı
+hakem sürümlerinin kararları araştırma verisinde karışmaz.
+"""
+
+import datetime
+import hashlib
+import json
+import random
+import time
+
+from redis.exceptions import RedisError
+from sqlalchemy import delete, select
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from metrics import JUDGE_CACHE
+
+
+def normalize_answer(text):
+    """
+    Yanıt metnini önbellek anahtarı için normalize eder: Türkçe'ye uygun küçük
+    harfe çevirir (I -> ı, İ -> i), baş/son boşlukları ve fazla boşlukları atar.
+    """
+    if text is None:
+        return ''
+    text = str(text).replace('I', 'ı').replace('İ', 'i').lower()
+    return ' '.join(text.split())
+
+
+def verdict_key(user_answer, gold_answer, category, prompt_version, model_name):
+    """Kararın içerik adresli anahtarını (SHA-256) üretir."""
+    payload = json.dumps(
+        [normalize_answer(user_answer), normalize_answer(gold_answer), category, prompt_version, model_name],
+        ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class VerdictCache:
+    """
+    Redis (birincil) ve veritabanı (ikincil) katmanlı hakem karar önbelleği.
+
+    - Redis'te her kayıt TTL ile saklanır; ayrıca son erişim zamanına göre
+      sıralı bir küme tutulur ve 'max_entries' aşıldığında en eski kayıtlar
+      silinir (LRU).
+    - Veritabanı katmanında süresi dolmuş kayıtlar okunmaz; tablo 'max_entries'
+      sınırını aştığında en uzun süredir kullanılmayan kayıtlar ve eski istem
+      sürümlerine ait kayıtlar ara ara temizlenir.
+    - İsabet/ıska sayaçları Redis'te (tüm süreçler için ortak) ve süreç içinde tutulur.
+    """
+
+    STATS_KEY = 'verdict_cache:stats'
+
+    def __init__(self, redis_conn, db, record_model, prompt_version, ttl_seconds=30 * 24 * 3600,
+                 max_entries=100000, enabled=True, prune_probability=0.01):
+        self.redis = redis_conn
+        self.db = db
+        self.record_model = record_model
+        self.prompt_version = prompt_version
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self.prune_probability = prune_probability
+        self.local_stats = {'hits': 0, 'misses': 0, 'redis_hits': 0, 'db_hits': 0, 'stores': 0}
+
+    # --- Anahtar yardımcıları ---
+
+    def _redis_key(self, key):
+        return f"verdict_cache:{self.prompt_version}:{key}"
+
+    def _lru_key(self):
+        return f"verdict_cache:{self.prompt_version}:lru"
+
+    def _count(self, field):
+        self.local_stats[field] += 1
+        if field in ('hits', 'misses'):
+            JUDGE_CACHE.labels(field).inc()
+        if self.redis is not None:
+            try:
+                self.redis.hincrby(self.STATS_KEY, field, 1)
+            except RedisError:
+                pass
+
+    # --- Genel arayüz ---
+
+    def get(self, user_answer, gold_answer, category, model_name, prompt_kind='single'):
+        """
+        Önbellekteki kararı döndürür: (score, {"reason": ..., "raw": ...}) veya None.
+        'prompt_kind' tekli ve toplu istemlerin kararlarını birbirinden ayırır.
+        """
+        if not self.enabled:
+            return None
+        key = verdict_key(user_answer, gold_answer, category, f"{self.prompt_version}/{prompt_kind}", model_name)
+
+        verdict = self._redis_get(key)
+        if verdict is not None:
+            self._count('hits')
+            self._count('redis_hits')
+            return verdict['score'], {"reason": verdict['reason'], "raw": verdict['raw'], "cached": True}
+
+        verdict = self._db_get(key)
+        if verdict is not None:
+            self._count('hits')
+            self._count('db_hits')
+            # Redis'i tekrar ısıt
+            self._redis_set(key, verdict)
+            return verdict['score'], {"reason": verdict['reason'], "raw": verdict['raw'], "cached": True}
+
+        self._count('misses')
+        return None
+
+    def set(self, user_answer, gold_answer, category, model_name, score, details, prompt_kind='single'):
+        """Başarılı bir hakem kararını her iki katmana yazar. Hata sonuçları önbelleğe ALINMAMALIDIR."""
+        if not self.enabled:
+            return
+        key = verdict_key(user_answer, gold_answer, category, f"{self.prompt_version}/{prompt_kind}", model_name)
+        verdict = {"score": score, "reason": details.get('reason'), "raw": details.get('raw')}
+        self._redis_set(key, verdict)
+        self._db_set(key, category, model_name, verdict)
+        self._count('stores')
+
+    def stats(self):
+        """Ortak (Redis) sayaçları, yoksa süreç içi sayaçları döndürür."""
+        if self.redis is not None:
+            try:
+                shared = self.redis.hgetall(self.STATS_KEY)
+                if shared:
+                    return {k.decode(): int(v) for k, v in shared.items()}
+            except RedisError:
+                pass
+        return dict(self.local_stats)
+
+    # --- Redis katmanı ---
+
+    def _redis_get(self, key):
+        if self.redis is None:
+            return None
+        try:
+            data = self.redis.get(self._redis_key(key))
+            if data is None:
+                return None
+            pipe = self.redis.pipeline()
+            pipe.expire(self._redis_key(key), self.ttl_seconds)
+            pipe.zadd(self._lru_key(), {key: time.time()})
+            pipe.execute()
+            return json.loads(data)
+        except (RedisError, ValueError) as e:
+            print(f"UYARI: Hakem önbelleği (Redis) okunamadı: {e}")
+            return None
+
+    def _redis_set(self, key, verdict):
+        if self.redis is None:
+            return
+        try:
+            pipe = self.redis.pipeline()
+            pipe.set(self._redis_key(key), json.dumps(verdict, ensure_ascii=False), ex=self.ttl_seconds)
+            pipe.zadd(self._lru_key(), {key: time.time()})
+            pipe.zcard(self._lru_key())
+            size = pipe.execute()[-1]
+            if size > self.max_entries:
+                evicted = self.redis.zpopmin(self._lru_key(), size - self.max_entries)
+                if evicted:
+                    self.redis.delete(*[self._redis_key(k.decode()) for k, _ in evicted])
+        except RedisError as e:
+            print(f"UYARI: Hakem önbelleğine (Redis) yazılamadı: {e}")
+
+    # --- Veritabanı katmanı ---
+
+    def _db_get(self, key):
+        if self.db is None:
+            return None
+        Record = self.record_model
+        try:
+            with Session(self.db.engine) as session:
+                record = session.get(Record, key)
+                if record is None:
+                    return None
+                now = datetime.datetime.now(datetime.timezone.utc)
+                created_at = record.created_at
+                if created_at.tzinfo is None:
+                    created_at = created_at.replace(tzinfo=datetime.timezone.utc)
+                if (now - created_at).total_seconds() > self.ttl_seconds:
+                    return None
+                record.last_used_at = now
+                record.hit_count = (record.hit_count or 0) + 1
+                verdict = {"score": record.score, "reason": record.reason, "raw": record.raw}
+                session.commit()
+                return verdict
+        except SQLAlchemyError as e:
+            print(f"UYARI: Hakem önbelleği (DB) okunamadı: {e}")
+            return None
+
+    def _db_set(self, key, category, model_name, verdict):
+        if self.db is None:
+            return
+        Record = self.record_model
+        try:
+            with Session(self.db.engine) as session:
+                session.add(Record(
+                    key=key, prompt_version=self.prompt_version, model_name=model_name, category=category,
+                    score=verdict['score'], reason=verdict['reason'], raw=verdict['raw']
+                ))
+                try:
+                    session.commit()
+                except IntegrityError:
+                    # Aynı karar başka bir worker tarafından zaten yazılmış
+                    session.rollback()
+            if random.random() < self.prune_probability:
+                self.prune()
+        except SQLAlchemyError as e:
+            print(f"UYARI: Hakem önbelleğine (DB) yazılamadı: {e}")
+
+    def prune(self):
+        """Veritabanı katmanından eski sürüm, süresi dolmuş ve LRU sınırını aşan kayıtları siler."""
+        Record = self.record_model
+        cutoff = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=self.ttl_seconds)
+        with Session(self.db.engine) as session:
+            session.execute(delete(Record).where(
+                (Record.prompt_version != self.prompt_version) | (Record.created_at < cutoff)
+            ))
+            overflow_keys = session.scalars(
+                select(Record.key).order_by(Record.last_used_at.desc()).offset(self.max_entries)
+            ).all()
+            if overflow_keys:
+                session.execute(delete(Record).where(Record.key.in_(overflow_keys)))
+            session.commit()
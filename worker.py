@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+Eşzamanlı puanlama worker'ı.
+
+Standart 'rq worker' her süreçte aynı anda yalnızca bir iş çalıştırır ve
+puanlama işleri zamanlarının neredeyse tamamını hakem LLM'i beklerken geçirir.
+Bu betik tek bir süreç içinde WORKER_CONCURRENCY adet RQ worker'ını ayrı iş
+parçacıklarında çalıştırır; böylece bir worker dyno'sunda aynı anda birden
+fazla yanıt puanlanır. Sinyaller (SIGTERM/SIGINT) ana iş parçacığında
+yakalanır: çalışan işler bitirilir, boşta bekleyen worker'lar kapatılır.
+
+Worker'lar puanlama şeritlerini (bkz. scoring_queues.py) SCORING_LANE_WEIGHTS
+ağırlıklarıyla dinler: her işten sonra kuyruk sırası ağırlıklı rastgele
+yeniden dizilir; böylece etkileşimli puanlamalar toplu işlerin arkasında
+beklemez, toplu işler de tamamen durmaz.
+
+Her iş kendi uygulama bağlamında çalışır (bkz. tasks.py, rescore.py,
+outbox.py); bağlam kapanınca oturum kapatılır ve bağlantı havuza döner.
+Bağlantıların işler arasında yeniden kullanılmasını süreç genelindeki
+havuzlar sağlar (bkz. app.py, DB_POOL_* / REDIS_*).
+
+OUTBOX_DISPATCHER açıksa worker ayrıca puanlama giden kutusunu (bkz.
+outbox.py) kuyruğa aktaran dağıtıcı iş parçacığını çalıştırır.
+
+Prometheus metrikleri METRICS_PORT (varsayılan 9200) portundan yayınlanır.
+
+Kullanım: python worker.py [kuyruk_adı ...]   (varsayılan: tüm şeritler ve eski 'default' kuyruğu)
+"""
+
+import signal
+import sys
+import threading
+import time
+
+from prometheus_client import start_http_server
+from rq import Queue, SimpleWorker
+from rq.timeouts import TimerDeathPenalty
+from sqlalchemy import text
+
+from app import app, conn, db
+from outbox import OutboxDispatcher
+from scoring_queues import LANE_QUEUES, LEGACY_QUEUE, queue_weights, weighted_order
+
+
+class ThreadWorker(SimpleWorker):
+    """
+    Bir iş parçacığı içinde çalışabilen RQ worker'ı. İş zaman aşımı SIGALRM
+    yerine zamanlayıcı ile uygulanır ve sinyal işleyicileri kurulmaz.
+    """
+
+    death_penalty_class = TimerDeathPenalty
+
+    def __init__(self, *args, queue_weights=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.busy = False
+        self.queue_weights = queue_weights
+        self.reorder_queues(None)
+
+    def reorder_queues(self, reference_queue):
+        """Ağırlık verilmişse kuyrukları ağırlıklı rastgele sıraya dizer (bkz. scoring_queues.py)."""
+        if self.queue_weights:
+            self._ordered_queues = weighted_order(self.queues, {q: self.queue_weights.get(q.name, 1.0)
+                                                                for q in self.queues})
+        elif reference_queue is not None:
+            super().reorder_queues(reference_queue)
+
+    def _install_signal_handlers(self):
+        # Sinyaller yalnızca ana iş parçacığında kurulabilir; bkz. run_worker_pool
+        pass
+
+    def request_stop(self, signum=None, frame=None):
+        """Mevcut işi bitirdikten sonra döngüden çıkılmasını ister (ılık kapanış)."""
+        self._stop_requested = True
+
+    def execute_job(self, job, queue):
+        self.busy = True
+        try:
+            super().execute_job(job, queue)
+        finally:
+            self.busy = False
+
+
+def run_worker_pool(queue_names, concurrency, shutdown_timeout=60, weights=None):
+    """
+    'concurrency' adet ThreadWorker başlatır ve hepsi durana kadar bekler.
+    'weights' (kuyruk adı -> ağırlık) verilirse kuyruklar ağırlıklı adillikle boşaltılır.
+    Kapanış isteğinde çalışan işler için en fazla 'shutdown_timeout' saniye beklenir.
+    """
+    queues = [Queue(name, connection=conn) for name in queue_names]
+    # Veritabanına erişilebildiğini baştan doğrula (ilk bağlantı havuzda kalır)
+    with app.app_context():
+        db.session.execute(text("SELECT 1"))
+        db.session.remove()
+    workers = [ThreadWorker(queues, connection=conn, queue_weights=weights) for _ in range(concurrency)]
+    # Ertelenen puanlama işleri (bkz. tasks.defer_scoring) için zamanlayıcıyı ilk worker çalıştırır
+    threads = [
+        threading.Thread(target=w.work, kwargs={'with_scheduler': i == 0}, name=w.name, daemon=True)
+        for i, w in enumerate(workers)
+    ]
+    stopping = threading.Event()
+    dispatcher = OutboxDispatcher() if app.config['OUTBOX_DISPATCHER'] else None
+
+    def handle_signal(signum, frame):
+        if stopping.is_set():
+            # İkinci sinyal: beklemeden çık
+            sys.exit(1)
+        print(f"Kapanış isteği alındı, {sum(w.busy for w in workers)} çalışan iş bitiriliyor...")
+        stopping.set()
+        if dispatcher is not None:
+            dispatcher.stop()
+        for w in workers:
+            w.request_stop()
+
+    signal.signal(signal.SIGTERM, handle_signal)
+    signal.signal(signal.SIGINT, handle_signal)
+
+    for t in threads:
+        t.start()
+    if dispatcher is not None:
+        dispatcher.start()
+    print(f"{concurrency} eşzamanlı worker başlatıldı ({', '.join(queue_names)}).")
+
+    while any(t.is_alive() for t in threads):
+        if stopping.is_set():
+            # Boşta bekleyen worker'lar kuyruktan iş çekmeye devam etmez; yalnızca
+            # iş yürüten worker'ların bitmesi beklenir.
+            deadline = time.monotonic() + shutdown_timeout
+            while any(w.busy for w in workers) and time.monotonic() < deadline:
+                time.sleep(0.5)
+            break
+        time.sleep(1)
+
+
+if __name__ == '__main__':
+    if conn is None:
+        sys.exit("HATA: REDIS_URL tanımlı değil, worker başlatılamadı.")
+    # Hakem çağrısı ve puanlama işi metrikleri (bkz. metrics.py)
+    start_http_server(app.config['METRICS_PORT'])
+    queue_names = sys.argv[1:] or [*LANE_QUEUES.values(), LEGACY_QUEUE]
+    run_worker_pool(queue_names, app.config['WORKER_CONCURRENCY'],
+                    weights=queue_weights(app.config['SCORING_LANE_WEIGHTS']))